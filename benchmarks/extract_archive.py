@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# compares box extraction with the python tarfile backend and the parallel decompressors on PATH
+# e.g. python benchmarks/extract_archive.py --size-mb 512 --repeat 3
+# --command gzip=gzip times the subprocess path with a decompressor other than the one found on PATH
+
+from __future__ import print_function, unicode_literals
+import os
+import sys
+import argparse
+import subprocess
+import tarfile
+from multiprocessing import cpu_count
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import packermate.archive
+from packermate.archive import extract_archive, get_decompress_command, PYTHON_TAR_MODE_LOOKUP
+
+
+BLOCK_BYTES = 1024 * 1024
+# disk images mix incompressible data with runs of zeros and text
+RANDOM_FRACTION = 0.5
+COMPRESS_COMMAND_LOOKUP = {
+    'gzip': ['gzip', '-1'],
+    'bzip2': ['bzip2', '-1'],
+    'xz': ['xz', '-0', '-T0'],
+    'zstd': ['zstd', '-1', '-T0', '-q'],
+}
+
+
+def write_disk_image(file_name, size_mb):
+    random_blocks = int(size_mb * RANDOM_FRACTION)
+    text_block = (b'packermate benchmark line\n' * (BLOCK_BYTES // 26 + 1))[:BLOCK_BYTES]
+    with open(file_name, 'wb') as file_object:
+        for index in range(size_mb):
+            if index < random_blocks:
+                file_object.write(os.urandom(BLOCK_BYTES))
+
+            elif index % 2:
+                file_object.write(b'\0' * BLOCK_BYTES)
+
+            else:
+                file_object.write(text_block)
+
+
+def write_box(temp_dir, archive_type, image_file_name):
+    tar_file_name = os.path.join(temp_dir, 'box.tar')
+    if not os.path.exists(tar_file_name):
+        with tarfile.open(tar_file_name, 'w') as tar_file:
+            tar_file.add(image_file_name, arcname = 'box-disk001.vmdk')
+
+    if archive_type == 'tar':
+        return tar_file_name
+
+    box_file_name = os.path.join(temp_dir, 'box.{}'.format(archive_type))
+    with open(tar_file_name, 'rb') as input_object, open(box_file_name, 'wb') as output_object:
+        subprocess.check_call(COMPRESS_COMMAND_LOOKUP[archive_type] + ['-c'], stdin = input_object, stdout = output_object)
+
+    return box_file_name
+
+
+def time_extract(box_file_name, temp_dir, parallel, repeat):
+    duration_list = []
+    for index in range(repeat):
+        output_dir = mkdtemp(dir = temp_dir)
+        time_start = time()
+        extract_archive(box_file_name, output_dir, parallel = parallel)
+        duration_list.append(time() - time_start)
+        rmtree(output_dir)
+
+    return min(duration_list)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description = 'packermate archive extraction benchmark')
+    parser.add_argument('--size-mb', type = int, default = 256, help = 'uncompressed box size')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'runs per backend, the fastest is reported')
+    parser.add_argument('--dir', help = 'directory for the test boxes')
+    parser.add_argument('--command', action = 'append', default = [], help = 'decompressor to use for a format e.g. gzip=pigz')
+
+    return parser.parse_args()
+
+
+def run():
+    args = parse_arguments()
+    for command_text in args.command:
+        archive_type, command = command_text.split('=', 1)
+        packermate.archive._decompress_command_cache[archive_type] = command
+
+    temp_dir = mkdtemp(dir = args.dir)
+    try:
+        image_file_name = os.path.join(temp_dir, 'box-disk001.vmdk')
+        write_disk_image(image_file_name, args.size_mb)
+
+        print('box size: {} MB uncompressed, cpus: {}'.format(args.size_mb, cpu_count()))
+        print('{:<8}{:>12}{:>12}{:>12}  {}'.format('format', 'box MB', 'python s', 'parallel s', 'command'))
+        for archive_type in ('tar', 'gzip', 'bzip2', 'xz', 'zstd'):
+            command = get_decompress_command(archive_type)
+            if archive_type not in PYTHON_TAR_MODE_LOOKUP and not command:
+                continue
+
+            box_file_name = write_box(temp_dir, archive_type, image_file_name)
+            box_mb = os.path.getsize(box_file_name) / float(BLOCK_BYTES)
+
+            python_seconds = time_extract(box_file_name, temp_dir, False, args.repeat) if archive_type in PYTHON_TAR_MODE_LOOKUP else None
+            parallel_seconds = time_extract(box_file_name, temp_dir, True, args.repeat) if command else None
+
+            print('{:<8}{:>12.1f}{:>12}{:>12}  {}'.format(
+                archive_type,
+                box_mb,
+                '{:.2f}'.format(python_seconds) if python_seconds is not None else '-',
+                '{:.2f}'.format(parallel_seconds) if parallel_seconds is not None else '-',
+                command or '-',
+            ))
+
+            if box_file_name.endswith('.tar'):
+                continue
+
+            os.remove(box_file_name)
+
+    finally:
+        rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    run()
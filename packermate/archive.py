@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+import os
+import shlex
+import signal
+import subprocess
+import tarfile
+from contextlib import contextmanager
+from distutils.spawn import find_executable
+from .process import run_command, ProcessException
+from .exception import PackermateException
+import logging
+
+
+ARCHIVE_MAGIC_LIST = (
+    ('gzip', b'\x1f\x8b'),
+    ('bzip2', b'BZh'),
+    ('xz', b'\xfd7zXZ\x00'),
+    ('zstd', b'\x28\xb5\x2f\xfd'),
+)
+ARCHIVE_TAR_MAGIC = b'ustar'
+ARCHIVE_TAR_MAGIC_OFFSET = 257
+ARCHIVE_HEADER_BYTES = 512
+# commands are passed to tar with --use-compress-program, which appends -d
+PARALLEL_DECOMPRESS_LOOKUP = {
+    'gzip': ('pigz',),
+    'bzip2': ('lbzip2', 'pbzip2'),
+    'xz': ('xz -T0',),
+    'zstd': ('zstd -T0',),
+}
+# more than the record padding that follows the end of archive marker
+ARCHIVE_STREAM_DRAIN_BYTES = 64 * 1024
+PYTHON_TAR_MODE_LOOKUP = {
+    'tar': 'r:',
+    'gzip': 'r:gz',
+    'bzip2': 'r:bz2',
+}
+PYTHON_TAR_STREAM_MODE_LOOKUP = {
+    'tar': 'r|',
+    'gzip': 'r|gz',
+    'bzip2': 'r|bz2',
+}
+
+
+log = logging.getLogger('packermate.archive')
+
+
+__all__ = [
+    'ArchiveException',
+    'UnarchiveException',
+    'get_archive_type',
+    'get_decompress_command',
+    'extract_archive',
+    'open_tar_stream',
+]
+
+
+class ArchiveException(PackermateException):
+    pass
+
+
+class UnarchiveException(ArchiveException):
+    pass
+
+
+def get_archive_type(file_name):
+    with open(file_name, 'rb') as file_object:
+        header = file_object.read(ARCHIVE_HEADER_BYTES)
+
+    for archive_type, magic in ARCHIVE_MAGIC_LIST:
+        if header.startswith(magic):
+            return archive_type
+
+    tar_magic_end = ARCHIVE_TAR_MAGIC_OFFSET + len(ARCHIVE_TAR_MAGIC)
+    if header[ARCHIVE_TAR_MAGIC_OFFSET:tar_magic_end] == ARCHIVE_TAR_MAGIC:
+        return 'tar'
+
+    return None
+
+
+_decompress_command_cache = {}
+
+
+def get_decompress_command(archive_type):
+    if archive_type not in _decompress_command_cache:
+        command_found = None
+        for command in PARALLEL_DECOMPRESS_LOOKUP.get(archive_type, ()):
+            if find_executable(shlex.split(command)[0]):
+                command_found = command
+                break
+
+        _decompress_command_cache[archive_type] = command_found
+
+    return _decompress_command_cache[archive_type]
+
+
+def extract_archive(file_name, output_dir, parallel = True):
+    try:
+        archive_type = get_archive_type(file_name)
+
+    except IOError as e:
+        raise UnarchiveException("Failed to read archive: file='{}' error='{}'".format(file_name, e))
+
+    if archive_type is None:
+        raise UnarchiveException("Unknown archive format: file='{}'".format(file_name))
+
+    command = get_decompress_command(archive_type) if parallel else None
+    if command:
+        log.debug("Extracting {} archive with '{}': {}".format(archive_type, command, file_name))
+        _extract_archive_command(file_name, output_dir, command)
+
+    elif archive_type in PYTHON_TAR_MODE_LOOKUP:
+        log.debug('Extracting {} archive: {}'.format(archive_type, file_name))
+        _extract_archive_python(file_name, output_dir, PYTHON_TAR_MODE_LOOKUP[archive_type])
+
+    else:
+        raise UnarchiveException("No decompressor available: file='{}' format='{}'".format(file_name, archive_type))
+
+
+def _extract_archive_command(file_name, output_dir, command):
+    try:
+        run_command(
+            "tar -x -f '{}' -C '{}' --use-compress-program '{}'".format(file_name, output_dir, command),
+            quiet = True
+        )
+
+    except ProcessException as e:
+        raise UnarchiveException("Failed to unarchive file: file='{}' error='{}'".format(file_name, e))
+
+
+def _extract_archive_python(file_name, output_dir, tar_mode):
+    try:
+        with tarfile.open(name = file_name, mode = tar_mode) as tar_file:
+            tar_file.extractall(output_dir)
+
+    except (IOError, tarfile.TarError) as e:
+        raise UnarchiveException("Failed to unarchive file: file='{}' error='{}'".format(file_name, e))
+
+
+def _restore_sigpipe():
+    # python ignores SIGPIPE, so without this a decompressor that is not read to the end exits with an error
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+
+@contextmanager
+def open_tar_stream(file_name, parallel = True):
+    archive_type = get_archive_type(file_name)
+    if archive_type is None:
+        raise UnarchiveException("Unknown archive format: file='{}'".format(file_name))
+
+    command = get_decompress_command(archive_type) if parallel else None
+    if command:
+        command_list = shlex.split(command) + ['-d', '-c', file_name]
+        with open(os.devnull, 'wb') as devnull:
+            process = subprocess.Popen(command_list, stdout = subprocess.PIPE, stderr = devnull, preexec_fn = _restore_sigpipe)
+
+            try:
+                with tarfile.open(fileobj = process.stdout, mode = 'r|') as tar_file:
+                    yield tar_file
+
+                # the decompressor checks the trailer only once the padding after the last member is read
+                process.stdout.read(ARCHIVE_STREAM_DRAIN_BYTES)
+
+            finally:
+                process.stdout.close()
+                process.wait()
+
+        # stopping before the end of the archive closes the pipe, which is not a failure
+        if process.returncode not in (0, -signal.SIGPIPE):
+            raise UnarchiveException("Failed to decompress archive: file='{}' command='{}' exit_code={}".format(
+                file_name,
+                command,
+                process.returncode,
+            ))
+
+    elif archive_type in PYTHON_TAR_STREAM_MODE_LOOKUP:
+        with tarfile.open(name = file_name, mode = PYTHON_TAR_STREAM_MODE_LOOKUP[archive_type]) as tar_file:
+            yield tar_file
+
+    else:
+        raise UnarchiveException("No decompressor available: file='{}' format='{}'".format(file_name, archive_type))
@@ -2,12 +2,17 @@
 
 from __future__ import print_function, unicode_literals
 from .target import TargetBase, TargetException, TargetParameter, parse_parameters
-from .file_utils import unarchive_file
+from .file_utils import JsonFileCache
+import os
 import re
+import threading
 import logging
 from copy import deepcopy
 
 
+AMI_ID_CACHE_FILE_NAME = 'aws_ami.json'
+
+
 log = logging.getLogger('packermate.aws')
 
 
@@ -18,6 +23,17 @@ class TargetAWSException(TargetException):
     pass
 
 
+class AmiIdCache(JsonFileCache):
+
+    CACHE_FILE_NAME = AMI_ID_CACHE_FILE_NAME
+    _lookup = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_key(name, version, region):
+        return '{}|{}|{}'.format(name, version, region or '')
+
+
 class TargetAWS(TargetBase):
 
     def __init__(self, *args, **kwargs):
@@ -35,7 +51,38 @@ class TargetAWS(TargetBase):
         self._build_from_ami_id()
 
     def _build_from_vagrant_box(self):
-        self._config.aws_vagrant_box_file = self._box_inventory.export_from_config(self._config, 'aws', self._temp_dir)
+        if 'vagrant_box_name' not in self._config:
+            return
+
+        region = self._config.aws_region or os.environ.get('AWS_DEFAULT_REGION')
+        box_version = self._box_inventory.get_version_from_config(self._config, 'aws')
+        ami_id_cache = AmiIdCache.from_config(self._config)
+        ami_id_key = AmiIdCache.get_key(self._config.vagrant_box_name, box_version, region)
+
+        ami_id = ami_id_cache.get(ami_id_key) if box_version else None
+        if ami_id:
+            log.info('Using cached AWS AMI id for installed Vagrant box')
+
+        else:
+            box_path = self._get_installed_box_path('aws')
+            vagrantfile_file_name = os.path.join(box_path, 'Vagrantfile') if box_path else None
+            if vagrantfile_file_name and os.path.exists(vagrantfile_file_name):
+                log.info('Reading AWS Vagrantfile from installed Vagrant box directory')
+
+            else:
+                log.info('Extracting AWS Vagrantfile from installed Vagrant box')
+
+                file_name_lookup = self._unarchive_vagrant_box('aws')
+                vagrantfile_file_name = file_name_lookup['Vagrantfile']
+
+            ami_id = self._parse_vagrantfile_for_ami_id(vagrantfile_file_name, region)
+            if box_version:
+                ami_id_cache.put(ami_id_key, ami_id)
+
+        self._config.aws_ami_id = ami_id
+
+        # the installed box takes precedence over a box file
+        del self._config.aws_vagrant_box_file
 
     def _build_from_vagrant_box_file(self):
         if 'aws_vagrant_box_file' not in self._config:
@@ -43,23 +90,29 @@ class TargetAWS(TargetBase):
 
         log.info('Extracting AWS Vagrantfile from Vagrant box')
 
-        file_name_lookup = unarchive_file(
-            self._config.aws_vagrant_box_file,
-            self._temp_dir,
-        )
+        file_name_lookup = self._unarchive_box_file(self._config.aws_vagrant_box_file)
 
         vagrantfile_file_name = file_name_lookup['Vagrantfile']
-        self._config.aws_ami_id = self._parse_vagrantfile_for_ami_id(vagrantfile_file_name)
+        region = self._config.aws_region or os.environ.get('AWS_DEFAULT_REGION')
+        self._config.aws_ami_id = self._parse_vagrantfile_for_ami_id(vagrantfile_file_name, region)
 
     @staticmethod
-    def _parse_vagrantfile_for_ami_id(file_name):
+    def _parse_vagrantfile_for_ami_id(file_name, region = None):
+        ami_id = None
         with open(file_name, 'r') as file_object:
             for line in file_object:
                 match = re.search('ami:\s*\"([^\"]+)\"', line)
                 if match:
-                    return match.group(1)
+                    if region and re.search('region_config\s*\(?\s*[\"\']{}[\"\']'.format(re.escape(region)), line):
+                        return match.group(1)
+
+                    if ami_id is None:
+                        ami_id = match.group(1)
+
+        if ami_id is None:
+            raise TargetAWSException('Unable to extract AWS AMI id from Vagrant box file')
 
-        raise TargetAWSException('Unable to extract AWS AMI id from Vagrant box file')
+        return ami_id
 
     def _build_from_ami_id(self):
         if 'aws_ami_id' not in self._config:
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+from urlparse import urlparse
+from multiprocessing.pool import ThreadPool
+from Queue import Queue
+from time import time
+import os
+from .command import Builder
+from .vagrant import get_vagrant_output_file_names, PublishException
+from .s3 import S3Publisher, S3PublishException
+from .exception import PackermateException
+import logging
+
+
+BATCH_WORKERS_DEFAULT = 2
+BATCH_DUMP_PACKER_FILE_NAME = '{}.packer.json'
+BATCH_STATUS_PENDING = 'pending'
+BATCH_STATUS_RUNNING = 'running'
+BATCH_STATUS_COMPLETE = 'complete'
+BATCH_STATUS_FAILED = 'failed'
+BATCH_STATUS_SKIPPED = 'skipped'
+
+
+log = logging.getLogger('packermate.batch')
+
+
+__all__ = ['BatchBuilder', 'BatchException', 'BatchNode']
+
+
+class BatchException(PackermateException):
+    pass
+
+
+def normalise_url(url):
+    if not url:
+        return None
+
+    if url.startswith('file://'):
+        url = url[len('file://'):]
+
+    elif urlparse(url).scheme:
+        return url
+
+    return os.path.abspath(os.path.expanduser(url))
+
+
+def get_published_names(config, target_list):
+    if not (config.vagrant_output and config.vm_name):
+        return None, set()
+
+    metadata_name = '{}.json'.format(config.vm_name)
+    url_list = []
+    try:
+        box_metadata_file_name, target_file_lookup = get_vagrant_output_file_names(config, target_list, check_file = False)
+        url_list.append(box_metadata_file_name)
+
+    except PublishException:
+        pass
+
+    if config.vagrant_publish_url_prefix:
+        url_list.append(config.vagrant_publish_url_prefix + metadata_name)
+
+    if config.vagrant_publish_path:
+        url_list.append(os.path.join(config.vagrant_publish_path, metadata_name))
+
+    if config.vagrant_publish_s3_url:
+        try:
+            url_list.append(S3Publisher.from_config(config).get_url(metadata_name))
+
+        except S3PublishException as e:
+            log.debug('Unable to determine S3 Vagrant box metadata URL: {}'.format(e))
+
+    return config.vm_name, set([normalise_url(url) for url in url_list])
+
+
+class BatchNode(object):
+
+    def __init__(self, config, name):
+        self.config = config
+        self.name = name
+        self.dump_packer_file_name = None
+        self.parent_list = []
+        self.status = BATCH_STATUS_PENDING
+        self.error = None
+        self.start_time = None
+        self.end_time = None
+
+    @property
+    def duration(self):
+        if self.start_time is None or self.end_time is None:
+            return None
+
+        return self.end_time - self.start_time
+
+    def __repr__(self):
+        return 'BatchNode({})'.format(self.name)
+
+
+class BatchBuilder(object):
+
+    def __init__(self, config_list, target_list, dry_run = False, dump_packer = False, workers = BATCH_WORKERS_DEFAULT):
+        self._target_list = target_list
+        self._dry_run = dry_run
+        self._dump_packer = dump_packer
+        self._workers = max(1, workers or BATCH_WORKERS_DEFAULT)
+        self._node_list = self._get_nodes(config_list)
+
+    @property
+    def node_list(self):
+        return self._node_list
+
+    def _get_nodes(self, config_list):
+        node_list = []
+        for index, config in enumerate(config_list):
+            node_list.append(BatchNode(config, config.config_file_name or config.vm_name or '<config {}>'.format(index)))
+
+        self._set_dump_packer_file_names(node_list)
+
+        published_list = [get_published_names(node.config, self._target_list) for node in node_list]
+
+        for node in node_list:
+            for target_name in self._target_list:
+                target_config = node.config.provider(target_name)
+                box_name = target_config.vagrant_box_name
+                box_url = normalise_url(target_config.vagrant_box_url)
+                if not (box_name or box_url):
+                    continue
+
+                for parent_node, (published_name, published_url_set) in zip(node_list, published_list):
+                    if parent_node is node or parent_node in node.parent_list:
+                        continue
+
+                    if (box_name and box_name == published_name) or (box_url and box_url in published_url_set):
+                        node.parent_list.append(parent_node)
+
+        self._check_cycles(node_list)
+
+        return node_list
+
+    @staticmethod
+    def _set_dump_packer_file_names(node_list):
+        # configs build concurrently so each needs its own dump file
+        dump_name_set = set()
+        for index, node in enumerate(node_list):
+            config_file_name = node.config.config_file_name
+            dump_name = node.config.vm_name or (os.path.splitext(os.path.basename(config_file_name))[0] if config_file_name else None)
+            if not dump_name or dump_name in dump_name_set:
+                dump_name = '{}-{}'.format(dump_name or 'config', index)
+
+            dump_name_set.add(dump_name)
+            node.dump_packer_file_name = BATCH_DUMP_PACKER_FILE_NAME.format(dump_name)
+
+    @staticmethod
+    def _check_cycles(node_list):
+        visited_set = set()
+
+        def visit(node, path_list):
+            if node in path_list:
+                raise BatchException('Config dependency cycle: {}'.format(' -> '.join([path_node.name for path_node in path_list[path_list.index(node):] + [node]])))
+
+            if node in visited_set:
+                return
+
+            for parent_node in node.parent_list:
+                visit(parent_node, path_list + [node])
+
+            visited_set.add(node)
+
+        for node in node_list:
+            visit(node, [])
+
+    def build(self):
+        result_queue = Queue()
+        pending_list = list(self._node_list)
+        running_count = 0
+
+        pool = ThreadPool(self._workers)
+        try:
+            while pending_list or running_count:
+                for node in list(pending_list):
+                    parent_status_set = set([parent_node.status for parent_node in node.parent_list])
+                    if parent_status_set & set([BATCH_STATUS_FAILED, BATCH_STATUS_SKIPPED]):
+                        log.warning('Skipping config as a dependency failed: {}'.format(node.name))
+                        node.status = BATCH_STATUS_SKIPPED
+                        pending_list.remove(node)
+
+                    elif parent_status_set <= set([BATCH_STATUS_COMPLETE]):
+                        node.status = BATCH_STATUS_RUNNING
+                        pending_list.remove(node)
+                        running_count += 1
+
+                        pool.apply_async(self._build_node, (node, result_queue))
+
+                if not running_count:
+                    break
+
+                result_queue.get()
+                running_count -= 1
+
+        finally:
+            pool.close()
+            pool.join()
+
+        self._log_results()
+
+        failed_list = [node.name for node in self._node_list if node.status != BATCH_STATUS_COMPLETE]
+        if failed_list:
+            raise BatchException('Failed to build configs: {}'.format(', '.join(failed_list)))
+
+    def _build_node(self, node, result_queue):
+        log.info('Building config: {}'.format(node.name))
+        node.start_time = time()
+        try:
+            builder = Builder(
+                node.config,
+                self._target_list,
+                self._dry_run,
+                self._dump_packer,
+                dump_packer_file_name = node.dump_packer_file_name,
+            )
+            builder.build()
+
+            node.status = BATCH_STATUS_COMPLETE
+
+        except Exception as e:
+            # any error must reach the scheduler, which otherwise waits for the node forever
+            log.error('Failed to build config: {}: {}: {}'.format(node.name, e.__class__.__name__, e))
+
+            node.status = BATCH_STATUS_FAILED
+            node.error = e
+
+        finally:
+            node.end_time = time()
+            result_queue.put(node)
+
+    def _log_results(self):
+        for node in self._node_list:
+            duration = node.duration
+            log.info('Batch result: {} {} {}'.format(
+                node.name,
+                node.status,
+                '{:.1f}s'.format(duration) if duration is not None else '-',
+            ))
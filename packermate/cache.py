@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+import os
+import stat
+import json
+import uuid
+import hashlib
+import shutil
+from time import time
+from .file_utils import unarchive_file, write_json_file
+from .exception import PackermateException
+import logging
+
+
+EXTRACTION_CACHE_DIR_NAME = 'extract'
+EXTRACTION_CACHE_INFO_SUFFIX = '.json'
+BYTES_PER_GB = 1024 * 1024 * 1024
+
+
+log = logging.getLogger('packermate.cache')
+
+
+__all__ = ['ExtractionCache', 'ExtractionCacheException', 'get_quota_bytes']
+
+
+class ExtractionCacheException(PackermateException):
+    pass
+
+
+def get_quota_bytes(quota_gb):
+    if quota_gb is None or quota_gb == '':
+        return None
+
+    try:
+        return int(float(quota_gb) * BYTES_PER_GB)
+
+    except (TypeError, ValueError):
+        raise ExtractionCacheException("Invalid cache quota: '{}'".format(quota_gb))
+
+
+def get_tree_size(path):
+    size_total = 0
+    for dir_path, dir_name_list, file_name_list in os.walk(path):
+        for file_name in file_name_list:
+            size_total += os.lstat(os.path.join(dir_path, file_name)).st_size
+
+    return size_total
+
+
+def link_tree(source_path, output_path):
+    for dir_path, dir_name_list, file_name_list in os.walk(source_path):
+        output_dir_path = os.path.join(output_path, os.path.relpath(dir_path, source_path))
+        if not os.path.isdir(output_dir_path):
+            os.makedirs(output_dir_path)
+
+        for file_name in file_name_list:
+            source_file_name = os.path.join(dir_path, file_name)
+            output_file_name = os.path.join(output_dir_path, file_name)
+            try:
+                os.link(source_file_name, output_file_name)
+
+            except OSError:
+                shutil.copy2(source_file_name, output_file_name)
+
+
+def get_file_name_lookup(path):
+    return dict([(file_name, os.path.join(path, file_name)) for file_name in os.listdir(path)])
+
+
+class ExtractionCache(object):
+
+    def __init__(self, cache_dir, quota_bytes = None):
+        self._cache_dir = os.path.join(os.path.abspath(os.path.expanduser(cache_dir)), EXTRACTION_CACHE_DIR_NAME)
+        self._quota_bytes = quota_bytes
+
+    @classmethod
+    def from_config(cls, config):
+        if not config.box_cache_dir:
+            return None
+
+        return cls(config.box_cache_dir, get_quota_bytes(config.box_cache_quota_gb))
+
+    @property
+    def path(self):
+        return self._cache_dir
+
+    @staticmethod
+    def get_file_key(file_name):
+        file_stat = os.stat(file_name)
+        key_text = 'file:{}:{}:{}'.format(os.path.abspath(file_name), file_stat.st_size, file_stat.st_mtime)
+
+        return hashlib.sha1(key_text.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def get_box_key(name, provider, version):
+        key_text = 'box:{}:{}:{}'.format(name, provider, version)
+
+        return hashlib.sha1(key_text.encode('utf-8')).hexdigest()
+
+    def _get_entry_path(self, key):
+        return os.path.join(self._cache_dir, key)
+
+    def _get_info_file_name(self, key):
+        return os.path.join(self._cache_dir, key + EXTRACTION_CACHE_INFO_SUFFIX)
+
+    def get(self, key, output_dir):
+        entry_path = self._get_entry_path(key)
+        info_file_name = self._get_info_file_name(key)
+        if not (os.path.isdir(entry_path) and os.path.exists(info_file_name)):
+            return None
+
+        # the info file modification time records when the entry was last used
+        try:
+            os.utime(info_file_name, None)
+
+        except OSError:
+            return None
+
+        log.info('Using cached Vagrant box extraction: {}'.format(key))
+
+        return self._link_entry(key, output_dir)
+
+    def unarchive(self, box_file_name, output_dir, key = None):
+        if key is None:
+            key = self.get_file_key(box_file_name)
+
+        file_name_lookup = self.get(key, output_dir)
+        if file_name_lookup is None:
+            self._add(key, box_file_name)
+            file_name_lookup = self._link_entry(key, output_dir)
+
+        if file_name_lookup is None:
+            log.warning('Cached Vagrant box extraction was evicted before use, extracting directly: {}'.format(key))
+            output_path = os.path.join(output_dir, key)
+            os.makedirs(output_path)
+            unarchive_file(box_file_name, output_path)
+            file_name_lookup = get_file_name_lookup(output_path)
+
+        # the entry in use is kept even when it alone exceeds the quota
+        self.evict(exclude_key_list = [key])
+
+        return file_name_lookup
+
+    def _add(self, key, box_file_name):
+        if not os.path.isdir(self._cache_dir):
+            os.makedirs(self._cache_dir)
+
+        entry_path = self._get_entry_path(key)
+        extract_path = '{}.tmp-{}'.format(entry_path, uuid.uuid4().hex)
+        os.mkdir(extract_path)
+
+        try:
+            log.info('Extracting Vagrant box into cache: {}'.format(key))
+            unarchive_file(box_file_name, extract_path)
+
+            # cached files are shared between builds so must not be modified
+            for dir_path, dir_name_list, file_name_list in os.walk(extract_path):
+                for file_name in file_name_list:
+                    os.chmod(os.path.join(dir_path, file_name), stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+            entry_size = get_tree_size(extract_path)
+
+            try:
+                os.rename(extract_path, entry_path)
+
+            except OSError:
+                # another build populated the entry first
+                if not os.path.isdir(entry_path):
+                    raise
+
+        finally:
+            if os.path.isdir(extract_path):
+                shutil.rmtree(extract_path)
+
+        write_json_file(
+            {
+                'source': os.path.abspath(box_file_name),
+                'size': entry_size,
+                'created': time(),
+            },
+            self._get_info_file_name(key)
+        )
+
+    def _link_entry(self, key, output_dir):
+        entry_path = self._get_entry_path(key)
+        output_path = os.path.join(output_dir, key)
+        try:
+            link_tree(entry_path, output_path)
+
+        except (IOError, OSError):
+            # another build evicted the entry while it was linked
+            if os.path.isdir(entry_path):
+                raise
+
+            if os.path.isdir(output_path):
+                shutil.rmtree(output_path)
+
+            return None
+
+        if not os.path.isdir(output_path):
+            return None
+
+        return get_file_name_lookup(output_path)
+
+    def list(self):
+        # (last used, size, key) for each entry, least recently used first
+        entry_list = []
+        if not os.path.isdir(self._cache_dir):
+            return entry_list
+
+        for file_name in os.listdir(self._cache_dir):
+            if not file_name.endswith(EXTRACTION_CACHE_INFO_SUFFIX):
+                continue
+
+            key = file_name[:-len(EXTRACTION_CACHE_INFO_SUFFIX)]
+            info_file_name = self._get_info_file_name(key)
+            try:
+                with open(info_file_name, 'r') as file_object:
+                    entry_size = json.load(file_object)['size']
+
+                last_used = os.stat(info_file_name).st_mtime
+
+            except (IOError, OSError, ValueError, KeyError):
+                continue
+
+            entry_list.append((last_used, entry_size, key))
+
+        return sorted(entry_list)
+
+    def remove(self, key):
+        # another build may be removing the same entry
+        info_file_name = self._get_info_file_name(key)
+        try:
+            os.remove(info_file_name)
+
+        except OSError:
+            if os.path.exists(info_file_name):
+                raise
+
+        entry_path = self._get_entry_path(key)
+        try:
+            shutil.rmtree(entry_path)
+
+        except OSError:
+            if os.path.isdir(entry_path):
+                raise
+
+    def evict(self, quota_bytes = None, exclude_key_list = None):
+        if quota_bytes is None:
+            quota_bytes = self._quota_bytes
+
+        if quota_bytes is None:
+            return []
+
+        entry_list = self.list()
+        size_total = sum([entry_size for last_used, entry_size, key in entry_list])
+
+        removed_list = []
+        for last_used, entry_size, key in entry_list:
+            if size_total <= quota_bytes:
+                break
+
+            if exclude_key_list and key in exclude_key_list:
+                continue
+
+            log.info('Evicting cached Vagrant box extraction: {}'.format(key))
+            self.remove(key)
+            size_total -= entry_size
+            removed_list.append(key)
+
+        return removed_list
+
+    def prune(self):
+        return self.evict(self._quota_bytes or 0)
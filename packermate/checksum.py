@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+import os
+import hashlib
+import uuid
+import shutil
+import threading
+from .file_utils import JsonFileCache
+from .process import run_command, ProcessException
+from .exception import PackermateException
+import logging
+
+
+DIGEST_TYPE_LIST = ('md5', 'sha1', 'sha256', 'sha512')
+DIGEST_READ_BYTES = 16 * 1024 * 1024
+DIGEST_CACHE_FILE_NAME = 'digests.json'
+
+
+log = logging.getLogger('packermate.checksum')
+
+
+__all__ = ['ChecksumException', 'DIGEST_TYPE_LIST', 'MultiDigest', 'DigestCache', 'get_file_digests', 'copy_file_with_digests']
+
+
+class ChecksumException(PackermateException):
+    pass
+
+
+class MultiDigest(object):
+
+    def __init__(self, digest_type_list = DIGEST_TYPE_LIST):
+        self._hash_lookup = {}
+        for digest_type in digest_type_list:
+            if digest_type not in DIGEST_TYPE_LIST:
+                raise ChecksumException("Unsupported checksum type: '{}'".format(digest_type))
+
+            self._hash_lookup[digest_type] = hashlib.new(digest_type)
+
+    def update(self, data):
+        for hash_object in self._hash_lookup.itervalues():
+            hash_object.update(data)
+
+    def hexdigests(self):
+        return dict([(digest_type, hash_object.hexdigest()) for digest_type, hash_object in self._hash_lookup.iteritems()])
+
+
+def get_file_key(file_name):
+    file_stat = os.stat(file_name)
+    mtime_ns = getattr(file_stat, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        mtime_ns = int(round(file_stat.st_mtime * 1000000000))
+
+    return [file_stat.st_size, mtime_ns, file_stat.st_dev, file_stat.st_ino]
+
+
+class DigestCache(JsonFileCache):
+
+    CACHE_FILE_NAME = DIGEST_CACHE_FILE_NAME
+    _lookup = {}
+    _lock = threading.Lock()
+
+    def get_digests(self, file_name, file_key):
+        entry = self.get(os.path.abspath(file_name))
+        if not isinstance(entry, dict) or entry.get('key') != file_key:
+            return {}
+
+        return dict(entry.get('digests') or {})
+
+    def put_digests(self, file_name, file_key, digest_lookup):
+        self.put(os.path.abspath(file_name), {'key': file_key, 'digests': digest_lookup})
+
+    def add_digests(self, file_name, digest_lookup):
+        try:
+            file_key = get_file_key(file_name)
+
+        except OSError:
+            return
+
+        digest_cached_lookup = self.get_digests(file_name, file_key)
+        digest_cached_lookup.update(digest_lookup)
+        self.put_digests(file_name, file_key, digest_cached_lookup)
+
+
+def get_file_digests(file_name, digest_type_list = DIGEST_TYPE_LIST, digest_cache = None):
+    try:
+        file_key = get_file_key(file_name)
+
+    except OSError as e:
+        raise ChecksumException("Failed to read file: file='{}' error='{}'".format(file_name, e))
+
+    digest_lookup = digest_cache.get_digests(file_name, file_key) if digest_cache else {}
+    digest_missing_list = [digest_type for digest_type in digest_type_list if digest_type not in digest_lookup]
+
+    if digest_missing_list:
+        multi_digest = MultiDigest(digest_missing_list)
+        try:
+            with open(file_name, 'rb') as file_object:
+                while True:
+                    data = file_object.read(DIGEST_READ_BYTES)
+                    if not data:
+                        break
+
+                    multi_digest.update(data)
+
+        except IOError as e:
+            raise ChecksumException("Failed to read file: file='{}' error='{}'".format(file_name, e))
+
+        digest_lookup.update(multi_digest.hexdigests())
+
+        if digest_cache:
+            digest_cache.put_digests(file_name, file_key, digest_lookup)
+
+    return dict([(digest_type, digest_lookup[digest_type]) for digest_type in digest_type_list])
+
+
+def _reflink_file(file_name, output_file_name):
+    try:
+        run_command("cp --reflink=always '{}' '{}'".format(file_name, output_file_name), quiet = True)
+
+    except (ProcessException, OSError):
+        return False
+
+    return True
+
+
+def copy_file_with_digests(file_name, output_file_name, digest_type_list = DIGEST_TYPE_LIST, reflink = True, digest_cache = None):
+    output_path = os.path.dirname(os.path.abspath(output_file_name))
+    temp_file_name = os.path.join(output_path, '.{}.tmp-{}'.format(os.path.basename(output_file_name), uuid.uuid4().hex))
+
+    try:
+        if reflink and _reflink_file(file_name, temp_file_name):
+            log.debug('Reflinked file: {} -> {}'.format(file_name, output_file_name))
+            digest_lookup = get_file_digests(file_name, digest_type_list, digest_cache)
+
+        else:
+            digest_lookup = _copy_file_data(file_name, temp_file_name, digest_type_list, digest_cache)
+
+        os.rename(temp_file_name, output_file_name)
+
+    except (IOError, OSError) as e:
+        raise ChecksumException("Failed to copy file: file='{}' output='{}' error='{}'".format(file_name, output_file_name, e))
+
+    finally:
+        if os.path.exists(temp_file_name):
+            os.remove(temp_file_name)
+
+    return digest_lookup
+
+
+def _copy_file_data(file_name, output_file_name, digest_type_list, digest_cache = None):
+    file_key = get_file_key(file_name)
+    digest_lookup = digest_cache.get_digests(file_name, file_key) if digest_cache else {}
+    digest_missing_list = [digest_type for digest_type in digest_type_list if digest_type not in digest_lookup]
+    multi_digest = MultiDigest(digest_missing_list)
+
+    with open(file_name, 'rb') as file_object:
+        with open(output_file_name, 'wb') as output_file_object:
+            while True:
+                data = file_object.read(DIGEST_READ_BYTES)
+                if not data:
+                    break
+
+                multi_digest.update(data)
+                output_file_object.write(data)
+
+            output_file_object.flush()
+            os.fsync(output_file_object.fileno())
+
+    shutil.copystat(file_name, output_file_name)
+
+    if digest_missing_list:
+        digest_lookup.update(multi_digest.hexdigests())
+
+        if digest_cache:
+            digest_cache.put_digests(file_name, file_key, digest_lookup)
+
+    return dict([(digest_type, digest_lookup[digest_type]) for digest_type in digest_type_list])
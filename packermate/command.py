@@ -2,16 +2,41 @@
 
 from __future__ import print_function, unicode_literals
 import os
+import shlex
+import hashlib
+import threading
+from distutils.spawn import find_executable
+from tempfile import mkdtemp
+from time import time
+from multiprocessing.pool import ThreadPool
 from .process import run_command, ProcessException
-from .file_utils import TempDir, DataDir, write_json_file
-from .vagrant import BoxMetadata, BoxInventory, parse_vagrant_export, publish_vagrant_box
+from .file_utils import TempDir, DataDir, JsonFileCache, write_json_file
+from .vagrant import (
+    BoxMetadata,
+    BoxInventory,
+    get_vagrant_boxes_dir,
+    get_vagrant_inventory_state_file,
+    get_http_cache_dir,
+    parse_vagrant_export,
+    publish_vagrant_box,
+    check_vagrant_publish,
+    get_int_parameter,
+    get_bool_parameter,
+)
 from .virtualbox import TargetVirtualBox
 from .aws import TargetAWS
 from .provisioner import parse_provisioners
+from .schema import validate_packer_config
+from .fingerprint import get_build_fingerprint, read_published_fingerprint, publish_fingerprint
+from .cache import ExtractionCache, get_quota_bytes
 from .exception import PackermateException
 import logging
 
 
+TARGET_WORKERS_DEFAULT = 4
+PACKER_VALIDATE_CACHE_FILE_NAME = 'packer_validate.json'
+
+
 log = logging.getLogger('packermate.command')
 
 
@@ -47,6 +72,14 @@ class PackerConfig(object):
     def add_post_processor(self, config):
         self._add_section('post-processors', config)
 
+    def merge(self, other):
+        for name, config_list in other._config.iteritems():
+            self._config[name].extend(config_list)
+
+    @property
+    def data(self):
+        return self._config
+
     def __eq__(self, other):
         return isinstance(other, PackerConfig) and self._config == other._config
 
@@ -55,6 +88,35 @@ class BuilderException(PackermateException):
     pass
 
 
+class PackerValidateCache(JsonFileCache):
+
+    CACHE_FILE_NAME = PACKER_VALIDATE_CACHE_FILE_NAME
+    _lookup = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_packer_identity(packer_command):
+        command_list = shlex.split(packer_command)
+        executable_file_name = find_executable(command_list[0]) if command_list else None
+        if not executable_file_name:
+            return None
+
+        file_stat = os.stat(executable_file_name)
+
+        return '{}:{}:{}'.format(os.path.realpath(executable_file_name), file_stat.st_size, int(file_stat.st_mtime))
+
+    @classmethod
+    def get_key(cls, packer_command, packer_config, temp_dir):
+        packer_identity = cls.get_packer_identity(packer_command)
+        if packer_identity is None:
+            return None
+
+        # the input digest covers the template and the files it references, which packer validate checks for
+        key_text = '{}|{}|{}'.format(packer_command, packer_identity, get_build_fingerprint(packer_config.data, temp_dir))
+
+        return hashlib.sha256(key_text.encode('utf-8')).hexdigest()
+
+
 class Builder(object):
 
     TARGET_LOOKUP = {
@@ -62,17 +124,21 @@ class Builder(object):
         'aws': TargetAWS,
     }
 
-    def __init__(self, config, target_list, dry_run = False, dump_packer = False):
+    def __init__(self, config, target_list, dry_run = False, dump_packer = False, dump_packer_file_name = PackerConfig.PACKER_CONFIG_FILE_NAME):
         self._config = config
         self._target_list = target_list
         self._dry_run = dry_run
         self._dump_packer = dump_packer
+        self._dump_packer_file_name = dump_packer_file_name
         self._vagrant_box_metadata = None
         self._data_dir = DataDir()
 
     def _load_vagrant_box_url(self):
         if self._config.vagrant_box_url and not self._vagrant_box_metadata:
-            self._vagrant_box_metadata = BoxMetadata(url = self._config.vagrant_box_url)
+            self._vagrant_box_metadata = BoxMetadata(
+                url = self._config.vagrant_box_url,
+                cache_dir = get_http_cache_dir(self._config),
+            )
 
     def get_vagrant_box_url_name(self):
         self._load_vagrant_box_url()
@@ -87,17 +153,12 @@ class Builder(object):
     def build(self):
         packer_config = PackerConfig()
 
-        with TempDir(self._config.temp_dir) as temp_dir_object:
+        background_cleanup = get_bool_parameter(self._config, 'temp_dir_background_cleanup', BuilderException)
+        with TempDir(self._config.temp_dir, background_cleanup = background_cleanup) as temp_dir_object:
             temp_dir = temp_dir_object.path
 
-            box_inventory = BoxInventory(vagrant_command = self._config.vagrant_command)
-            for target_name in self._target_list:
-                target_class = self.TARGET_LOOKUP.get(target_name)
-                if not target_class:
-                    raise BuilderException('Unknown target: {}'.format(target_name))
-
-                target = target_class(self._config, self._data_dir, packer_config, temp_dir, box_inventory)
-                target.build()
+            box_inventory = self._get_box_inventory()
+            self._build_targets(packer_config, temp_dir, box_inventory)
 
             if self._config.provisioners:
                 parse_provisioners(self._config.provisioners, self._config, packer_config)
@@ -107,7 +168,27 @@ class Builder(object):
             if self._dump_packer:
                 self._dump_packer_config(packer_config)
 
-            packer_config_file_name = self._validate_packer(packer_config, temp_dir)
+            fingerprint = None
+            if self._use_fingerprint():
+                fingerprint = self._get_fingerprint(packer_config, temp_dir, box_inventory)
+                if fingerprint == read_published_fingerprint(self._config, self._target_list, temp_dir):
+                    log.info('Build inputs unchanged since the last published build, skipping: {}'.format(fingerprint))
+
+                    return
+
+            # validation runs alongside the checks made before building
+            pool = ThreadPool(1)
+            try:
+                validate_result = pool.apply_async(self._validate_packer, (packer_config, temp_dir))
+
+                if not self._dry_run:
+                    check_vagrant_publish(self._config, self._target_list)
+
+                packer_config_file_name = validate_result.get()
+
+            finally:
+                pool.close()
+                pool.join()
 
             if not self._dry_run:
                 self._run_packer(packer_config_file_name)
@@ -120,17 +201,132 @@ class Builder(object):
                     box_inventory,
                 )
 
-    @staticmethod
-    def _dump_packer_config(packer_config):
-        packer_dump_file_name = packer_config.write()
+                if fingerprint:
+                    publish_fingerprint(self._config, self._target_list, fingerprint)
+
+                self._gc_boxes(box_inventory)
+
+    def _build_targets(self, packer_config, temp_dir, box_inventory):
+        target_class_list = []
+        for target_name in self._target_list:
+            target_class = self.TARGET_LOOKUP.get(target_name)
+            if not target_class:
+                raise BuilderException('Unknown target: {}'.format(target_name))
+
+            target_class_list.append((target_name, target_class))
+
+        def build_target(target_item):
+            target_name, target_class = target_item
+
+            # targets list the files they extract so need a directory each
+            target_temp_dir = mkdtemp(prefix = '{}-'.format(target_name), dir = temp_dir)
+            target_packer_config = PackerConfig()
+
+            target = target_class(self._config, self._data_dir, target_packer_config, target_temp_dir, box_inventory)
+            target.build()
+
+            return target_packer_config
+
+        workers = get_int_parameter(self._config, 'target_workers', BuilderException) or TARGET_WORKERS_DEFAULT
+        pool = ThreadPool(max(1, min(workers, len(target_class_list))))
+        try:
+            target_packer_config_list = pool.map(build_target, target_class_list)
+
+        finally:
+            pool.close()
+            pool.join()
+
+        for target_packer_config in target_packer_config_list:
+            packer_config.merge(target_packer_config)
+
+    def _use_fingerprint(self):
+        if not get_bool_parameter(self._config, 'build_fingerprint', BuilderException) or self._dry_run:
+            return False
+
+        # the fingerprint is published with the box so needs the same parameters
+        if not self._config.vagrant_output or self._config.vm_version is None:
+            log.warning('Build fingerprint requires vagrant_output and vm_version parameters')
+            return False
+
+        return True
+
+    def _get_fingerprint(self, packer_config, temp_dir, box_inventory):
+        # installed boxes are identified by version, as the builders only reference the extracted files
+        source_list = []
+        for target_name in self._target_list:
+            target_config = self._config.provider(target_name)
+            if target_config.vagrant_box_name:
+                box_version = box_inventory.get_version_from_config(target_config, target_name)
+                source_list.append([target_config.vagrant_box_name, target_name, unicode(box_version or '')])
+
+        return get_build_fingerprint(packer_config.data, temp_dir, source_list)
+
+    def _get_box_inventory(self):
+        return BoxInventory(
+            vagrant_command = self._config.vagrant_command,
+            boxes_dir = get_vagrant_boxes_dir(self._config),
+            state_file = get_vagrant_inventory_state_file(self._config),
+        )
+
+    def _gc_boxes(self, box_inventory):
+        quota_bytes = get_quota_bytes(self._config.vagrant_box_quota_gb)
+        if quota_bytes is None:
+            return False
+
+        # the boxes the config builds from, for any target
+        pinned_list = []
+        for target_name in self.TARGET_LOOKUP:
+            target_config = self._config.provider(target_name)
+            if target_config.vagrant_box_name:
+                pinned_list.append((target_config.vagrant_box_name, target_config.vagrant_box_version))
+
+        log.info('Evicting least recently used Vagrant boxes')
+        removed_list = box_inventory.gc(quota_bytes, pinned_list)
+
+        log.info('Vagrant box eviction complete: {} versions removed'.format(len(removed_list)))
+
+        return True
+
+    def gc(self):
+        if not self._gc_boxes(self._get_box_inventory()):
+            raise BuilderException('No Vagrant box quota set')
+
+    def prune(self):
+        box_cache = ExtractionCache.from_config(self._config)
+        if box_cache is None:
+            raise BuilderException('No box cache directory set')
+
+        log.info('Pruning Vagrant box extraction cache: {}'.format(box_cache.path))
+        removed_list = box_cache.prune()
+
+        log.info('Prune complete: {} entries removed'.format(len(removed_list)))
+
+    def _dump_packer_config(self, packer_config):
+        packer_dump_file_name = packer_config.write(file_name = self._dump_packer_file_name)
         log.info("Dumped Packer configuration to '{}'".format(packer_dump_file_name))
 
     def _validate_packer(self, packer_config, temp_dir_path):
+        if self._dry_run:
+            self._validate_packer_schema(packer_config)
+
+            packer_command = self._config.packer_command
+            if not (packer_command and PackerValidateCache.get_packer_identity(packer_command)):
+                log.info('Packer not found, Packer configuration validated against the built in schema only')
+
+                return packer_config.write(file_path = temp_dir_path)
+
         if not self._config.packer_command:
             raise BuilderException('No Packer command set')
 
         file_name = packer_config.write(file_path = temp_dir_path)
 
+        validate_cache = PackerValidateCache.from_config(self._config)
+        validate_key = validate_cache.get_key(self._config.packer_command, packer_config, temp_dir_path)
+        if validate_key and validate_cache.get(validate_key):
+            log.info('Packer configuration previously validated')
+
+            return file_name
+
         try:
             log.info('Validating Packer configuration')
             run_command('{} validate {}'.format(self._config.packer_command, file_name), quiet = True)
@@ -141,8 +337,18 @@ class Builder(object):
         except OSError as e:
             raise BuilderException('Failed to validate Packer configuration: {}'.format(e))
 
+        if validate_key:
+            validate_cache.put(validate_key, time())
+
         return file_name
 
+    @staticmethod
+    def _validate_packer_schema(packer_config):
+        log.info('Validating Packer configuration schema')
+        error_list = validate_packer_config(packer_config.data)
+        if error_list:
+            raise BuilderException('Invalid Packer configuration:-\n{}'.format('\n'.join(error_list)))
+
     def _run_packer(self, packer_config_file_name):
         if not self._config.packer_command:
             raise BuilderException('No Packer command set')
@@ -6,6 +6,7 @@ import re
 import os
 import uuid
 from .file_utils import read_yaml_file, read_yaml_string, get_path_names
+from .archive import open_tar_stream, UnarchiveException
 import base64
 import tarfile
 from collections import namedtuple
@@ -258,24 +259,22 @@ class ConfigValue(object):
         return self._get_file_data(file_name, encode = False)
 
     def _get_tar_file_data(self, tar_type, tar_name, file_name):
-        tar_type_lookup = {
-            'tgz': 'r:gz'
-        }
-        tar_mode = tar_type_lookup.get(tar_type)
-        if tar_mode is None:
+        # the archive format is detected from the file contents
+        tar_type_list = ('tgz',)
+        if tar_type not in tar_type_list:
             raise ConfigException("Unknown tar type: name='{}' type='{}'".format(tar_name, tar_type))
 
         data = None
         for tar_name_full in get_path_names(tar_name, self._path_list):
             try:
-                with tarfile.open(name = tar_name_full, mode = tar_mode) as tar_file:
+                with open_tar_stream(tar_name_full) as tar_file:
                     for tar_info in tar_file:
                         if fnmatch(tar_info.name, file_name):
                             file_object = tar_file.extractfile(tar_info)
                             file_data = file_object.read()
                             return base64.b64encode(file_data)
 
-            except IOError:
+            except (IOError, tarfile.TarError, UnarchiveException):
                 pass
 
         if data is None:
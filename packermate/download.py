@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+import os
+import hashlib
+import threading
+from multiprocessing.pool import ThreadPool
+from requests.exceptions import RequestException
+from .http_client import get_session, HTTP_TIMEOUT_SECONDS
+from .checksum import MultiDigest, ChecksumException
+from .file_utils import read_json_file, write_json_file, FileLock, FileLockException
+from .exception import PackermateException
+import logging
+
+
+DOWNLOAD_CACHE_DIR_NAME = 'download'
+DOWNLOAD_WORKERS_DEFAULT = 4
+DOWNLOAD_PART_BYTES_DEFAULT = 64 * 1024 * 1024
+DOWNLOAD_READ_BYTES = 1024 * 1024
+DOWNLOAD_PARTIAL_SUFFIX = '.part'
+DOWNLOAD_STATE_SUFFIX = '.part.json'
+DOWNLOAD_LOCK_SUFFIX = '.lock'
+
+
+log = logging.getLogger('packermate.download')
+
+
+__all__ = ['BoxDownloader', 'DownloadException']
+
+
+class DownloadException(PackermateException):
+    pass
+
+
+class BoxDownloader(object):
+
+    def __init__(self, cache_dir, workers = DOWNLOAD_WORKERS_DEFAULT, part_bytes = DOWNLOAD_PART_BYTES_DEFAULT):
+        self._cache_dir = os.path.join(os.path.abspath(os.path.expanduser(cache_dir)), DOWNLOAD_CACHE_DIR_NAME)
+        self._workers = max(1, workers)
+        self._part_bytes = max(1, part_bytes)
+        self._state_lock = threading.Lock()
+
+    @property
+    def path(self):
+        return self._cache_dir
+
+    def get_file_name(self, url, checksum = None, checksum_type = None):
+        # boxes with a checksum are addressed by it, so the same box is shared between URLs
+        if checksum and checksum_type:
+            file_key = '{}-{}'.format(checksum_type, checksum.lower())
+
+        else:
+            file_key = 'url-{}'.format(hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+        return os.path.join(self._cache_dir, '{}.box'.format(file_key))
+
+    def download(self, url, checksum = None, checksum_type = None):
+        file_name = self.get_file_name(url, checksum, checksum_type)
+        if os.path.exists(file_name):
+            log.info('Using cached Vagrant box download: {}'.format(file_name))
+            return file_name
+
+        try:
+            try:
+                os.makedirs(self._cache_dir)
+
+            except OSError:
+                # another download may have created it
+                if not os.path.isdir(self._cache_dir):
+                    raise
+
+            # builds sharing a box wait for the first download rather than writing the same partial file
+            with FileLock(file_name + DOWNLOAD_LOCK_SUFFIX):
+                if os.path.exists(file_name):
+                    log.info('Using cached Vagrant box download: {}'.format(file_name))
+                    return file_name
+
+                self._download(url, file_name, checksum, checksum_type)
+
+        except (FileLockException, OSError) as e:
+            raise DownloadException("Failed to download Vagrant box: url='{}' error='{}'".format(url, e))
+
+        return file_name
+
+    def _download(self, url, file_name, checksum, checksum_type):
+        multi_digest = None
+        if checksum and checksum_type:
+            try:
+                multi_digest = MultiDigest((checksum_type,))
+
+            except ChecksumException as e:
+                raise DownloadException('{}'.format(e))
+
+        partial_file_name = file_name + DOWNLOAD_PARTIAL_SUFFIX
+        content_length = self._get_range_length(url)
+        try:
+            if content_length is not None:
+                self._download_parts(url, partial_file_name, content_length, multi_digest)
+
+            else:
+                # the checksum verifies a resumed download, without one a changed box could be joined to the old one
+                self._download_stream(url, partial_file_name, multi_digest, resume = multi_digest is not None)
+
+        except (RequestException, IOError, OSError) as e:
+            raise DownloadException("Failed to download Vagrant box: url='{}' error='{}'".format(url, e))
+
+        if multi_digest:
+            download_checksum = multi_digest.hexdigests()[checksum_type]
+            if download_checksum != checksum.lower():
+                self._remove_partial(partial_file_name)
+
+                raise DownloadException("Vagrant box checksum mismatch: url='{}' expected={} received={}".format(
+                    url,
+                    checksum,
+                    download_checksum,
+                ))
+
+        try:
+            os.rename(partial_file_name, file_name)
+            self._remove_state(partial_file_name)
+
+        except OSError as e:
+            raise DownloadException("Failed to store Vagrant box download: file='{}' error='{}'".format(file_name, e))
+
+    @staticmethod
+    def _get_range_length(url):
+        try:
+            response = get_session().head(url, allow_redirects = True, timeout = HTTP_TIMEOUT_SECONDS)
+
+        except RequestException:
+            return None
+
+        if response.status_code != 200 or response.headers.get('Accept-Ranges') != 'bytes':
+            return None
+
+        try:
+            return int(response.headers['Content-Length'])
+
+        except (KeyError, ValueError):
+            return None
+
+    def _download_stream(self, url, file_name, multi_digest, resume = False):
+        # a partial file left by the range path is preallocated, so its size is not the size received
+        size_partial = 0
+        if resume and os.path.exists(file_name) and not os.path.exists(self._get_state_file_name(file_name)):
+            size_partial = os.path.getsize(file_name)
+
+        headers = {'Range': 'bytes={}-'.format(size_partial)} if size_partial else {}
+        response = get_session().get(url, headers = headers, stream = True, timeout = HTTP_TIMEOUT_SECONDS)
+        if response.status_code == 206 and size_partial and \
+                response.headers.get('Content-Range', '').startswith('bytes {}-'.format(size_partial)):
+            log.info('Resuming Vagrant box download: {} ({} bytes received)'.format(url, size_partial))
+
+            if multi_digest:
+                self._digest_range(file_name, 0, size_partial - 1, multi_digest)
+
+            file_mode = 'ab'
+
+        elif response.status_code == 200:
+            if size_partial:
+                log.info('Server ignored the range, restarting Vagrant box download: {}'.format(url))
+
+            else:
+                log.info('Downloading Vagrant box: {}'.format(url))
+
+            file_mode = 'wb'
+
+        else:
+            raise DownloadException("Failed to download Vagrant box: url='{}' status_code={}".format(url, response.status_code))
+
+        self._remove_state(file_name)
+
+        with open(file_name, file_mode) as file_object:
+            for data in response.iter_content(DOWNLOAD_READ_BYTES):
+                if multi_digest:
+                    multi_digest.update(data)
+
+                file_object.write(data)
+
+    def _download_parts(self, url, file_name, content_length, multi_digest):
+        part_list = [
+            (part_start, min(part_start + self._part_bytes, content_length) - 1)
+            for part_start in range(0, content_length, self._part_bytes)
+        ]
+
+        completed_set = self._read_state(file_name, url, content_length)
+        if not os.path.exists(file_name):
+            completed_set = set()
+
+        with open(file_name, 'ab') as file_object:
+            file_object.truncate(content_length)
+
+        part_missing_list = [part for part in part_list if part[0] not in completed_set]
+        if completed_set:
+            log.info('Resuming Vagrant box download: {} ({} of {} parts remaining)'.format(url, len(part_missing_list), len(part_list)))
+
+        else:
+            log.info('Downloading Vagrant box: {} ({} parts)'.format(url, len(part_list)))
+
+        # parts are hashed in order as they complete, while they are likely still in the page cache
+        digest_lock = threading.Lock()
+        digest_part_index = [0]
+
+        def digest_parts():
+            while multi_digest and digest_part_index[0] < len(part_list):
+                part = part_list[digest_part_index[0]]
+                with self._state_lock:
+                    if part[0] not in completed_set:
+                        return
+
+                self._digest_range(file_name, part[0], part[1], multi_digest)
+                digest_part_index[0] += 1
+
+        def download_part(part):
+            self._download_part(url, file_name, part)
+
+            with self._state_lock:
+                completed_set.add(part[0])
+                self._write_state(file_name, url, content_length, completed_set)
+
+            # one worker hashes at a time, the others carry on downloading
+            if digest_lock.acquire(False):
+                try:
+                    digest_parts()
+
+                finally:
+                    digest_lock.release()
+
+        if part_missing_list:
+            pool = ThreadPool(min(self._workers, len(part_missing_list)))
+            try:
+                pool.map(download_part, part_missing_list)
+
+            finally:
+                pool.close()
+                pool.join()
+
+        # parts completed while another worker was hashing, or by an earlier run
+        digest_parts()
+
+    @staticmethod
+    def _digest_range(file_name, range_start, range_end, multi_digest):
+        with open(file_name, 'rb') as file_object:
+            file_object.seek(range_start)
+            size_remaining = range_end - range_start + 1
+            while size_remaining > 0:
+                data = file_object.read(min(DOWNLOAD_READ_BYTES, size_remaining))
+                if not data:
+                    raise IOError('Unexpected end of file: {}'.format(file_name))
+
+                multi_digest.update(data)
+                size_remaining -= len(data)
+
+    @staticmethod
+    def _download_part(url, file_name, part):
+        part_start, part_end = part
+        headers = {'Range': 'bytes={}-{}'.format(part_start, part_end)}
+        response = get_session().get(url, headers = headers, stream = True, timeout = HTTP_TIMEOUT_SECONDS)
+        if response.status_code != 206:
+            raise DownloadException("Failed to download Vagrant box range: url='{}' range={}-{} status_code={}".format(
+                url,
+                part_start,
+                part_end,
+                response.status_code,
+            ))
+
+        with open(file_name, 'r+b') as file_object:
+            file_object.seek(part_start)
+            size_received = 0
+            for data in response.iter_content(DOWNLOAD_READ_BYTES):
+                file_object.write(data)
+                size_received += len(data)
+
+        if size_received != part_end - part_start + 1:
+            raise DownloadException("Incomplete Vagrant box range: url='{}' range={}-{}".format(url, part_start, part_end))
+
+    @staticmethod
+    def _get_state_file_name(file_name):
+        return file_name[:-len(DOWNLOAD_PARTIAL_SUFFIX)] + DOWNLOAD_STATE_SUFFIX
+
+    @classmethod
+    def _read_state(cls, file_name, url, content_length):
+        state = read_json_file(cls._get_state_file_name(file_name))
+        if not isinstance(state, dict) or state.get('url') != url or state.get('length') != content_length:
+            return set()
+
+        return set(state.get('completed', []))
+
+    @classmethod
+    def _write_state(cls, file_name, url, content_length, completed_set):
+        state = {
+            'url': url,
+            'length': content_length,
+            'completed': sorted(completed_set),
+        }
+        write_json_file(state, cls._get_state_file_name(file_name), atomic = True)
+
+    @classmethod
+    def _remove_state(cls, file_name):
+        state_file_name = cls._get_state_file_name(file_name)
+        if os.path.exists(state_file_name):
+            os.remove(state_file_name)
+
+    def _remove_partial(self, file_name):
+        if os.path.exists(file_name):
+            os.remove(file_name)
+
+        self._remove_state(file_name)
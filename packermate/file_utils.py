@@ -2,15 +2,20 @@
 
 from __future__ import print_function, unicode_literals
 import os
-from tempfile import mkdtemp
+from tempfile import mkdtemp, mkstemp, gettempdir
+import subprocess
 from shutil import rmtree
 import json
+import fcntl
+import threading
+from time import time
 from string import Template
 import yaml
 import yaml.scanner
 import hashlib
-from .process import run_command, ProcessException
+from .archive import extract_archive, UnarchiveException
 from .exception import PackermateException
+import logging
 
 
 # https://stackoverflow.com/questions/2890146/how-to-force-pyyaml-to-load-strings-as-unicode-objects
@@ -23,30 +28,167 @@ def construct_yaml_str(self, node):
 yaml.SafeLoader.add_constructor(u'tag:yaml.org,2002:str', construct_yaml_str)
 
 
+TEMP_DIR_PREFIX = 'packermate-'
+TEMP_DIR_TRASH_NAME = '.packermate-trash'
+# trash entries older than this were left by runs whose remover did not finish
+TEMP_DIR_TRASH_SWEEP_SECONDS = 60 * 60
+
+
+log = logging.getLogger('packermate.file_utils')
+
+
+def remove_dirs_background(path_list):
+    # the shell exits as soon as rm starts, so rm is reparented to init rather than left unreaped
+    with open(os.devnull, 'wb') as devnull:
+        process = subprocess.Popen(
+            ['sh', '-c', 'rm -rf "$@" &', 'sh'] + list(path_list),
+            stdin = devnull,
+            stdout = devnull,
+            stderr = devnull,
+            close_fds = True,
+            preexec_fn = os.setsid,
+        )
+        process.wait()
+
+
+def try_lock_dir(path):
+    # the lock is released when the descriptor is closed, including by a run being killed
+    file_descriptor = os.open(path, os.O_RDONLY)
+    try:
+        fcntl.flock(file_descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    except IOError:
+        os.close(file_descriptor)
+        return None
+
+    return file_descriptor
+
+
 class TempDir(object):
 
-    def __init__(self, root_dir = None):
+    def __init__(self, root_dir = None, background_cleanup = False):
         self._path = None
+        self._lock_descriptor = None
         self._root_dir = root_dir
+        self._background_cleanup = background_cleanup
 
     @property
     def path(self):
         return self._path
 
+    @property
+    def trash_path(self):
+        return os.path.join(self._root_dir or gettempdir(), TEMP_DIR_TRASH_NAME)
+
     def __enter__(self):
         if not self.path:
-            self._path = mkdtemp(dir = self._root_dir)
+            if self._background_cleanup:
+                self.sweep_temp_dirs()
+                self.sweep_trash()
+
+            self._path = mkdtemp(prefix = TEMP_DIR_PREFIX, dir = self._root_dir)
+
+            # held while in use, so that a sweep by another run leaves the directory alone
+            self._lock_descriptor = try_lock_dir(self._path)
 
         return self
 
     def __exit__(self, type, value, traceback):
         if self._path and os.path.isdir(self._path):
-            rmtree(self._path)
-            self._path = None
+            if not (self._background_cleanup and self._move_to_trash()):
+                rmtree(self._path)
+
+        if self._lock_descriptor is not None:
+            os.close(self._lock_descriptor)
+            self._lock_descriptor = None
+
+        self._path = None
 
         # ensure any exception is reraised
         return False
 
+    def _make_trash_dir(self):
+        try:
+            os.mkdir(self.trash_path)
+
+        except OSError:
+            # another run may have created it
+            if not os.path.isdir(self.trash_path):
+                raise
+
+    def _move_to_trash(self):
+        try:
+            self._make_trash_dir()
+
+            trash_entry_path = os.path.join(self.trash_path, os.path.basename(self._path))
+            os.rename(self._path, trash_entry_path)
+
+            # the modification time records when the entry was moved to the trash
+            os.utime(trash_entry_path, None)
+
+            remove_dirs_background([trash_entry_path])
+
+        except OSError:
+            return False
+
+        return True
+
+    def sweep_temp_dirs(self, min_age_seconds = TEMP_DIR_TRASH_SWEEP_SECONDS):
+        # runs that were killed leave their directory in place, unlocked, rather than in the trash
+        root_dir = self._root_dir or gettempdir()
+        time_limit = time() - min_age_seconds
+        for file_name in os.listdir(root_dir):
+            temp_path = os.path.join(root_dir, file_name)
+            try:
+                if not file_name.startswith(TEMP_DIR_PREFIX) or os.path.islink(temp_path) or not os.path.isdir(temp_path):
+                    continue
+
+                # the age check also covers a run between creating its directory and locking it
+                if os.lstat(temp_path).st_mtime > time_limit:
+                    continue
+
+                lock_descriptor = try_lock_dir(temp_path)
+
+            except OSError:
+                continue
+
+            if lock_descriptor is None:
+                continue
+
+            try:
+                log.debug('Moving stale temporary directory to the trash: {}'.format(temp_path))
+                self._make_trash_dir()
+                os.rename(temp_path, os.path.join(self.trash_path, file_name))
+
+            except OSError:
+                pass
+
+            finally:
+                os.close(lock_descriptor)
+
+    def sweep_trash(self, min_age_seconds = TEMP_DIR_TRASH_SWEEP_SECONDS):
+        if not os.path.isdir(self.trash_path):
+            return
+
+        # newer entries are still being removed by the run that moved them to the trash
+        time_limit = time() - min_age_seconds
+        path_list = []
+        for file_name in os.listdir(self.trash_path):
+            trash_entry_path = os.path.join(self.trash_path, file_name)
+            try:
+                if os.lstat(trash_entry_path).st_mtime <= time_limit:
+                    path_list.append(trash_entry_path)
+
+            except OSError:
+                pass
+
+        if path_list:
+            try:
+                remove_dirs_background(path_list)
+
+            except OSError:
+                pass
+
 
 class DataDir(object):
 
@@ -68,17 +210,8 @@ class DataDir(object):
             return json.load(file_object)
 
 
-class UnarchiveException(PackermateException):
-    pass
-
-
-def unarchive_file(box_file_name, temp_dir):
-    try:
-        command = "tar -xzvf '{}' -C '{}'".format(box_file_name, temp_dir)
-        run_command(command, quiet = True)
-
-    except ProcessException as e:
-        raise UnarchiveException("Failed to unarchive file: file='{}' error='{}'".format(box_file_name, e))
+def unarchive_file(box_file_name, temp_dir, parallel = True):
+    extract_archive(box_file_name, temp_dir, parallel = parallel)
 
     file_list = os.listdir(temp_dir)
 
@@ -116,9 +249,128 @@ def read_yaml_string(data):
         return None
 
 
-def write_json_file(data, file_name):
-    with open(file_name, 'w') as file_object:
-        json.dump(data, file_object, indent = 4, sort_keys = True)
+def write_json_file(data, file_name, atomic = False):
+    if not atomic:
+        with open(file_name, 'w') as file_object:
+            json.dump(data, file_object, indent = 4, sort_keys = True)
+
+        return
+
+    # write alongside the destination so the rename cannot cross filesystems
+    file_path = os.path.dirname(os.path.abspath(file_name))
+    file_descriptor, temp_file_name = mkstemp(dir = file_path, prefix = '.{}.'.format(os.path.basename(file_name)))
+    try:
+        with os.fdopen(file_descriptor, 'w') as file_object:
+            json.dump(data, file_object, indent = 4, sort_keys = True)
+
+        os.chmod(temp_file_name, 0o644)
+        os.rename(temp_file_name, file_name)
+
+    finally:
+        if os.path.exists(temp_file_name):
+            os.remove(temp_file_name)
+
+
+def read_json_file(file_name):
+    try:
+        with open(file_name, 'r') as file_object:
+            return json.load(file_object)
+
+    except (IOError, ValueError):
+        return None
+
+
+def write_json_cache_file(data, file_name):
+    try:
+        file_path = os.path.dirname(os.path.abspath(file_name))
+        if not os.path.isdir(file_path):
+            os.makedirs(file_path)
+
+        write_json_file(data, file_name, atomic = True)
+
+    except (IOError, OSError) as e:
+        log.debug("Failed to write cache file: file='{}' error='{}'".format(file_name, e))
+
+        return False
+
+    return True
+
+
+class JsonFileCache(object):
+
+    CACHE_FILE_NAME = None
+    _lookup = {}
+    _lock = threading.Lock()
+
+    def __init__(self, file_name = None):
+        self._file_name = file_name
+
+    @classmethod
+    def from_config(cls, config):
+        if not config.box_cache_dir:
+            return cls()
+
+        return cls(os.path.join(os.path.expanduser(config.box_cache_dir), cls.CACHE_FILE_NAME))
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._lookup and self._file_name:
+                self._lookup.update(self._read())
+
+            return self._lookup.get(key)
+
+    def put(self, key, value):
+        with self._lock:
+            self._lookup[key] = value
+
+            if self._file_name:
+                lookup = self._read()
+                lookup[key] = value
+                write_json_cache_file(lookup, self._file_name)
+
+    def _read(self):
+        lookup = read_json_file(self._file_name)
+
+        return lookup if isinstance(lookup, dict) else {}
+
+
+class FileLockException(PackermateException):
+    pass
+
+
+class FileLock(object):
+
+    def __init__(self, file_name):
+        self._file_name = file_name
+        self._file_object = None
+
+    @property
+    def file_name(self):
+        return self._file_name
+
+    def __enter__(self):
+        # the lock file is left in place, removing it would race with other waiters
+        try:
+            self._file_object = open(self._file_name, 'a')
+
+        except IOError as e:
+            raise FileLockException("Failed to open lock file: file='{}' error='{}'".format(self._file_name, e))
+
+        try:
+            fcntl.flock(self._file_object.fileno(), fcntl.LOCK_EX)
+
+        except IOError as e:
+            self._file_object.close()
+            self._file_object = None
+
+            raise FileLockException("Failed to lock file: file='{}' error='{}'".format(self._file_name, e))
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        fcntl.flock(self._file_object.fileno(), fcntl.LOCK_UN)
+        self._file_object.close()
+        self._file_object = None
 
 
 def get_path_names(file_name, path_list):
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+import os
+import re
+import json
+import hashlib
+from .file_utils import read_json_file, write_json_file
+from .http_client import get_json, HttpException
+from .s3 import S3Publisher
+from .vagrant import (
+    get_vagrant_output_file_names,
+    copy_published_file,
+    copy_published_file_to_path,
+    PublishException,
+)
+from .exception import PackermateException
+import logging
+
+
+FINGERPRINT_FILE_SUFFIX = '.fingerprint.json'
+FINGERPRINT_BUILDER_PATH_KEY_LIST = ('http_directory',)
+FINGERPRINT_PROVISIONER_PATH_KEY_LIST = ('source', 'script', 'scripts', 'playbook_file', 'playbook_dir')
+FINGERPRINT_TEMP_DIR = '<temp>'
+
+
+log = logging.getLogger('packermate.fingerprint')
+
+
+__all__ = ['get_build_fingerprint', 'read_published_fingerprint', 'publish_fingerprint', 'FingerprintException']
+
+
+class FingerprintException(PackermateException):
+    pass
+
+
+def get_path_digest(path):
+    sha256 = hashlib.sha256()
+
+    if os.path.isdir(path):
+        for dir_path, dir_name_list, file_name_list in os.walk(path):
+            dir_name_list.sort()
+            for file_name in sorted(file_name_list):
+                file_name_full = os.path.join(dir_path, file_name)
+                sha256.update(os.path.relpath(file_name_full, path).encode('utf-8'))
+                sha256.update(get_path_digest(file_name_full).encode('utf-8'))
+
+    elif os.path.isfile(path):
+        with open(path, 'rb') as file_object:
+            for data in iter(lambda: file_object.read(1024 * 1024), b''):
+                sha256.update(data)
+
+    else:
+        return None
+
+    return sha256.hexdigest()
+
+
+def get_referenced_paths(packer_config_data):
+    path_list = []
+    for section_name, key_list in (
+        ('builders', FINGERPRINT_BUILDER_PATH_KEY_LIST),
+        ('provisioners', FINGERPRINT_PROVISIONER_PATH_KEY_LIST),
+    ):
+        for section in packer_config_data.get(section_name, []):
+            # a download names a file on the build host that is written rather than read
+            if section.get('direction') == 'download':
+                continue
+
+            for key in key_list:
+                value = section.get(key)
+                if isinstance(value, basestring):
+                    path_list.append(value)
+
+                elif isinstance(value, list):
+                    path_list.extend([item for item in value if isinstance(item, basestring)])
+
+    return path_list
+
+
+def get_source_files(packer_config_data):
+    # disk images are identified by size and modification time, as reading them is too slow
+    source_list = []
+    for section in packer_config_data.get('builders', []):
+        source_path = section.get('source_path')
+        if source_path and os.path.exists(source_path):
+            file_stat = os.stat(source_path)
+            source_list.append([source_path, file_stat.st_size, int(file_stat.st_mtime)])
+
+    return source_list
+
+
+def get_build_fingerprint(packer_config_data, temp_dir, source_list = ()):
+    # source_list holds [name, provider, version] for the boxes the targets build from
+    temp_re = re.compile(re.escape(temp_dir.rstrip('/')) + r'(/([^/"]+)-[^/"]+)?')
+
+    def normalise(text):
+        return temp_re.sub(lambda match: FINGERPRINT_TEMP_DIR + ('/' + match.group(2) if match.group(2) else ''), text)
+
+    fingerprint_data = {
+        'packer': json.loads(normalise(json.dumps(packer_config_data, sort_keys = True))),
+        'files': dict([(normalise(path), get_path_digest(path)) for path in get_referenced_paths(packer_config_data)]),
+        'sources': [
+            [normalise(path), size, mtime] for path, size, mtime in get_source_files(packer_config_data)
+        ] + [list(source) for source in source_list],
+    }
+
+    return hashlib.sha256(json.dumps(fingerprint_data, sort_keys = True).encode('utf-8')).hexdigest()
+
+
+def get_fingerprint_file_name(config, target_list):
+    box_metadata_file_name, target_file_lookup = get_vagrant_output_file_names(config, target_list, check_file = False)
+
+    return os.path.splitext(box_metadata_file_name)[0] + FINGERPRINT_FILE_SUFFIX
+
+
+def read_published_fingerprint(config, target_list, temp_dir):
+    try:
+        file_name = get_fingerprint_file_name(config, target_list)
+
+    except PublishException:
+        return None
+
+    fingerprint_data = None
+    if fingerprint_data is None and config.vagrant_publish_url_prefix:
+        url = '{}{}'.format(config.vagrant_publish_url_prefix, os.path.basename(file_name))
+        if url.startswith('file://'):
+            fingerprint_data = read_json_file(url[len('file://'):])
+
+        else:
+            try:
+                fingerprint_data = get_json(url)
+
+            except HttpException:
+                log.info('No published build fingerprint: {}'.format(url))
+
+    if fingerprint_data is None and config.vagrant_publish_s3_url:
+        # the output directory may not exist before the first build
+        download_file_name = os.path.join(temp_dir, os.path.basename(file_name))
+        if S3Publisher.from_config(config).download_file(download_file_name):
+            fingerprint_data = read_json_file(download_file_name)
+
+    if fingerprint_data is None and config.vagrant_publish_path:
+        fingerprint_data = read_json_file(os.path.join(config.vagrant_publish_path, os.path.basename(file_name)))
+
+    if fingerprint_data is None:
+        fingerprint_data = read_json_file(file_name)
+
+    if not isinstance(fingerprint_data, dict):
+        return None
+
+    return fingerprint_data.get('fingerprint')
+
+
+def publish_fingerprint(config, target_list, fingerprint):
+    file_name = get_fingerprint_file_name(config, target_list)
+
+    log.info('Writing build fingerprint: {}'.format(file_name))
+    try:
+        write_json_file({'fingerprint': fingerprint, 'version': config.vm_version}, file_name, atomic = True)
+
+    except (IOError, OSError) as e:
+        raise FingerprintException("Failed to write build fingerprint: file='{}' error='{}'".format(file_name, e))
+
+    if 'vagrant_publish_copy_command' in config:
+        copy_published_file(config, file_name)
+
+    if config.vagrant_publish_path:
+        copy_published_file_to_path(config, file_name)
+
+    s3_publisher = S3Publisher.from_config(config)
+    if s3_publisher:
+        s3_publisher.upload_metadata(file_name)
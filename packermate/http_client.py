@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+import os
+import hashlib
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+from requests.packages.urllib3.util.retry import Retry
+from .file_utils import read_json_file, write_json_cache_file
+from .exception import PackermateException
+import logging
+
+
+HTTP_TIMEOUT_SECONDS = (10, 60)
+HTTP_RETRY_TOTAL = 3
+HTTP_RETRY_CONNECT = 1
+HTTP_RETRY_BACKOFF_FACTOR = 0.5
+HTTP_RETRY_STATUS_LIST = (500, 502, 503, 504)
+HTTP_POOL_SIZE = 16
+
+
+log = logging.getLogger('packermate.http_client')
+
+
+__all__ = ['HttpException', 'get_session', 'HttpCache', 'get_json']
+
+
+class HttpException(PackermateException):
+    pass
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total = HTTP_RETRY_TOTAL,
+                connect = HTTP_RETRY_CONNECT,
+                backoff_factor = HTTP_RETRY_BACKOFF_FACTOR,
+                status_forcelist = HTTP_RETRY_STATUS_LIST,
+                raise_on_status = False,
+            )
+            adapter = HTTPAdapter(pool_connections = HTTP_POOL_SIZE, pool_maxsize = HTTP_POOL_SIZE, max_retries = retry)
+
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+
+        return _session
+
+
+class HttpCache(object):
+
+    def __init__(self, cache_dir):
+        self._cache_dir = cache_dir
+
+    def _get_file_name(self, url):
+        return os.path.join(self._cache_dir, '{}.json'.format(hashlib.sha1(url.encode('utf-8')).hexdigest()))
+
+    def get(self, url):
+        entry = read_json_file(self._get_file_name(url))
+        if not isinstance(entry, dict) or entry.get('url') != url:
+            return None
+
+        return entry
+
+    def put(self, url, data, etag = None, last_modified = None):
+        entry = {
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'data': data,
+        }
+
+        write_json_cache_file(entry, self._get_file_name(url))
+
+
+def get_json(url, cache_dir = None):
+    http_cache = HttpCache(cache_dir) if cache_dir else None
+    cache_entry = http_cache.get(url) if http_cache else None
+
+    headers = {}
+    if cache_entry:
+        if cache_entry.get('etag'):
+            headers['If-None-Match'] = cache_entry['etag']
+
+        if cache_entry.get('last_modified'):
+            headers['If-Modified-Since'] = cache_entry['last_modified']
+
+    try:
+        response = get_session().get(url, headers = headers, timeout = HTTP_TIMEOUT_SECONDS)
+
+    except RequestException as e:
+        raise HttpException("Failed to download URL: url='{}' error='{}'".format(url, e))
+
+    if response.status_code == 304 and cache_entry:
+        log.debug('Using cached HTTP response: {}'.format(url))
+        return cache_entry['data']
+
+    if response.status_code != 200:
+        ex = HttpException("Failed to download URL: url='{}' status_code={}".format(url, response.status_code))
+        ex.status_code = response.status_code
+        raise ex
+
+    try:
+        data = response.json()
+
+    except ValueError:
+        raise HttpException('Failed to decode JSON from URL: {}'.format(url))
+
+    if http_cache and (response.headers.get('ETag') or response.headers.get('Last-Modified')):
+        http_cache.put(url, data, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+    return data
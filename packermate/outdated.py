@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+from multiprocessing.pool import ThreadPool
+from .vagrant import (
+    BoxMetadata,
+    BoxMetadataException,
+    BoxInventory,
+    BoxInventoryException,
+    VersionConstraint,
+    is_version_constraint,
+    parse_version,
+    get_vagrant_boxes_dir,
+    get_vagrant_inventory_state_file,
+    get_http_cache_dir,
+)
+from .http_client import HTTP_POOL_SIZE
+import logging
+
+
+OUTDATED_PROVIDER_LIST = ('virtualbox', 'aws')
+OUTDATED_COLUMN_LIST = (
+    ('config', 'Config'),
+    ('name', 'Box'),
+    ('provider', 'Provider'),
+    ('configured', 'Configured'),
+    ('installed', 'Installed'),
+    ('latest', 'Latest'),
+    ('status', 'Status'),
+)
+
+
+log = logging.getLogger('packermate.outdated')
+
+
+__all__ = ['get_outdated_boxes', 'format_outdated_table']
+
+
+def get_box_entries(config_list):
+    entry_list = []
+    entry_seen_set = set()
+    for config in config_list:
+        for provider in OUTDATED_PROVIDER_LIST:
+            provider_config = config.provider(provider)
+            if not (provider_config.vagrant_box_name and provider_config.vagrant_box_url):
+                continue
+
+            entry = (
+                config,
+                provider_config.vagrant_box_name,
+                provider,
+                provider_config.vagrant_box_url,
+                provider_config.vagrant_box_version,
+            )
+            entry_key = (config.config_file_name,) + entry[1:]
+            if entry_key not in entry_seen_set:
+                entry_seen_set.add(entry_key)
+                entry_list.append(entry)
+
+    return entry_list
+
+
+def fetch_box_metadata(url_list, cache_dir_lookup):
+    def fetch(url):
+        try:
+            return url, BoxMetadata(url = url, cache_dir = cache_dir_lookup.get(url))
+
+        except BoxMetadataException as e:
+            log.warning('Failed to load Vagrant box metadata: {}'.format(e))
+            return url, None
+
+    if not url_list:
+        return {}
+
+    pool = ThreadPool(min(len(url_list), HTTP_POOL_SIZE))
+    try:
+        return dict(pool.map(fetch, url_list))
+
+    finally:
+        pool.close()
+        pool.join()
+
+
+def get_outdated_boxes(config_list):
+    entry_list = get_box_entries(config_list)
+
+    cache_dir_lookup = {}
+    for config, name, provider, url, version in entry_list:
+        cache_dir_lookup.setdefault(url, get_http_cache_dir(config))
+
+    metadata_lookup = fetch_box_metadata(sorted(cache_dir_lookup.keys()), cache_dir_lookup)
+
+    inventory_lookup = {}
+    error_seen_set = set()
+    row_list = []
+    for config, name, provider, url, version in entry_list:
+        box_metadata = metadata_lookup.get(url)
+        if box_metadata is None:
+            # report a box once rather than for each provider
+            error_key = (config.config_file_name, name, url)
+            if error_key not in error_seen_set:
+                error_seen_set.add(error_key)
+                row_list.append(get_row(config, name, '', version, status = 'error'))
+
+            continue
+
+        latest_info = box_metadata.get_provider_version(provider)
+        if latest_info is None:
+            continue
+
+        boxes_dir = get_vagrant_boxes_dir(config)
+        if boxes_dir not in inventory_lookup:
+            inventory_lookup[boxes_dir] = BoxInventory(
+                vagrant_command = config.vagrant_command,
+                boxes_dir = boxes_dir,
+                state_file = get_vagrant_inventory_state_file(config),
+            )
+
+        try:
+            installed_val = inventory_lookup[boxes_dir].installed(name, provider, version)
+
+        except BoxInventoryException:
+            installed_val = None
+
+        latest_val = parse_version(latest_info[0])
+        row_list.append(
+            get_row(
+                config,
+                name,
+                provider,
+                version,
+                installed = installed_val,
+                latest = latest_val,
+                status = get_status(version, installed_val, latest_val),
+            )
+        )
+
+    return row_list
+
+
+def get_status(version, installed_val, latest_val):
+    if version and not is_version_constraint(version):
+        return 'pinned' if parse_version(version) < latest_val else 'current'
+
+    if version and not VersionConstraint(version).match(latest_val):
+        return 'pinned'
+
+    if installed_val is None or installed_val < latest_val:
+        return 'outdated'
+
+    return 'current'
+
+
+def get_row(config, name, provider, version, installed = None, latest = None, status = ''):
+    return {
+        'config': config.config_file_name or '',
+        'name': name,
+        'provider': provider,
+        'configured': version or '',
+        'installed': unicode(installed) if installed else '',
+        'latest': unicode(latest) if latest else '',
+        'status': status,
+    }
+
+
+def format_outdated_table(row_list):
+    width_list = [
+        max([len(title)] + [len(row[key]) for row in row_list])
+        for key, title in OUTDATED_COLUMN_LIST
+    ]
+
+    line_list = []
+    for value_list in [[title for key, title in OUTDATED_COLUMN_LIST]] + [[row[key] for key, title in OUTDATED_COLUMN_LIST] for row in row_list]:
+        line_list.append('  '.join([value.ljust(width) for value, width in zip(value_list, width_list)]).rstrip())
+
+    return '\n'.join(line_list)
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+from urlparse import urlparse
+import os
+import threading
+from multiprocessing.pool import ThreadPool
+from .checksum import MultiDigest, DigestCache, DIGEST_TYPE_LIST
+from .exception import PackermateException
+import logging
+
+try:
+    import boto3
+    from botocore.exceptions import BotoCoreError, ClientError
+    BOTO3_AVAILABLE = True
+
+except ImportError:
+    BOTO3_AVAILABLE = False
+
+    class BotoCoreError(Exception):
+        pass
+
+    class ClientError(Exception):
+        pass
+
+
+S3_PART_MB_DEFAULT = 64
+S3_PART_MB_MINIMUM = 5
+S3_WORKERS_DEFAULT = 4
+
+
+log = logging.getLogger('packermate.s3')
+
+
+__all__ = ['S3Publisher', 'S3PublishException']
+
+
+class S3PublishException(PackermateException):
+    pass
+
+
+def get_s3_client(endpoint_url = None):
+    if not BOTO3_AVAILABLE:
+        raise S3PublishException('Publishing to S3 requires boto3, install packermate[AWS]')
+
+    return boto3.client('s3', endpoint_url = endpoint_url or None)
+
+
+class S3Publisher(object):
+
+    def __init__(
+        self,
+        url,
+        endpoint_url = None,
+        part_mb = S3_PART_MB_DEFAULT,
+        workers = S3_WORKERS_DEFAULT,
+        client = None,
+        digest_cache = None,
+    ):
+        result = urlparse(url)
+        if result.scheme != 's3' or not result.netloc:
+            raise S3PublishException('Invalid S3 URL: {}'.format(url))
+
+        self._bucket = result.netloc
+        self._prefix = result.path.strip('/')
+        if self._prefix:
+            self._prefix += '/'
+
+        self._endpoint_url = endpoint_url
+        self._part_bytes = max(part_mb, S3_PART_MB_MINIMUM) * 1024 * 1024
+        self._workers = max(1, workers)
+        self._client = client or get_s3_client(endpoint_url)
+        self._digest_cache = digest_cache
+
+    @classmethod
+    def from_config(cls, config):
+        # imported here as the vagrant module imports this one
+        from .vagrant import get_int_parameter
+
+        if not config.vagrant_publish_s3_url:
+            return None
+
+        return cls(
+            config.vagrant_publish_s3_url,
+            endpoint_url = config.vagrant_publish_s3_endpoint_url,
+            part_mb = get_int_parameter(config, 'vagrant_publish_s3_part_mb', S3PublishException) or S3_PART_MB_DEFAULT,
+            workers = get_int_parameter(config, 'vagrant_publish_s3_workers', S3PublishException) or S3_WORKERS_DEFAULT,
+            digest_cache = DigestCache.from_config(config),
+        )
+
+    def get_key(self, file_name):
+        return self._prefix + os.path.basename(file_name)
+
+    def get_url(self, file_name):
+        key = self.get_key(file_name)
+        if self._endpoint_url:
+            return '{}/{}/{}'.format(self._endpoint_url.rstrip('/'), self._bucket, key)
+
+        return 'https://{}.s3.amazonaws.com/{}'.format(self._bucket, key)
+
+    def upload_file(self, file_name, digest_type_list = DIGEST_TYPE_LIST):
+        key = self.get_key(file_name)
+        multi_digest = MultiDigest(digest_type_list)
+
+        log.info('Uploading to S3: {} -> s3://{}/{}'.format(file_name, self._bucket, key))
+        try:
+            if os.path.getsize(file_name) <= self._part_bytes:
+                with open(file_name, 'rb') as file_object:
+                    data = file_object.read()
+
+                multi_digest.update(data)
+                self._client.put_object(Bucket = self._bucket, Key = key, Body = data)
+
+            else:
+                self._upload_multipart(file_name, key, multi_digest)
+
+        except (BotoCoreError, ClientError, IOError, OSError) as e:
+            raise S3PublishException("Failed to upload to S3: file='{}' key='{}' error='{}'".format(file_name, key, e))
+
+        digest_lookup = multi_digest.hexdigests()
+        if self._digest_cache:
+            self._digest_cache.add_digests(file_name, digest_lookup)
+
+        return digest_lookup
+
+    def _upload_multipart(self, file_name, key, multi_digest):
+        upload_id = self._client.create_multipart_upload(Bucket = self._bucket, Key = key)['UploadId']
+
+        try:
+            part_list = self._upload_parts(file_name, key, upload_id, multi_digest)
+
+            self._client.complete_multipart_upload(
+                Bucket = self._bucket,
+                Key = key,
+                UploadId = upload_id,
+                MultipartUpload = {'Parts': part_list},
+            )
+
+        except Exception:
+            self._client.abort_multipart_upload(Bucket = self._bucket, Key = key, UploadId = upload_id)
+            raise
+
+    def _upload_parts(self, file_name, key, upload_id, multi_digest):
+        # bound the parts held in memory while waiting for a worker
+        part_semaphore = threading.Semaphore(self._workers * 2)
+        # once a part fails no more parts are read or uploaded
+        failed_event = threading.Event()
+
+        def upload_part(part_number, data):
+            try:
+                if failed_event.is_set():
+                    return None
+
+                response = self._client.upload_part(
+                    Bucket = self._bucket,
+                    Key = key,
+                    UploadId = upload_id,
+                    PartNumber = part_number,
+                    Body = data,
+                )
+                return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+            except Exception:
+                failed_event.set()
+                raise
+
+            finally:
+                part_semaphore.release()
+
+        result_list = []
+        pool = ThreadPool(self._workers)
+        try:
+            with open(file_name, 'rb') as file_object:
+                while not failed_event.is_set():
+                    part_semaphore.acquire()
+                    if failed_event.is_set():
+                        part_semaphore.release()
+                        break
+
+                    data = file_object.read(self._part_bytes)
+                    if not data:
+                        part_semaphore.release()
+                        break
+
+                    multi_digest.update(data)
+                    result_list.append(pool.apply_async(upload_part, (len(result_list) + 1, data)))
+
+        finally:
+            pool.close()
+            pool.join()
+
+        # the parts in progress finish before the upload is aborted, the failed part raises here
+        return [result.get() for result in result_list]
+
+    def upload_metadata(self, file_name):
+        # a single put, so readers see either the previous or the new metadata
+        key = self.get_key(file_name)
+
+        log.info('Uploading Vagrant box metadata to S3: {} -> s3://{}/{}'.format(file_name, self._bucket, key))
+        try:
+            with open(file_name, 'rb') as file_object:
+                self._client.put_object(
+                    Bucket = self._bucket,
+                    Key = key,
+                    Body = file_object.read(),
+                    ContentType = 'application/json',
+                    CacheControl = 'no-cache',
+                )
+
+        except (BotoCoreError, ClientError, IOError) as e:
+            raise S3PublishException("Failed to upload to S3: file='{}' key='{}' error='{}'".format(file_name, key, e))
+
+    def download_file(self, file_name):
+        key = self.get_key(file_name)
+        try:
+            response = self._client.get_object(Bucket = self._bucket, Key = key)
+            data = response['Body'].read()
+
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                return False
+
+            raise S3PublishException("Failed to download from S3: key='{}' error='{}'".format(key, e))
+
+        except BotoCoreError as e:
+            raise S3PublishException("Failed to download from S3: key='{}' error='{}'".format(key, e))
+
+        with open(file_name, 'wb') as file_object:
+            file_object.write(data)
+
+        return True
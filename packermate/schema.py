@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+
+
+# Packer decodes templates weakly, so numbers are accepted for strings and strings for numbers and booleans
+SCHEMA_STRING = 'string'
+SCHEMA_INT = 'int'
+SCHEMA_BOOL = 'bool'
+SCHEMA_STRING_LIST = 'string_list'
+SCHEMA_COMMAND_LIST = 'command_list'
+SCHEMA_STRING_MAP = 'string_map'
+SCHEMA_BLOCK_DEVICE_LIST = 'block_device_list'
+SCHEMA_BOOL_STRING_LIST = ('true', 'false', '1', '0')
+
+
+__all__ = ['validate_packer_config', 'SchemaField']
+
+
+class SchemaField(object):
+
+    def __init__(self, name, value_type = SCHEMA_STRING, required = False):
+        self.name = name
+        self.value_type = value_type
+        self.required = required
+
+
+def is_string(value):
+    return isinstance(value, (basestring, int, long, float)) and not isinstance(value, bool)
+
+
+def is_int(value):
+    if isinstance(value, basestring):
+        return value.strip().lstrip('-').isdigit()
+
+    return isinstance(value, (int, long)) and not isinstance(value, bool)
+
+
+def is_bool(value):
+    if isinstance(value, basestring):
+        return value.lower() in SCHEMA_BOOL_STRING_LIST
+
+    return isinstance(value, bool)
+
+
+def is_string_list(value):
+    return isinstance(value, list) and all([is_string(item) for item in value])
+
+
+def is_command_list(value):
+    return isinstance(value, list) and all([is_string_list(item) for item in value])
+
+
+def is_string_map(value):
+    return isinstance(value, dict) and all([is_string(item) for item in value.itervalues()])
+
+
+BLOCK_DEVICE_FIELD_LIST = (
+    SchemaField('device_name', required = True),
+    SchemaField('delete_on_termination', SCHEMA_BOOL),
+    SchemaField('encrypted', SCHEMA_BOOL),
+    SchemaField('iops', SCHEMA_INT),
+    SchemaField('no_device', SCHEMA_BOOL),
+    SchemaField('snapshot_id'),
+    SchemaField('virtual_name'),
+    SchemaField('volume_size', SCHEMA_INT),
+    SchemaField('volume_type'),
+)
+
+
+def is_block_device_list(value):
+    return isinstance(value, list) and all([
+        isinstance(item, dict) and not get_section_errors(item, BLOCK_DEVICE_FIELD_LIST)
+        for item in value
+    ])
+
+
+SCHEMA_TYPE_LOOKUP = {
+    SCHEMA_STRING: is_string,
+    SCHEMA_INT: is_int,
+    SCHEMA_BOOL: is_bool,
+    SCHEMA_STRING_LIST: is_string_list,
+    SCHEMA_COMMAND_LIST: is_command_list,
+    SCHEMA_STRING_MAP: is_string_map,
+    SCHEMA_BLOCK_DEVICE_LIST: is_block_device_list,
+}
+
+VIRTUALBOX_FIELD_LIST = (
+    SchemaField('vm_name'),
+    SchemaField('vboxmanage', SCHEMA_COMMAND_LIST),
+    SchemaField('vboxmanage_post', SCHEMA_COMMAND_LIST),
+    SchemaField('guest_additions_mode'),
+    SchemaField('guest_additions_path'),
+    SchemaField('boot_wait'),
+    SchemaField('boot_command', SCHEMA_STRING_LIST),
+    SchemaField('http_directory'),
+    SchemaField('http_port_min', SCHEMA_INT),
+    SchemaField('http_port_max', SCHEMA_INT),
+    SchemaField('ssh_username', required = True),
+    SchemaField('ssh_password'),
+    SchemaField('ssh_private_key_file'),
+    SchemaField('ssh_port', SCHEMA_INT),
+    SchemaField('ssh_timeout'),
+    SchemaField('ssh_wait_timeout'),
+    SchemaField('shutdown_command'),
+    SchemaField('shutdown_timeout'),
+    SchemaField('output_directory'),
+    SchemaField('format'),
+    SchemaField('headless', SCHEMA_BOOL),
+    SchemaField('keep_registered', SCHEMA_BOOL),
+    SchemaField('skip_export', SCHEMA_BOOL),
+)
+
+BUILDER_FIELD_LOOKUP = {
+    'virtualbox-iso': VIRTUALBOX_FIELD_LIST + (
+        SchemaField('iso_url', required = True),
+        SchemaField('iso_checksum', required = True),
+        SchemaField('iso_checksum_type', required = True),
+        SchemaField('guest_os_type'),
+        SchemaField('disk_size', SCHEMA_INT),
+        SchemaField('hard_drive_interface'),
+    ),
+    'virtualbox-ovf': VIRTUALBOX_FIELD_LIST + (
+        SchemaField('source_path', required = True),
+        SchemaField('import_flags', SCHEMA_STRING_LIST),
+        SchemaField('import_opts'),
+    ),
+    'amazon-ebs': (
+        SchemaField('access_key'),
+        SchemaField('secret_key'),
+        SchemaField('token'),
+        SchemaField('region', required = True),
+        SchemaField('subnet_id'),
+        SchemaField('source_ami', required = True),
+        SchemaField('ami_name', required = True),
+        SchemaField('force_deregister', SCHEMA_BOOL),
+        SchemaField('instance_type', required = True),
+        SchemaField('ssh_username', required = True),
+        SchemaField('ssh_private_key_file'),
+        SchemaField('ssh_keypair_name'),
+        SchemaField('ssh_timeout'),
+        SchemaField('tags', SCHEMA_STRING_MAP),
+        SchemaField('run_tags', SCHEMA_STRING_MAP),
+        SchemaField('iam_instance_profile'),
+        SchemaField('kms_key_id'),
+        SchemaField('encrypt_boot', SCHEMA_BOOL),
+        SchemaField('ena_support', SCHEMA_BOOL),
+        SchemaField('ami_block_device_mappings', SCHEMA_BLOCK_DEVICE_LIST),
+        SchemaField('launch_block_device_mappings', SCHEMA_BLOCK_DEVICE_LIST),
+    ),
+}
+
+PROVISIONER_FIELD_LOOKUP = {
+    'shell': (
+        SchemaField('inline', SCHEMA_STRING_LIST),
+        SchemaField('script'),
+        SchemaField('scripts', SCHEMA_STRING_LIST),
+        SchemaField('execute_command'),
+        SchemaField('environment_vars', SCHEMA_STRING_LIST),
+    ),
+    'file': (
+        SchemaField('source', required = True),
+        SchemaField('destination', required = True),
+        SchemaField('direction'),
+    ),
+    'shell-local': (
+        SchemaField('command', required = True),
+        SchemaField('execute_command', SCHEMA_STRING_LIST),
+    ),
+    'ansible-local': (
+        SchemaField('playbook_file', required = True),
+        SchemaField('playbook_dir'),
+        SchemaField('command'),
+        SchemaField('extra_arguments', SCHEMA_STRING_LIST),
+    ),
+}
+
+POST_PROCESSOR_FIELD_LOOKUP = {
+    'vagrant': (
+        SchemaField('output'),
+        SchemaField('keep_input_artifact', SCHEMA_BOOL),
+        SchemaField('compression_level', SCHEMA_INT),
+        SchemaField('vagrantfile_template'),
+        SchemaField('include', SCHEMA_STRING_LIST),
+    ),
+}
+
+# keys Packer accepts on every section of a kind
+BUILDER_COMMON_FIELD_LIST = (
+    SchemaField('type', required = True),
+    SchemaField('name'),
+)
+PROVISIONER_COMMON_FIELD_LIST = (
+    SchemaField('type', required = True),
+    SchemaField('only', SCHEMA_STRING_LIST),
+    SchemaField('except', SCHEMA_STRING_LIST),
+    SchemaField('pause_before'),
+)
+POST_PROCESSOR_COMMON_FIELD_LIST = (
+    SchemaField('type', required = True),
+    SchemaField('only', SCHEMA_STRING_LIST),
+    SchemaField('except', SCHEMA_STRING_LIST),
+)
+TEMPLATE_KEY_LIST = ('builders', 'provisioners', 'post-processors', 'variables', 'description', 'min_packer_version')
+
+
+def get_section_errors(section, field_list):
+    error_list = []
+    field_lookup = dict([(field.name, field) for field in field_list])
+
+    for field in field_list:
+        if field.required and (field.name not in section or section[field.name] in (None, '')):
+            error_list.append('missing required key: {}'.format(field.name))
+
+    for key in sorted(section.keys()):
+        field = field_lookup.get(key)
+        if field is None:
+            error_list.append('unknown key: {}'.format(key))
+
+        elif not SCHEMA_TYPE_LOOKUP[field.value_type](section[key]):
+            error_list.append('invalid {} value: {}={}'.format(field.value_type.replace('_', ' '), key, section[key]))
+
+    return error_list
+
+
+def get_shell_errors(section):
+    if not any([section.get(key) for key in ('inline', 'script', 'scripts')]):
+        return ['one of inline, script or scripts must be specified']
+
+    return []
+
+
+SECTION_CHECK_LOOKUP = {
+    ('provisioners', 'shell'): get_shell_errors,
+}
+
+
+def validate_packer_config(packer_config_data):
+    error_list = []
+
+    if not isinstance(packer_config_data, dict):
+        return ['template is not a dictionary']
+
+    for key in sorted(packer_config_data.keys()):
+        if key not in TEMPLATE_KEY_LIST:
+            error_list.append('template: unknown key: {}'.format(key))
+
+    if not packer_config_data.get('builders'):
+        error_list.append('template: at least one builder must be defined')
+
+    builder_name_set = set()
+    for section_name, field_lookup, common_field_list in (
+        ('builders', BUILDER_FIELD_LOOKUP, BUILDER_COMMON_FIELD_LIST),
+        ('provisioners', PROVISIONER_FIELD_LOOKUP, PROVISIONER_COMMON_FIELD_LIST),
+        ('post-processors', POST_PROCESSOR_FIELD_LOOKUP, POST_PROCESSOR_COMMON_FIELD_LIST),
+    ):
+        section_list = packer_config_data.get(section_name, [])
+        if not isinstance(section_list, list):
+            error_list.append('{}: not a list'.format(section_name))
+            continue
+
+        for index, section in enumerate(section_list):
+            if not isinstance(section, dict):
+                error_list.append('{}[{}]: not a dictionary'.format(section_name, index))
+                continue
+
+            section_type = section.get('type')
+            section_prefix = '{}[{}] {}'.format(section_name, index, section_type or '')
+            if section_type not in field_lookup:
+                error_list.append('{}: unknown type'.format(section_prefix))
+                continue
+
+            section_error_list = get_section_errors(section, common_field_list + field_lookup[section_type])
+
+            section_check_func = SECTION_CHECK_LOOKUP.get((section_name, section_type))
+            if callable(section_check_func):
+                section_error_list += section_check_func(section)
+
+            error_list += ['{}: {}'.format(section_prefix, error) for error in section_error_list]
+
+            if section_name == 'builders':
+                builder_name = section.get('name') or section_type
+                if builder_name in builder_name_set:
+                    error_list.append('{}: duplicate builder name: {}'.format(section_prefix, builder_name))
+
+                builder_name_set.add(builder_name)
+
+    return error_list
@@ -5,6 +5,8 @@ import sys
 import argparse
 from .config import Config
 from .command import Builder
+from .batch import BatchBuilder, BATCH_WORKERS_DEFAULT
+from .outdated import get_outdated_boxes, format_outdated_table
 from collections import OrderedDict
 from .exception import PackermateException
 import logging
@@ -15,6 +17,9 @@ COMMAND_LOOKUP = OrderedDict([
     ('virtualbox', ('build', 'virtualbox')),
     ('aws', ('build', 'aws')),
     ('all', ('build', 'virtualbox', 'aws')),
+    ('prune', ('prune',)),
+    ('gc', ('gc',)),
+    ('outdated', ('outdated',)),
 ])
 LOG_FORMAT = '%(name)s %(levelname)s: %(message)s'
 LOG_FORMAT_DATE = '%Y-%m-%d %H:%M:%S'
@@ -38,11 +43,12 @@ def parse_arguments():
         description = 'packermate',
         formatter_class = argparse.ArgumentDefaultsHelpFormatter
     )
-    parser.add_argument('-c', '--config', default = DEFAULT_CONFIG_FILE_NAME, help = 'config file')
+    parser.add_argument('-c', '--config', action = 'append', help = 'config file, repeat to build or check many')
     parser.add_argument('-p', '--param', action = 'append', help = 'additional parameters e.g. -p foo=bar -p answer=42')
     parser.add_argument('-s', '--show-config', action = 'store_true', help = 'show parameters')
     parser.add_argument('-n', '--dry-run', action = 'store_true', help = 'validate only')
-    parser.add_argument('-d', '--dump-packer', action = 'store_true', help = 'dump packer config to working directory')
+    parser.add_argument('-d', '--dump-packer', action = 'store_true', help = 'dump packer config to working directory, as <vm_name>.packer.json for many configs')
+    parser.add_argument('-j', '--jobs', type = int, default = BATCH_WORKERS_DEFAULT, help = 'configs to build concurrently')
     parser.add_argument(
         'command',
         nargs = '?',
@@ -52,6 +58,9 @@ def parse_arguments():
     )
     args = parser.parse_args()
 
+    if not args.config:
+        args.config = [DEFAULT_CONFIG_FILE_NAME]
+
     return args
 
 
@@ -61,10 +70,16 @@ def run():
 
     try:
         args = parse_arguments()
-        config = Config(args.config, args.param)
+        config_list = [Config(config_file_name, override_list = args.param) for config_file_name in args.config]
 
         if args.show_config:
-            print(unicode(config))
+            for config in config_list:
+                print(unicode(config))
+
+            return
+
+        if args.command == 'outdated':
+            print(format_outdated_table(get_outdated_boxes(config_list)))
 
             return
 
@@ -72,6 +87,16 @@ def run():
         if command_list:
             command_name = command_list[0]
             target_list = command_list[1:]
+            if len(config_list) > 1:
+                if command_name != 'build':
+                    raise PackermateException('Multiple config files are only supported by build commands and outdated')
+
+                batch_builder = BatchBuilder(config_list, target_list, args.dry_run, args.dump_packer, args.jobs)
+                batch_builder.build()
+
+                return
+
+            config = config_list[0]
             builder = Builder(config, target_list, args.dry_run, args.dump_packer)
             command_func = getattr(builder, command_name)
             if callable(command_func):
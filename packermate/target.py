@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import print_function, unicode_literals
+from .file_utils import unarchive_file
+from .cache import ExtractionCache
 from .exception import PackermateException
 import logging
 
@@ -27,6 +29,34 @@ class TargetBase(object):
     def build(self):
         raise NotImplementedError()
 
+    def _unarchive_box_file(self, box_file_name):
+        box_cache = ExtractionCache.from_config(self._config)
+        if box_cache is None:
+            return unarchive_file(box_file_name, self._temp_dir)
+
+        return box_cache.unarchive(box_file_name, self._temp_dir)
+
+    def _get_installed_box_path(self, provider):
+        box_version = self._box_inventory.get_version_from_config(self._config, provider)
+
+        return self._box_inventory.get_box_path(self._config.vagrant_box_name, provider, box_version)
+
+    def _unarchive_vagrant_box(self, provider):
+        box_cache = ExtractionCache.from_config(self._config)
+        if box_cache is None:
+            box_file_name = self._box_inventory.export_from_config(self._config, provider, self._temp_dir)
+            return unarchive_file(box_file_name, self._temp_dir)
+
+        box_version = self._box_inventory.get_version_from_config(self._config, provider)
+        cache_key = box_cache.get_box_key(self._config.vagrant_box_name, provider, box_version)
+
+        file_name_lookup = box_cache.get(cache_key, self._temp_dir)
+        if file_name_lookup is None:
+            box_file_name = self._box_inventory.export_from_config(self._config, provider, self._temp_dir)
+            file_name_lookup = box_cache.unarchive(box_file_name, self._temp_dir, key = cache_key)
+
+        return file_name_lookup
+
 
 class TargetParameterException(PackermateException):
     pass
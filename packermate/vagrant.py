@@ -2,20 +2,47 @@
 
 from __future__ import print_function, unicode_literals
 from urlparse import urlparse
-import requests
-from requests.exceptions import ConnectionError
 import json
 from semantic_version import Version
-from .file_utils import write_json_file, get_md5_sum
-from datetime import datetime
+from .file_utils import write_json_file, read_json_file, write_json_cache_file, FileLock
+from .http_client import get_json, HttpException
+from .s3 import S3Publisher
+from .cache import get_tree_size
+from .download import BoxDownloader, DOWNLOAD_WORKERS_DEFAULT, DOWNLOAD_PART_BYTES_DEFAULT
+from .checksum import (
+    get_file_digests,
+    copy_file_with_digests,
+    DigestCache,
+    ChecksumException,
+    DIGEST_TYPE_LIST,
+)
+from datetime import datetime, timedelta
+from time import time
+from bisect import bisect_right, insort
 from .process import run_command, ProcessException
 import re
 import os
+import pipes
+import tempfile
+import threading
+from multiprocessing.pool import ThreadPool
 from .exception import PackermateException
 import logging
 
 
 REPACKAGED_VAGRANT_BOX_FILE_NAME = 'package.box'
+VAGRANT_BOX_NAME_SLASH = '-VAGRANTSLASH-'
+VAGRANT_BOX_METADATA_FILE_NAME = 'metadata.json'
+INVENTORY_STATE_FILE_NAME = 'inventory.json'
+HTTP_CACHE_DIR_NAME = 'http'
+PARSE_VERSION_CACHE_SIZE = 10000
+RETENTION_ACTION_LIST = ('revoke', 'drop')
+PUBLISH_CHECKSUM_TYPE_DEFAULT = 'md5'
+BOOL_TRUE_STRING_LIST = ('true', 'yes', 'on', '1')
+BOOL_FALSE_STRING_LIST = ('false', 'no', 'off', '0')
+# digests calculated together so changing the published checksum type needs no extra read
+PUBLISH_DIGEST_TYPE_LIST = ('md5', 'sha256')
+PUBLISH_WORKERS_DEFAULT = 4
 
 
 log = logging.getLogger('packermate.vagrant')
@@ -25,8 +52,12 @@ __all__ = [
     'BoxMetadata',
     'BoxMetadataException',
     'parse_version',
+    'VersionConstraint',
     'BoxInventory',
     'BoxInventoryException',
+    'get_vagrant_boxes_dir',
+    'get_vagrant_inventory_state_file',
+    'get_http_cache_dir',
     'parse_vagrant_export',
     'PublishException',
     'publish_vagrant_box',
@@ -37,7 +68,27 @@ class BoxVersionException(PackermateException):
     pass
 
 
+_parse_version_cache = {}
+
+
 def parse_version(version_val):
+    if isinstance(version_val, (basestring, int, long, float)):
+        # key on the type as well so that e.g. True and 1 are not confused
+        cache_key = (type(version_val), version_val)
+        version_parsed = _parse_version_cache.get(cache_key)
+        if version_parsed is None:
+            if len(_parse_version_cache) >= PARSE_VERSION_CACHE_SIZE:
+                _parse_version_cache.clear()
+
+            version_parsed = _parse_version(version_val)
+            _parse_version_cache[cache_key] = version_parsed
+
+        return version_parsed
+
+    return _parse_version(version_val)
+
+
+def _parse_version(version_val):
     if not version_val:
         raise BoxVersionException("Invalid version value: '{}'".format(version_val))
 
@@ -90,20 +141,78 @@ def get_version_index(version_val, version_list):
     return insert_at, match_at
 
 
+def is_version_constraint(version_val):
+    return isinstance(version_val, basestring) and any([char in version_val for char in '~<>=!,'])
+
+
+class VersionConstraint(object):
+
+    def __init__(self, constraint_str):
+        self._constraint_str = constraint_str
+        self._clause_list = []
+
+        for clause_str in constraint_str.split(','):
+            match = re.match(r'^\s*(~>|>=|<=|!=|=|>|<)?\s*(\d+(?:\.\d+){0,2})\s*$', clause_str)
+            if not match:
+                raise BoxVersionException("Invalid version constraint: '{}'".format(constraint_str))
+
+            operator, version_str = match.groups()
+            version_val = parse_version(version_str)
+
+            if operator == '~>':
+                # pessimistic: allow the last given element to increase
+                version_part_list = [int(version_part) for version_part in version_str.split('.')]
+                bump_index = max(len(version_part_list) - 2, 0)
+                version_upper_part_list = version_part_list[:bump_index] + [version_part_list[bump_index] + 1]
+                self._clause_list.append(('>=', version_val))
+                self._clause_list.append(('<', parse_version('.'.join([str(version_part) for version_part in version_upper_part_list]))))
+
+            else:
+                self._clause_list.append((operator or '=', version_val))
+
+    def __str__(self):
+        return self._constraint_str
+
+    def match(self, version_val):
+        for operator, clause_val in self._clause_list:
+            if not {
+                '=': version_val == clause_val,
+                '!=': version_val != clause_val,
+                '>': version_val > clause_val,
+                '<': version_val < clause_val,
+                '>=': version_val >= clause_val,
+                '<=': version_val <= clause_val,
+            }[operator]:
+                return False
+
+        return True
+
+    def select(self, version_list):
+        # version_list is sorted newest first
+        for version_val in version_list:
+            if self.match(version_val):
+                return version_val
+
+        return None
+
+
 class BoxMetadataException(PackermateException):
     pass
 
 
+def parse_metadata_time(time_str):
+    try:
+        return datetime.strptime(time_str[:19], '%Y-%m-%dT%H:%M:%S')
+
+    except (TypeError, ValueError):
+        return None
+
+
 class BoxMetadata(object):
 
-    def __init__(self, url = None, name = None):
+    def __init__(self, url = None, name = None, cache_dir = None):
         if url:
-            url_data = self._load_url(url)
-            try:
-                self._metadata = json.loads(url_data)
-
-            except ValueError:
-                raise BoxMetadataException('Failed to decode JSON form metadata file')
+            self._metadata = self._load_url(url, cache_dir)
 
         elif name:
             self._metadata = self._create(name)
@@ -114,7 +223,7 @@ class BoxMetadata(object):
         self._validate()
 
     @staticmethod
-    def _load_url(url):
+    def _load_url(url, cache_dir = None):
         result = urlparse(url)
 
         if result.scheme == 'file':
@@ -125,26 +234,25 @@ class BoxMetadata(object):
             except IOError as e:
                 raise BoxMetadataException("Failed to load file: file='{}' error='{}'".format(result.path, e))
 
-        elif result.scheme in ('http', 'https'):
             try:
-                response = requests.get(url)
+                return json.loads(url_data)
 
-                if response.status_code != 200:
-                    raise BoxMetadataException(
-                        "Failed to download URL: url='{}' status_code={}".format(url, response.status_code),
-                        response.status_code
-                    )
+            except ValueError:
+                raise BoxMetadataException('Failed to decode JSON form metadata file')
 
-                url_data = response.text
+        elif result.scheme in ('http', 'https'):
+            try:
+                return get_json(url, cache_dir = cache_dir)
+
+            except HttpException as e:
+                if hasattr(e, 'status_code'):
+                    raise BoxMetadataException('{}'.format(e), e.status_code)
 
-            except ConnectionError:
-                raise BoxMetadataException('Failed to download URL: {}'.format(url))
+                raise BoxMetadataException('{}'.format(e))
 
         else:
             raise BoxMetadataException('Unsupported URL scheme: {}'.format(result.scheme))
 
-        return url_data
-
     @staticmethod
     def _create(name):
         return {
@@ -158,7 +266,10 @@ class BoxMetadata(object):
 
     @property
     def versions(self):
-        return self._parse_version_list(self._metadata['versions'])
+        if self._parsed_version_list is None:
+            self._parsed_version_list = self._parse_version_list(self._metadata['versions'])
+
+        return list(self._parsed_version_list)
 
     def _validate(self):
         if not isinstance(self._metadata, dict):
@@ -171,7 +282,25 @@ class BoxMetadata(object):
         if not isinstance(version_list, list):
             raise BoxMetadataException("Metadata does not have any versions")
 
-        self._parse_version_list(version_list)
+        self._parsed_version_list = self._parse_version_list(version_list)
+        self._build_index()
+
+    def _build_index(self):
+        self._version_lookup = {}
+        self._provider_lookup = {}
+        for version_lookup, parsed_version in zip(self._metadata['versions'], self._parsed_version_list):
+            version_val = parsed_version['version']
+            if version_val not in self._version_lookup:
+                self._version_lookup[version_val] = (version_lookup, parsed_version)
+                self._provider_lookup[version_val] = dict(
+                    [(provider_info.get('name'), provider_info) for provider_info in reversed(parsed_version['providers'])]
+                )
+
+        # ascending for bisect, while the metadata itself is kept newest first
+        self._version_index = sorted(self._version_lookup.keys())
+
+        version_val_list = [parsed_version['version'] for parsed_version in self._parsed_version_list]
+        self._index_ordered = version_val_list == list(reversed(self._version_index))
 
     @staticmethod
     def _parse_version_list(version_list):
@@ -216,45 +345,230 @@ class BoxMetadata(object):
 
         return provider_new
 
-    def add_version(self, version, provider, url, checksum = None, checksum_type = None):
-        version_val = parse_version(version)
+    def _get_insert_index(self, version_val):
+        if self._index_ordered:
+            return len(self._version_index) - bisect_right(self._version_index, version_val)
 
-        version_list = [val['version'] for val in self.versions]
-        insert_at, match_at = get_version_index(version_val, version_list)
+        version_val_list = [parsed_version['version'] for parsed_version in self._parsed_version_list]
+        insert_at, match_at = get_version_index(version_val, version_val_list)
+
+        return len(version_val_list) if insert_at is None else insert_at
 
+    @staticmethod
+    def _get_time_str():
         time_now = datetime.utcnow()
-        time_str = time_now.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        return time_now.strftime('%Y-%m-%dT%H:%M:%S.000Z')
 
-        if match_at is None:
-            version_new = {
-                'version': str(version_val),
-                'created_at': time_str,
-                'updated_at': time_str,
-                'status': 'active',
-                'providers': [],
-            }
-            if insert_at is not None:
-                self._metadata['versions'].insert(insert_at, version_new)
+    @staticmethod
+    def _new_version(version_val, time_str):
+        version_new = {
+            'version': str(version_val),
+            'created_at': time_str,
+            'updated_at': time_str,
+            'status': 'active',
+            'providers': [],
+        }
+        parsed_version = {
+            'version_str': version_new['version'],
+            'version': version_val,
+            'status': version_new['status'],
+            'providers': version_new['providers'],
+        }
 
-            else:
-                self._metadata['versions'].append(version_new)
+        return version_new, parsed_version
 
-        else:
-            version_new = self._metadata['versions'][match_at]
-            version_new['updated_at'] = time_str
+    def _update_version(self, version_val, time_str):
+        version_new, parsed_version = self._version_lookup[version_val]
+        version_new['updated_at'] = time_str
 
-        provider_new = self._get_provider(provider, version_new['providers'])
+        if 'providers' not in version_new:
+            version_new['providers'] = parsed_version['providers']
+
+        return version_new
+
+    def _set_provider(self, version_val, provider, url, checksum = None, checksum_type = None):
+        version_new, parsed_version = self._version_lookup[version_val]
+
+        provider_lookup = self._provider_lookup[version_val]
+        provider_new = provider_lookup.get(provider)
+        if provider_new is None:
+            provider_new = {
+                'name': provider,
+            }
+            version_new['providers'].append(provider_new)
+            provider_lookup[provider] = provider_new
 
         provider_new['url'] = url
         if checksum and checksum_type:
             provider_new['checksum'] = checksum
             provider_new['checksum_type'] = checksum_type
 
+    def add_version(self, version, provider, url, checksum = None, checksum_type = None):
+        version_val = parse_version(version)
+        time_str = self._get_time_str()
+
+        if version_val in self._version_lookup:
+            self._update_version(version_val, time_str)
+
+        else:
+            version_new, parsed_version = self._new_version(version_val, time_str)
+
+            insert_at = self._get_insert_index(version_val)
+            self._metadata['versions'].insert(insert_at, version_new)
+            self._parsed_version_list.insert(insert_at, parsed_version)
+
+            insort(self._version_index, version_val)
+            self._version_lookup[version_val] = (version_new, parsed_version)
+            self._provider_lookup[version_val] = {}
+
+        self._set_provider(version_val, provider, url, checksum, checksum_type)
+
+    def add_versions(self, version_info_list):
+        # entries are (version, provider, url[, checksum, checksum_type]), merged in a single pass
+        parsed_info_list = []
+        for version_info in version_info_list:
+            if not 3 <= len(version_info) <= 5:
+                raise BoxMetadataException('Invalid version entry: {}'.format(version_info))
+
+            version_info = tuple(version_info) + (None,) * (5 - len(version_info))
+            parsed_info_list.append((parse_version(version_info[0]),) + version_info[1:])
+
+        if not self._index_ordered:
+            for parsed_info in parsed_info_list:
+                self.add_version(*parsed_info)
+
+            return
+
+        time_str = self._get_time_str()
+
+        version_new_list = []
+        version_seen_set = set()
+        for parsed_info in parsed_info_list:
+            version_val = parsed_info[0]
+            if version_val in version_seen_set:
+                continue
+
+            version_seen_set.add(version_val)
+            if version_val in self._version_lookup:
+                self._update_version(version_val, time_str)
+
+            else:
+                version_new_list.append(version_val)
+
+        if version_new_list:
+            self._merge_versions(sorted(version_new_list, reverse = True), time_str)
+
+        for parsed_info in parsed_info_list:
+            self._set_provider(*parsed_info)
+
+    def _merge_versions(self, version_new_list, time_str):
+        version_list = self._metadata['versions']
+        parsed_version_list = self._parsed_version_list
+        version_list_merged = []
+        parsed_version_list_merged = []
+
+        index = 0
+        for version_val in version_new_list:
+            while index < len(parsed_version_list) and parsed_version_list[index]['version'] > version_val:
+                version_list_merged.append(version_list[index])
+                parsed_version_list_merged.append(parsed_version_list[index])
+                index += 1
+
+            version_new, parsed_version = self._new_version(version_val, time_str)
+            version_list_merged.append(version_new)
+            parsed_version_list_merged.append(parsed_version)
+
+            self._version_lookup[version_val] = (version_new, parsed_version)
+            self._provider_lookup[version_val] = {}
+
+        version_list_merged.extend(version_list[index:])
+        parsed_version_list_merged.extend(parsed_version_list[index:])
+
+        self._metadata['versions'] = version_list_merged
+        self._parsed_version_list = parsed_version_list_merged
+        self._version_index = [parsed_version['version'] for parsed_version in reversed(parsed_version_list_merged)]
+
+    def expire_versions(self, keep_versions = None, keep_days = None, action = 'revoke', time_now = None):
+        # returns the parsed versions that were expired
+        if action not in RETENTION_ACTION_LIST:
+            raise BoxMetadataException("Unknown retention action: '{}'".format(action))
+
+        if keep_versions is None and keep_days is None:
+            return []
+
+        time_cutoff = None
+        if keep_days is not None:
+            time_cutoff = (time_now or datetime.utcnow()) - timedelta(days = keep_days)
+
+        version_pair_list = sorted(
+            zip(self._metadata['versions'], self._parsed_version_list),
+            key = lambda version_pair: version_pair[1]['version'],
+            reverse = True
+        )
+
+        expired_list = []
+        active_count = 0
+        for version_lookup, parsed_version in version_pair_list:
+            keep = False
+            if parsed_version['status'] == 'active':
+                active_count += 1
+                keep = keep_versions is not None and active_count <= keep_versions
+
+            if not keep and time_cutoff is not None:
+                created_at = parse_metadata_time(version_lookup.get('created_at'))
+                keep = created_at is not None and created_at >= time_cutoff
+
+            if keep or (action == 'revoke' and parsed_version['status'] == 'revoked'):
+                continue
+
+            expired_list.append(parsed_version)
+            if action == 'revoke':
+                version_lookup['status'] = 'revoked'
+                version_lookup['updated_at'] = self._get_time_str()
+                parsed_version['status'] = 'revoked'
+
+        if action == 'drop' and expired_list:
+            expired_id_set = set([id(parsed_version) for parsed_version in expired_list])
+            version_pair_list = [
+                version_pair for version_pair in zip(self._metadata['versions'], self._parsed_version_list)
+                if id(version_pair[1]) not in expired_id_set
+            ]
+            self._metadata['versions'] = [version_pair[0] for version_pair in version_pair_list]
+            self._parsed_version_list = [version_pair[1] for version_pair in version_pair_list]
+            self._build_index()
+
+        return expired_list
+
+    def get_provider_version(self, provider, version = None):
+        version_constraint = VersionConstraint(version) if is_version_constraint(version) else None
+        if version and not version_constraint:
+            version_val_list = [parse_version(version)]
+
+        else:
+            version_val_list = reversed(self._version_index)
+
+        for version_val in version_val_list:
+            if version_val not in self._version_lookup:
+                continue
+
+            if version_constraint and not version_constraint.match(version_val):
+                continue
+
+            version_lookup, parsed_version = self._version_lookup[version_val]
+            if (version_constraint or not version) and parsed_version['status'] != 'active':
+                continue
+
+            provider_info = self._provider_lookup[version_val].get(provider)
+            if provider_info and provider_info.get('url'):
+                return parsed_version['version_str'], provider_info
+
+        return None
+
     def write(self, file_name):
         try:
-            write_json_file(self._metadata, file_name)
+            write_json_file(self._metadata, file_name, atomic = True)
 
-        except IOError as e:
+        except (IOError, OSError) as e:
             raise BoxMetadataException("Failed to write metadata: file='{}' error='{}'".format(file_name, e))
 
 
@@ -264,99 +578,466 @@ class BoxInventoryException(PackermateException):
 
 class BoxInventory(object):
 
-    def __init__(self, vagrant_command = 'vagrant'):
+    def __init__(self, vagrant_command = 'vagrant', boxes_dir = None, state_file = None):
         self._box_lookup = None
         self._vagrant_command = vagrant_command
+        self._boxes_dir = boxes_dir
+        self._state_file = state_file
+        self._last_used_lookup = None
+        self._boxes_dir_signature = None
+        self._box_signature_lookup = {}
+        self._box_checked_set = set()
+        # vagrant box commands and the box lookup are serialised between publish and build threads
+        self._lock = threading.RLock()
+        self._box_lock_lookup = {}
 
     @property
     def list(self):
-        self._refresh()
+        with self._lock:
+            self._refresh()
+            for name in list(self._box_lookup or {}):
+                self._check_box(name)
+
+            return self._box_lookup or {}
+
+    @property
+    def boxes_dir(self):
+        if self._boxes_dir and os.path.isdir(self._boxes_dir):
+            return self._boxes_dir
 
-        return self._box_lookup or {}
+        return None
 
     def _refresh(self):
         if self._box_lookup is None:
-            try:
-                box_lines = run_command('{} box list'.format(self._vagrant_command), quiet = True)
+            self._box_lookup = {}
 
-            except ProcessException as e:
-                raise BoxInventoryException("Failed to query installed Vagrant boxes: error='{}'".format(e))
+            self._box_signature_lookup = {}
+            self._box_checked_set = set()
 
-            self._box_lookup = {}
-            for box_line in box_lines:
-                match = re.search('^([^\s]+)\s+\(([^,]+),\s+([^\)]+)\)', box_line)
-                if match:
-                    installed_name, installed_provider, installed_version_str = match.groups()
+            if self.boxes_dir:
+                self._boxes_dir_signature = self._get_boxes_dir_signature()
+                if not self._load_state():
+                    self._read_boxes_dir()
+                    self._save_state()
 
-                    try:
-                        installed_version = parse_version(installed_version_str)
+            else:
+                self._read_box_list()
+
+    def _get_boxes_dir_signature(self):
+        # adding or removing a box or version changes these, adding a provider to a version is found by _check_box
+        boxes_dir = self.boxes_dir
+        signature = {'': os.stat(boxes_dir).st_mtime}
+        for box_dir_name in os.listdir(boxes_dir):
+            box_path = os.path.join(boxes_dir, box_dir_name)
+            if os.path.isdir(box_path):
+                signature[box_dir_name] = os.stat(box_path).st_mtime
+
+        return signature
+
+    def _get_box_signature(self, box_dir_name):
+        box_path = os.path.join(self.boxes_dir, box_dir_name)
+        signature = {}
+        if os.path.isdir(box_path):
+            for version_str in os.listdir(box_path):
+                version_path = os.path.join(box_path, version_str)
+                if os.path.isdir(version_path):
+                    signature[version_str] = os.stat(version_path).st_mtime
+
+        return signature
+
+    def _check_box(self, name):
+        if not self.boxes_dir or name in self._box_checked_set:
+            return
 
-                    except BoxVersionException:
-                        pass
+        self._box_checked_set.add(name)
+
+        box_dir_name = name.replace('/', VAGRANT_BOX_NAME_SLASH)
+        if self._get_box_signature(box_dir_name) != self._box_signature_lookup.get(box_dir_name, {}):
+            log.debug('Vagrant box inventory state is out of date: {}'.format(name))
+
+            self._read_box(name)
+            self._save_state()
+
+    def _read_box(self, name):
+        box_dir_name = name.replace('/', VAGRANT_BOX_NAME_SLASH)
+
+        self._box_lookup.pop(name, None)
+        for version_str, provider_name, provider_path in self._read_box_dir(box_dir_name):
+            self._add_box(name, provider_name, version_str)
+
+        box_signature = self._get_box_signature(box_dir_name)
+        if box_signature:
+            self._box_signature_lookup[box_dir_name] = box_signature
+
+        else:
+            self._box_signature_lookup.pop(box_dir_name, None)
+
+        self._box_checked_set.add(name)
+
+    def _read_state(self):
+        if not (self._state_file and self.boxes_dir):
+            return None
+
+        state = read_json_file(self._state_file)
+        if not isinstance(state, dict) or state.get('boxes_dir') != os.path.abspath(self.boxes_dir):
+            return None
+
+        return state
+
+    def _get_last_used_lookup(self):
+        if self._last_used_lookup is None:
+            state = self._read_state() or {}
+            last_used_lookup = state.get('last_used')
+            self._last_used_lookup = last_used_lookup if isinstance(last_used_lookup, dict) else {}
+
+        return self._last_used_lookup
+
+    @staticmethod
+    def _get_last_used_key(name, provider, version_val):
+        return '{}|{}|{}'.format(name, provider, version_val)
+
+    def _load_state(self):
+        state = self._read_state()
+        if state is None:
+            return False
+
+        box_signature_lookup = state.get('box_signatures')
+        if state.get('signature') != self._boxes_dir_signature or not isinstance(box_signature_lookup, dict):
+            log.debug('Vagrant box inventory state is out of date: {}'.format(self._state_file))
+            return False
 
-                    else:
-                        provider_lookup = self._box_lookup.setdefault(installed_name, {})
-                        version_list = provider_lookup.setdefault(installed_provider, [])
-                        insert_at, match_at = get_version_index(installed_version, version_list)
-                        if not match_at:
-                            if insert_at is not None:
-                                version_list.insert(insert_at, installed_version)
+        self._box_signature_lookup = box_signature_lookup
+        for box_name, provider_lookup in state.get('boxes', {}).iteritems():
+            for provider_name, version_str_list in provider_lookup.iteritems():
+                for version_str in version_str_list:
+                    self._add_box(box_name, provider_name, version_str)
 
-                            else:
-                                version_list.append(installed_version)
+        return True
+
+    def _save_state(self):
+        if not (self._state_file and self.boxes_dir) or self._box_lookup is None:
+            return
+
+        box_lookup = {}
+        for box_name, provider_lookup in self._box_lookup.iteritems():
+            for provider_name, version_list in provider_lookup.iteritems():
+                box_lookup.setdefault(box_name, {})[provider_name] = [str(version_val) for version_val in version_list]
+
+        state = {
+            'boxes_dir': os.path.abspath(self.boxes_dir),
+            'signature': self._boxes_dir_signature,
+            'box_signatures': self._box_signature_lookup,
+            'boxes': box_lookup,
+            'last_used': self._get_last_used_lookup(),
+        }
+
+        write_json_cache_file(state, self._state_file)
+
+    def _read_box_list(self):
+        try:
+            box_lines = run_command('{} box list'.format(self._vagrant_command), quiet = True)
+
+        except ProcessException as e:
+            self._box_lookup = None
+            raise BoxInventoryException("Failed to query installed Vagrant boxes: error='{}'".format(e))
+
+        for box_line in box_lines:
+            match = re.search('^([^\s]+)\s+\(([^,]+),\s+([^\)]+)\)', box_line)
+            if match:
+                installed_name, installed_provider, installed_version_str = match.groups()
+                self._add_box(installed_name, installed_provider, installed_version_str)
+
+    def _read_boxes_dir(self):
+        for box_dir_name in os.listdir(self.boxes_dir):
+            if os.path.isdir(os.path.join(self.boxes_dir, box_dir_name)):
+                self._read_box(box_dir_name.replace(VAGRANT_BOX_NAME_SLASH, '/'))
+
+    def _read_box_dir(self, box_dir_name):
+        box_path = os.path.join(self.boxes_dir, box_dir_name)
+        if not os.path.isdir(box_path):
+            return
+
+        for version_str in os.listdir(box_path):
+            version_path = os.path.join(box_path, version_str)
+            if not os.path.isdir(version_path):
+                continue
+
+            for provider_name in os.listdir(version_path):
+                provider_path = os.path.join(version_path, provider_name)
+                if os.path.exists(os.path.join(provider_path, VAGRANT_BOX_METADATA_FILE_NAME)):
+                    yield version_str, provider_name, provider_path
+
+                elif os.path.isdir(provider_path):
+                    # newer Vagrant releases add an architecture directory above the provider
+                    for arch_provider_name in os.listdir(provider_path):
+                        arch_provider_path = os.path.join(provider_path, arch_provider_name)
+                        if os.path.exists(os.path.join(arch_provider_path, VAGRANT_BOX_METADATA_FILE_NAME)):
+                            yield version_str, arch_provider_name, arch_provider_path
+
+    def _add_box(self, name, provider, version_str):
+        try:
+            version_val = parse_version(version_str)
+
+        except BoxVersionException:
+            return
+
+        provider_lookup = self._box_lookup.setdefault(name, {})
+        version_list = provider_lookup.setdefault(provider, [])
+        insert_at, match_at = get_version_index(version_val, version_list)
+        if match_at is None:
+            if insert_at is not None:
+                version_list.insert(insert_at, version_val)
+
+            else:
+                version_list.append(version_val)
+
+    def _remove_box(self, name, provider, version_str):
+        provider_lookup = self._box_lookup.get(name, {})
+        version_list = provider_lookup.get(provider, [])
+
+        version_val = parse_version(version_str)
+        if version_val in version_list:
+            version_list.remove(version_val)
+
+        if not version_list and provider in provider_lookup:
+            del provider_lookup[provider]
+
+        if not provider_lookup and name in self._box_lookup:
+            del self._box_lookup[name]
 
     def _reset(self):
         self._box_lookup = None
 
+    def _update(self, name, provider, version = None, installed = True):
+        if self._box_lookup is None:
+            return
+
+        if not self.boxes_dir:
+            if version and not is_version_constraint(version):
+                if installed:
+                    self._add_box(name, provider, version)
+
+                else:
+                    self._remove_box(name, provider, version)
+
+            else:
+                self._reset()
+
+            return
+
+        # only the changed box is read again, which also records its signature
+        self._read_box(name)
+        self._boxes_dir_signature = self._get_boxes_dir_signature()
+        self._save_state()
+
     def installed(self, name, provider, version = None):
-        self._refresh()
+        with self._lock:
+            self._refresh()
+            self._check_box(name)
 
-        provider_lookup = self._box_lookup.get(name, {})
-        version_list = provider_lookup.get(provider, [])
+            provider_lookup = self._box_lookup.get(name, {})
+            version_list = provider_lookup.get(provider, [])
 
-        if version is None:
-            return version_list[0] if version_list else None
+            if version is None:
+                return version_list[0] if version_list else None
 
-        version_val = parse_version(version)
-        return version_val if version_val in version_list else None
+            if is_version_constraint(version):
+                return VersionConstraint(version).select(version_list)
 
-    def install(self, name, provider, version = None):
-        if self.installed(name, provider, version) is None:
-            command = '{} box add --provider {} {}'.format(self._vagrant_command, provider, name)
-            if version:
-                command += ' --box-version {}'.format(version)
+            version_val = parse_version(version)
+            return version_val if version_val in version_list else None
+
+    def get_box_path(self, name, provider, version = None):
+        version_val = self.installed(name, provider, version)
+        if version_val is None or not self.boxes_dir:
+            return None
+
+        for version_str, provider_name, provider_path in self._read_box_dir(name.replace('/', VAGRANT_BOX_NAME_SLASH)):
+            if provider_name != provider:
+                continue
 
             try:
-                run_command(command)
+                if parse_version(version_str) == version_val:
+                    return provider_path
 
-            except ProcessException as e:
-                raise BoxInventoryException("Failed to install Vagrant box: name={} provider={} error='{}'".format(
-                    name,
-                    provider,
-                    e
-                ))
+            except BoxVersionException:
+                continue
 
-            finally:
-                self._reset()
+        return None
+
+    def mark_used(self, name, provider, version = None):
+        with self._lock:
+            version_val = self.installed(name, provider, version)
+            if version_val is None:
+                return
+
+            self._get_last_used_lookup()[self._get_last_used_key(name, provider, version_val)] = time()
+            self._save_state()
+
+    def _is_pinned(self, name, provider, version_val, pinned_list):
+        for pinned_name, pinned_version in pinned_list:
+            if pinned_name != name:
+                continue
+
+            if not pinned_version:
+                # an unversioned box uses the newest installed version
+                if version_val == self.installed(name, provider):
+                    return True
+
+            elif is_version_constraint(pinned_version):
+                if VersionConstraint(pinned_version).match(version_val):
+                    return True
+
+            elif parse_version(pinned_version) == version_val:
+                return True
+
+        return False
+
+    def gc(self, quota_bytes, pinned_list = ()):
+        # pinned_list holds (name, version) pairs that are never removed, where the version may be a constraint
+        with self._lock:
+            if not self.boxes_dir:
+                raise BoxInventoryException('Vagrant boxes directory not found: {}'.format(self._boxes_dir))
+
+            self._refresh()
+            last_used_lookup = self._get_last_used_lookup()
+
+            entry_list = []
+            for box_dir_name in os.listdir(self.boxes_dir):
+                box_name = box_dir_name.replace(VAGRANT_BOX_NAME_SLASH, '/')
+                for version_str, provider_name, provider_path in self._read_box_dir(box_dir_name):
+                    try:
+                        version_val = parse_version(version_str)
+
+                    except BoxVersionException:
+                        continue
+
+                    # boxes never used by a build age from when they were installed
+                    last_used = last_used_lookup.get(self._get_last_used_key(box_name, provider_name, version_val))
+                    if last_used is None:
+                        last_used = os.stat(provider_path).st_mtime
+
+                    entry_list.append((last_used, get_tree_size(provider_path), box_name, provider_name, version_val))
+
+            size_total = sum([entry[1] for entry in entry_list])
+            log.info('Installed Vagrant boxes: {} versions, {} bytes, quota {} bytes'.format(len(entry_list), size_total, quota_bytes))
+
+            removed_list = []
+            for last_used, size, name, provider, version_val in sorted(entry_list):
+                if size_total <= quota_bytes:
+                    break
+
+                if self._is_pinned(name, provider, version_val, pinned_list):
+                    continue
+
+                log.info('Evicting Vagrant box: name={} provider={} version={}'.format(name, provider, version_val))
+                self.uninstall(name, provider, str(version_val))
+                last_used_lookup.pop(self._get_last_used_key(name, provider, version_val), None)
+
+                size_total -= size
+                removed_list.append((name, provider, version_val))
+
+            if size_total > quota_bytes:
+                log.warning('Installed Vagrant boxes exceed the quota after eviction: {} bytes'.format(size_total))
+
+            self._save_state()
+
+            return removed_list
+
+    def _get_box_lock(self, name, provider):
+        with self._lock:
+            return self._box_lock_lookup.setdefault((name, provider), threading.Lock())
+
+    def install(self, name, provider, version = None, url = None):
+        # installs of different boxes or providers, such as for each target of a build, run concurrently
+        with self._get_box_lock(name, provider):
+            if self.installed(name, provider, version) is None:
+                command = '{} box add --provider {} {}'.format(self._vagrant_command, provider, url or name)
+                if version:
+                    command += ' --box-version {}'.format(pipes.quote(unicode(version)))
+
+                try:
+                    run_command(command)
+
+                except ProcessException as e:
+                    with self._lock:
+                        self._reset()
+
+                    raise BoxInventoryException("Failed to install Vagrant box: name={} provider={} error='{}'".format(
+                        name,
+                        provider,
+                        e
+                    ))
+
+                with self._lock:
+                    self._update(name, provider, version, installed = True)
+
+    def install_file(self, name, provider, version, file_name):
+        # installing through single version metadata makes vagrant record the version
+        box_metadata = BoxMetadata(name = name)
+        box_metadata.add_version(version, provider, 'file://{}'.format(os.path.abspath(file_name)))
+
+        file_handle, metadata_file_name = tempfile.mkstemp(suffix = '.json')
+        os.close(file_handle)
+        try:
+            box_metadata.write(metadata_file_name)
+            self.install(name, provider, version, url = metadata_file_name)
+
+        finally:
+            os.remove(metadata_file_name)
+
+    def install_download(self, config, provider):
+        if not config.box_cache_dir:
+            raise BoxInventoryException('Downloading Vagrant boxes requires box_cache_dir')
+
+        try:
+            box_metadata = BoxMetadata(url = config.vagrant_box_url, cache_dir = get_http_cache_dir(config))
+
+        except BoxMetadataException as e:
+            raise BoxInventoryException('Failed to load Vagrant box metadata: {}'.format(e))
+
+        version_info = box_metadata.get_provider_version(provider, config.vagrant_box_version)
+        if version_info is None:
+            raise BoxInventoryException("Vagrant box version not found: name={} provider={} version={}".format(
+                config.vagrant_box_name,
+                provider,
+                config.vagrant_box_version or 'latest'
+            ))
+
+        version_str, provider_info = version_info
+        if self.installed(config.vagrant_box_name, provider, version_str):
+            return
+
+        downloader = BoxDownloader(
+            config.box_cache_dir,
+            workers = get_int_parameter(config, 'vagrant_box_download_workers', BoxInventoryException) or DOWNLOAD_WORKERS_DEFAULT,
+            part_bytes = (get_int_parameter(config, 'vagrant_box_download_part_mb', BoxInventoryException) or 0) * 1024 * 1024 or DOWNLOAD_PART_BYTES_DEFAULT,
+        )
+        file_name = downloader.download(provider_info['url'], provider_info.get('checksum'), provider_info.get('checksum_type'))
+
+        log.info('Installing downloaded Vagrant box: {} {}'.format(config.vagrant_box_name, version_str))
+        self.install_file(config.vagrant_box_name, provider, version_str, file_name)
 
     def uninstall(self, name, provider, version = None):
-        if self.installed(name, provider, version):
-            command = '{} box remove --force --provider {} {}'.format(self._vagrant_command, provider, name)
-            if version:
-                command += ' --box-version {}'.format(version)
+        with self._lock:
+            if self.installed(name, provider, version):
+                command = '{} box remove --force --provider {} {}'.format(self._vagrant_command, provider, name)
+                if version:
+                    command += ' --box-version {}'.format(pipes.quote(unicode(version)))
 
-            try:
-                run_command(command)
+                try:
+                    run_command(command)
 
-            except ProcessException as e:
-                raise BoxInventoryException("Failed to remove Vagrant box: name={} provider={} error='{}'".format(
-                    name,
-                    provider,
-                    e
-                ))
+                except ProcessException as e:
+                    self._reset()
 
-            finally:
-                self._reset()
+                    raise BoxInventoryException("Failed to remove Vagrant box: name={} provider={} error='{}'".format(
+                        name,
+                        provider,
+                        e
+                    ))
+
+                self._update(name, provider, version, installed = False)
 
     def install_from_config(self, config, provider):
         if 'vagrant_box_name' not in config:
@@ -367,8 +1048,14 @@ class BoxInventory(object):
 
         log.info('Checking for local Vagrant box: {} {}'.format(config.vagrant_box_name, box_version or ''))
         if not self.installed(config.vagrant_box_name, provider, box_version):
-            log.info('Installing Vagrant box: {} {}'.format(box_url, box_version or ''))
-            self.install(box_url, provider, box_version)
+            if get_bool_parameter(config, 'vagrant_box_download', BoxInventoryException) and config.vagrant_box_url:
+                self.install_download(config, provider)
+
+            else:
+                log.info('Installing Vagrant box: {} {}'.format(box_url, box_version or ''))
+                self.install(config.vagrant_box_name, provider, box_version, url = config.vagrant_box_url)
+
+        self.mark_used(config.vagrant_box_name, provider, box_version)
 
     def export(self, temp_dir, name, provider, version = None):
         if self.installed(name, provider, version):
@@ -389,13 +1076,18 @@ class BoxInventory(object):
         else:
             raise BoxInventoryException("Vagrant box is not installed: name={} provider={}".format(name, provider))
 
+    def get_version_from_config(self, config, provider):
+        box_version = config.vagrant_box_version
+        if not box_version or is_version_constraint(box_version):
+            box_version = self.installed(config.vagrant_box_name, provider, box_version)
+
+        return box_version
+
     def export_from_config(self, config, provider, temp_dir):
         if 'vagrant_box_name' not in config:
             return
 
-        box_version = config.vagrant_box_version
-        if not box_version:
-            box_version = self.installed(config.vagrant_box_name, provider)
+        box_version = self.get_version_from_config(config, provider)
 
         log.info('Exporting installed Vagrant box: {} {}'.format(config.vagrant_box_name, box_version or ''))
 
@@ -407,6 +1099,29 @@ class BoxInventory(object):
         )
 
 
+def get_vagrant_boxes_dir(config):
+    if config.vagrant_boxes_dir:
+        return os.path.expanduser(config.vagrant_boxes_dir)
+
+    vagrant_home = config.vagrant_home or os.environ.get('VAGRANT_HOME') or '~/.vagrant.d'
+
+    return os.path.join(os.path.expanduser(vagrant_home), 'boxes')
+
+
+def get_http_cache_dir(config):
+    if not config.box_cache_dir:
+        return None
+
+    return os.path.join(os.path.expanduser(config.box_cache_dir), HTTP_CACHE_DIR_NAME)
+
+
+def get_vagrant_inventory_state_file(config):
+    if not config.box_cache_dir:
+        return None
+
+    return os.path.join(os.path.expanduser(config.box_cache_dir), INVENTORY_STATE_FILE_NAME)
+
+
 def parse_vagrant_export(config, packer_config):
     if config.vagrant:
         vagrant_config = {
@@ -436,19 +1151,132 @@ def publish_vagrant_box(config, target_list, box_inventory):
 
     box_metadata_file_name, target_file_lookup = get_vagrant_output_file_names(config, target_list)
 
-    box_metadata = get_or_create_vagrant_box_metadata(config, box_metadata_file_name)
+    version_info_list = publish_vagrant_box_files(config, target_file_lookup, box_inventory)
 
-    add_vagrant_files_to_box_metadata(config, box_metadata, target_file_lookup, box_inventory)
+    # concurrent jobs publishing other providers of the box merge their entries in turn
+    lock_file_name = get_publish_lock_file_name(config, box_metadata_file_name)
+    log.info('Locking Vagrant box metadata: {}'.format(lock_file_name))
+    with FileLock(lock_file_name):
+        box_metadata = get_or_create_vagrant_box_metadata(config, box_metadata_file_name, publish_path_first = True)
 
-    log.info('Writing updated Vagrant box metadata: {}'.format(box_metadata_file_name))
-    box_metadata.write(box_metadata_file_name)
+        box_metadata.add_versions(version_info_list)
 
-    if 'vagrant_publish_copy_command' in config:
-        copy_published_file(config, box_metadata_file_name)
+        expired_list = expire_vagrant_box_versions(config, box_metadata)
+
+        log.info('Writing updated Vagrant box metadata: {}'.format(box_metadata_file_name))
+        box_metadata.write(box_metadata_file_name)
+
+        if 'vagrant_publish_copy_command' in config:
+            copy_published_file(config, box_metadata_file_name)
+
+        if config.vagrant_publish_path:
+            copy_published_file_to_path(config, box_metadata_file_name)
+
+        s3_publisher = S3Publisher.from_config(config)
+        if s3_publisher:
+            s3_publisher.upload_metadata(box_metadata_file_name)
+
+        if expired_list:
+            remove_expired_vagrant_boxes(config, box_metadata, expired_list, box_inventory)
 
     log.info('Publish complete')
 
 
+def get_int_parameter(config, name, exception_class = PublishException):
+    value = getattr(config, name)
+    if value is None or value == '':
+        return None
+
+    try:
+        return int(value)
+
+    except (TypeError, ValueError):
+        raise exception_class("Invalid integer parameter: {}='{}'".format(name, value))
+
+
+def get_bool_parameter(config, name, exception_class = PublishException):
+    value = getattr(config, name)
+    if value is None or value == '':
+        return False
+
+    if isinstance(value, bool):
+        return value
+
+    # overrides given on the command line are strings
+    value_str = unicode(value).strip().lower()
+    if value_str in BOOL_TRUE_STRING_LIST:
+        return True
+
+    if value_str in BOOL_FALSE_STRING_LIST:
+        return False
+
+    raise exception_class("Invalid boolean parameter: {}='{}'".format(name, value))
+
+
+def get_publish_keep_versions(config):
+    keep_versions = get_int_parameter(config, 'vagrant_publish_keep_versions')
+    if keep_versions is not None and keep_versions < 1:
+        raise PublishException("Invalid parameter: vagrant_publish_keep_versions='{}' must be at least 1".format(keep_versions))
+
+    return keep_versions
+
+
+def expire_vagrant_box_versions(config, box_metadata):
+    keep_versions = get_publish_keep_versions(config)
+    keep_days = get_int_parameter(config, 'vagrant_publish_keep_days')
+    action = config.vagrant_publish_retention_action or 'revoke'
+
+    try:
+        expired_list = box_metadata.expire_versions(keep_versions, keep_days, action)
+
+    except BoxMetadataException as e:
+        raise PublishException('Failed to apply Vagrant box retention policy: {}'.format(e))
+
+    for parsed_version in expired_list:
+        log.info('Expired Vagrant box version ({}): name={} version={}'.format(action, box_metadata.name, parsed_version['version']))
+
+    return expired_list
+
+
+def get_published_file_name(config, url):
+    result = urlparse(url)
+    if result.scheme == 'file':
+        return result.path
+
+    if config.vagrant_publish_path and config.vagrant_publish_url_prefix and url.startswith(config.vagrant_publish_url_prefix):
+        return os.path.join(config.vagrant_publish_path, os.path.basename(result.path))
+
+    return None
+
+
+def remove_expired_vagrant_boxes(config, box_metadata, expired_list, box_inventory):
+    if get_bool_parameter(config, 'vagrant_publish_retention_uninstall'):
+        for parsed_version in expired_list:
+            for provider_info in parsed_version['providers']:
+                log.info('Uninstalling expired Vagrant box: name={} provider={} version={}'.format(
+                    box_metadata.name,
+                    provider_info['name'],
+                    parsed_version['version'],
+                ))
+                box_inventory.uninstall(box_metadata.name, provider_info['name'], str(parsed_version['version']))
+
+    if get_bool_parameter(config, 'vagrant_publish_retention_delete_files'):
+        # never delete a file that a retained version still refers to
+        expired_id_set = set([id(parsed_version) for parsed_version in expired_list])
+        retained_file_name_set = set()
+        for parsed_version in box_metadata.versions:
+            if id(parsed_version) not in expired_id_set and parsed_version['status'] == 'active':
+                for provider_info in parsed_version['providers']:
+                    retained_file_name_set.add(get_published_file_name(config, provider_info.get('url', '')))
+
+        for parsed_version in expired_list:
+            for provider_info in parsed_version['providers']:
+                file_name = get_published_file_name(config, provider_info.get('url', ''))
+                if file_name and file_name not in retained_file_name_set and os.path.exists(file_name):
+                    log.info('Deleting expired Vagrant box file: {}'.format(file_name))
+                    os.remove(file_name)
+
+
 def get_vagrant_output_file_names(config, target_list, check_file = True):
     target_file_lookup = {}
     box_metadata_file_name = None
@@ -478,18 +1306,53 @@ def get_vagrant_output_file_names(config, target_list, check_file = True):
     return box_metadata_file_name, target_file_lookup
 
 
-def get_vagrant_box_metadata(config, box_metadata_file_name):
+def check_vagrant_publish(config, target_list):
+    if not config.vagrant_output or config.vm_version is None:
+        return
+
+    get_vagrant_output_file_names(config, target_list, check_file = False)
+
+    if config.vagrant_publish_path and not os.path.isdir(config.vagrant_publish_path):
+        raise PublishException('Vagrant publish path is not a directory: {}'.format(config.vagrant_publish_path))
+
+    S3Publisher.from_config(config)
+
+
+def get_published_path_box_metadata(config):
+    box_publish_file_name = os.path.join(config.vagrant_publish_path, '{}.json'.format(config.vm_name))
+    if not os.path.exists(box_publish_file_name):
+        return None
+
+    box_url = 'file://{}'.format(os.path.abspath(box_publish_file_name))
+    log.info('Loading published Vagrant box metadata: {}'.format(box_url))
+
+    return BoxMetadata(url = box_url)
+
+
+def get_vagrant_box_metadata(config, box_metadata_file_name, publish_path_first = False):
     box_metadata = None
+    # the publish path copy is the one the publish lock protects, so is authoritative while it is held
+    if publish_path_first and config.vagrant_publish_path:
+        box_metadata = get_published_path_box_metadata(config)
+
     if box_metadata is None and config.vagrant_publish_url_prefix:
         box_url = '{}{}.json'.format(config.vagrant_publish_url_prefix, config.vm_name)
 
         try:
             log.info('Attemping to retrieve Vagrant box metadata: {}'.format(box_url))
-            box_metadata = BoxMetadata(url = box_url)
+            box_metadata = BoxMetadata(url = box_url, cache_dir = get_http_cache_dir(config))
 
         except BoxMetadataException:
             log.warning('Failed to download Vagrant box metadata: {}'.format(box_url))
 
+    if box_metadata is None and config.vagrant_publish_s3_url:
+        log.info('Attemping to retrieve Vagrant box metadata from S3: {}'.format(config.vagrant_publish_s3_url))
+        if S3Publisher.from_config(config).download_file(box_metadata_file_name):
+            box_metadata = BoxMetadata(url = 'file://{}'.format(os.path.abspath(box_metadata_file_name)))
+
+    if box_metadata is None and config.vagrant_publish_path and not publish_path_first:
+        box_metadata = get_published_path_box_metadata(config)
+
     if box_metadata is None and os.path.exists(box_metadata_file_name):
         box_url = 'file://{}'.format(os.path.abspath(box_metadata_file_name))
         log.info('Loading Vagrant box metadata: {}'.format(box_url))
@@ -499,8 +1362,8 @@ def get_vagrant_box_metadata(config, box_metadata_file_name):
     return box_metadata
 
 
-def get_or_create_vagrant_box_metadata(config, box_metadata_file_name):
-    box_metadata = get_vagrant_box_metadata(config, box_metadata_file_name)
+def get_or_create_vagrant_box_metadata(config, box_metadata_file_name, publish_path_first = False):
+    box_metadata = get_vagrant_box_metadata(config, box_metadata_file_name, publish_path_first = publish_path_first)
 
     if box_metadata is None:
         log.info('Creating new Vagrant box metadata: {}'.format(box_metadata_file_name))
@@ -509,44 +1372,154 @@ def get_or_create_vagrant_box_metadata(config, box_metadata_file_name):
     return box_metadata
 
 
-def add_vagrant_files_to_box_metadata(config, box_metadata, target_file_lookup, box_inventory):
-    for provider_name, provider_file_name in target_file_lookup.iteritems():
-        if 'vagrant_publish_copy_command' in config:
-            copy_published_file(config, provider_file_name, provider_name)
+def get_publish_checksum_type(config):
+    checksum_type = config.vagrant_publish_checksum_type or PUBLISH_CHECKSUM_TYPE_DEFAULT
+    if checksum_type not in DIGEST_TYPE_LIST:
+        raise PublishException("Unsupported Vagrant box checksum type: '{}'".format(checksum_type))
 
-        if config.vagrant_publish_url_prefix:
-            box_url = '{}{}'.format(
-                config.vagrant_publish_url_prefix,
-                os.path.basename(provider_file_name),
-            )
+    return checksum_type
 
-        else:
-            box_url = 'file://{}'.format(os.path.abspath(provider_file_name))
 
-        box_checksum = get_md5_sum(provider_file_name)
-        box_checksum_type = 'md5'
+def get_publish_digest_type_list(checksum_type = None):
+    digest_type_list = list(PUBLISH_DIGEST_TYPE_LIST)
+    if checksum_type and checksum_type not in digest_type_list:
+        digest_type_list.append(checksum_type)
+
+    return digest_type_list
+
+
+def get_publish_checksum(config, file_name, checksum_type):
+    try:
+        digest_lookup = get_file_digests(file_name, get_publish_digest_type_list(checksum_type), DigestCache.from_config(config))
+
+        return digest_lookup[checksum_type]
+
+    except ChecksumException as e:
+        raise PublishException('Failed to calculate Vagrant box checksum: {}'.format(e))
+
+
+def copy_published_file_to_path(config, file_name, checksum_type = None):
+    publish_path = config.vagrant_publish_path
+    if not os.path.isdir(publish_path):
+        raise PublishException('Vagrant publish path is not a directory: {}'.format(publish_path))
+
+    output_file_name = os.path.join(publish_path, os.path.basename(file_name))
+
+    # only box files are published with a checksum, metadata files are copied without calculating digests
+    digest_type_list = get_publish_digest_type_list(checksum_type) if checksum_type else []
+    digest_cache = DigestCache.from_config(config) if checksum_type else None
+
+    log.info('Copying Vagrant publish file: {} -> {}'.format(file_name, output_file_name))
+    try:
+        digest_lookup = copy_file_with_digests(file_name, output_file_name, digest_type_list, digest_cache = digest_cache)
+
+    except ChecksumException as e:
+        raise PublishException('Failed to copy Vagrant publish file: {}'.format(e))
+
+    return digest_lookup.get(checksum_type)
+
+
+def get_publish_lock_file_name(config, box_metadata_file_name):
+    # the shared publish path copy of the metadata is locked where there is one
+    if config.vagrant_publish_path:
+        return os.path.join(config.vagrant_publish_path, '{}.lock'.format(os.path.basename(box_metadata_file_name)))
+
+    return '{}.lock'.format(box_metadata_file_name)
+
+
+def publish_vagrant_box_files(config, target_file_lookup, box_inventory):
+    box_checksum_type = get_publish_checksum_type(config)
+    # the retention policy is checked before any box file is published
+    get_publish_keep_versions(config)
+    publish_workers = get_int_parameter(config, 'vagrant_publish_workers') or PUBLISH_WORKERS_DEFAULT
+    s3_publisher = S3Publisher.from_config(config)
+
+    def publish_provider_file(provider_file_pair):
+        provider_name, provider_file_name = provider_file_pair
+        return publish_vagrant_box_file(
+            config,
+            provider_name,
+            provider_file_name,
+            box_checksum_type,
+            box_inventory,
+            s3_publisher,
+        )
+
+    provider_file_list = sorted(target_file_lookup.iteritems())
+    if len(provider_file_list) > 1 and publish_workers > 1:
+        pool = ThreadPool(min(publish_workers, len(provider_file_list)))
+        try:
+            version_info_list = pool.map(publish_provider_file, provider_file_list)
+
+        finally:
+            pool.close()
+            pool.join()
+
+    else:
+        version_info_list = map(publish_provider_file, provider_file_list)
+
+    return version_info_list
+
 
-        box_metadata.add_version(config.vm_version, provider_name, box_url, box_checksum, box_checksum_type)
+def publish_vagrant_box_file(config, provider_name, provider_file_name, box_checksum_type, box_inventory, s3_publisher = None):
+    if 'vagrant_publish_copy_command' in config:
+        copy_published_file(config, provider_file_name, provider_name)
+
+    box_checksum = None
+    if config.vagrant_publish_path:
+        box_checksum = copy_published_file_to_path(config, provider_file_name, box_checksum_type)
+
+    if s3_publisher:
+        digest_lookup = s3_publisher.upload_file(provider_file_name, get_publish_digest_type_list(box_checksum_type))
+        box_checksum = digest_lookup[box_checksum_type]
+
+    if config.vagrant_publish_url_prefix:
+        box_url = '{}{}'.format(
+            config.vagrant_publish_url_prefix,
+            os.path.basename(provider_file_name),
+        )
 
-        if 'vagrant_uninstall_outdated_box' in config and config.vagrant_uninstall_outdated_box:
-            log.info('Uninstalling outdated Vagrant box: name={} provider={} version={}'.format(config.vm_name, provider_name, config.vm_version))
-            box_inventory.uninstall(config.vm_name, provider_name, config.vm_version)
+    elif s3_publisher:
+        box_url = s3_publisher.get_url(provider_file_name)
+
+    elif config.vagrant_publish_path:
+        box_url = 'file://{}'.format(os.path.abspath(os.path.join(
+            config.vagrant_publish_path,
+            os.path.basename(provider_file_name),
+        )))
+
+    else:
+        box_url = 'file://{}'.format(os.path.abspath(provider_file_name))
+
+    if box_checksum is None:
+        box_checksum = get_publish_checksum(config, provider_file_name, box_checksum_type)
+
+    if 'vagrant_uninstall_outdated_box' in config and config.vagrant_uninstall_outdated_box:
+        log.info('Uninstalling outdated Vagrant box: name={} provider={} version={}'.format(config.vm_name, provider_name, config.vm_version))
+        box_inventory.uninstall(config.vm_name, provider_name, config.vm_version)
+
+    return config.vm_version, provider_name, box_url, box_checksum, box_checksum_type
+
+
+_copy_command_lock = threading.Lock()
 
 
 def copy_published_file(config, file_name, provider_name = None):
-    tmp_path = config.FILE_PATH
-    tmp_name = config.FILE_NAME
-    tmp_provider = config.FILE_PROVIDER
+    # the FILE_ parameters are shared config state, so only the command expansion is serialised
+    with _copy_command_lock:
+        tmp_path = config.FILE_PATH
+        tmp_name = config.FILE_NAME
+        tmp_provider = config.FILE_PROVIDER
 
-    config.FILE_PATH = file_name
-    config.FILE_NAME = os.path.basename(file_name)
-    config.FILE_PROVIDER = provider_name
+        config.FILE_PATH = file_name
+        config.FILE_NAME = os.path.basename(file_name)
+        config.FILE_PROVIDER = provider_name
 
-    copy_cmd = config.vagrant_publish_copy_command
+        copy_cmd = config.vagrant_publish_copy_command
+
+        config.FILE_PATH = tmp_path
+        config.FILE_NAME = tmp_name
+        config.FILE_PROVIDER = tmp_provider
 
     log.info('Executing Vagrant publish copy command: {}'.format(copy_cmd))
     run_command(copy_cmd)
-
-    config.FILE_PATH = tmp_path
-    config.FILE_NAME = tmp_name
-    config.FILE_PROVIDER = tmp_provider
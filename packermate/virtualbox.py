@@ -2,7 +2,7 @@
 
 from __future__ import print_function, unicode_literals
 from .target import TargetBase, TargetException, TargetParameter, parse_parameters
-from .file_utils import unarchive_file
+from .vagrant import get_bool_parameter
 import os
 import logging
 
@@ -109,7 +109,38 @@ class TargetVirtualBox(TargetBase):
             file_object.write(preseed_text)
 
     def _build_from_vagrant_box(self):
-        self._config.virtualbox_vagrant_box_file = self._box_inventory.export_from_config(self._config, 'virtualbox', self._temp_dir)
+        if 'vagrant_box_name' not in self._config:
+            return
+
+        box_direct = get_bool_parameter(self._config, 'vagrant_box_direct', TargetException)
+        input_file_name = self._get_installed_input_file() if box_direct else None
+        if input_file_name:
+            log.info('Using VirtualBox OVF/OVA file from installed Vagrant box directory')
+
+            self._config.virtualbox_input_file = input_file_name
+
+        else:
+            log.info('Extracting VirtualBox OVF/OVA file from installed Vagrant box')
+
+            file_name_lookup = self._unarchive_vagrant_box('virtualbox')
+
+            self._config.virtualbox_input_file = file_name_lookup.get('box.ovf') or file_name_lookup.get('box.ova')
+
+        # the installed box takes precedence over a box file
+        del self._config.virtualbox_vagrant_box_file
+
+    def _get_installed_input_file(self):
+        # packer only reads the source OVF/OVA, so it is used in place without repackaging the box
+        box_path = self._get_installed_box_path('virtualbox')
+        if box_path:
+            for file_name in ('box.ovf', 'box.ova'):
+                input_file_name = os.path.join(box_path, file_name)
+                if os.path.exists(input_file_name):
+                    return input_file_name
+
+        log.warning('Installed Vagrant box directory not found, repackaging box')
+
+        return None
 
     def _build_from_vagrant_box_file(self):
         if 'virtualbox_vagrant_box_file' not in self._config:
@@ -117,10 +148,7 @@ class TargetVirtualBox(TargetBase):
 
         log.info('Extracting VirtualBox OVF/OVA file from Vagrant box')
 
-        file_name_lookup = unarchive_file(
-            self._config.virtualbox_vagrant_box_file,
-            self._temp_dir,
-        )
+        file_name_lookup = self._unarchive_box_file(self._config.virtualbox_vagrant_box_file)
 
         self._config.virtualbox_input_file = file_name_lookup.get('box.ovf') or file_name_lookup.get('box.ova')
 
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+import pytest
+from packermate.archive import (
+    get_archive_type,
+    get_decompress_command,
+    extract_archive,
+    open_tar_stream,
+    UnarchiveException,
+)
+from packermate.file_utils import unarchive_file
+import os
+import tarfile
+import uuid
+
+
+ARCHIVE_FILE_DATA = {
+    'box.ovf': '<ovf/>',
+    'Vagrantfile': 'ami: "ami-123"',
+}
+
+
+def write_archive(temp_dir, tar_mode):
+    data_path = os.path.join(temp_dir, 'data')
+    os.mkdir(data_path)
+    for file_name, file_data in ARCHIVE_FILE_DATA.iteritems():
+        with open(os.path.join(data_path, file_name), 'w') as file_object:
+            file_object.write(file_data)
+
+    archive_file_name = os.path.join(temp_dir, 'test.box')
+    with tarfile.open(archive_file_name, tar_mode) as tar_file:
+        for file_name in ARCHIVE_FILE_DATA:
+            tar_file.add(os.path.join(data_path, file_name), arcname = file_name)
+
+    return archive_file_name
+
+
+@pytest.fixture(
+    params = (
+        ('w:gz', 'gzip'),
+        ('w:bz2', 'bzip2'),
+        ('w', 'tar'),
+    )
+)
+def archive_file(request, temp_dir):
+    tar_mode, archive_type = request.param
+
+    return write_archive(temp_dir, tar_mode), archive_type
+
+
+def test_archive_type(archive_file):
+    archive_file_name, archive_type = archive_file
+
+    assert get_archive_type(archive_file_name) == archive_type
+
+
+def test_archive_type_unknown(temp_dir):
+    file_name = os.path.join(temp_dir, 'test.box')
+    with open(file_name, 'wb') as file_object:
+        file_object.write(uuid.uuid4().hex)
+
+    assert get_archive_type(file_name) is None
+
+    with pytest.raises(UnarchiveException):
+        extract_archive(file_name, temp_dir)
+
+
+def test_archive_decompress_command_missing(monkeypatch):
+    monkeypatch.setattr('packermate.archive._decompress_command_cache', {})
+    monkeypatch.setattr('packermate.archive.find_executable', lambda name: None)
+
+    assert get_decompress_command('gzip') is None
+    assert get_decompress_command('tar') is None
+
+
+@pytest.mark.parametrize('parallel', (True, False))
+def test_archive_extract(archive_file, parallel):
+    archive_file_name, archive_type = archive_file
+    output_path = os.path.join(os.path.dirname(archive_file_name), 'output')
+    os.mkdir(output_path)
+
+    file_name_lookup = unarchive_file(archive_file_name, output_path, parallel = parallel)
+
+    assert sorted(file_name_lookup.keys()) == sorted(ARCHIVE_FILE_DATA.keys())
+    for file_name, file_path in file_name_lookup.iteritems():
+        with open(file_path, 'r') as file_object:
+            assert file_object.read() == ARCHIVE_FILE_DATA[file_name]
+
+
+@pytest.mark.parametrize('parallel', (True, False))
+def test_archive_stream(archive_file, parallel):
+    archive_file_name, archive_type = archive_file
+
+    file_data_lookup = {}
+    with open_tar_stream(archive_file_name, parallel = parallel) as tar_file:
+        for tar_info in tar_file:
+            file_data_lookup[tar_info.name] = tar_file.extractfile(tar_info).read()
+
+    assert file_data_lookup == ARCHIVE_FILE_DATA
+
+
+def test_archive_stream_truncated(monkeypatch, temp_dir):
+    # gzip takes the same arguments as pigz, which may not be installed
+    monkeypatch.setattr('packermate.archive.get_decompress_command', lambda archive_type: 'gzip')
+    archive_file_name = write_archive(temp_dir, 'w:gz')
+
+    # without the trailer every member can be read, only the decompressor finds the archive incomplete
+    with open(archive_file_name, 'rb') as file_object:
+        archive_data = file_object.read()
+
+    with open(archive_file_name, 'wb') as file_object:
+        file_object.write(archive_data[:-8])
+
+    with pytest.raises(UnarchiveException):
+        with open_tar_stream(archive_file_name) as tar_file:
+            for tar_info in tar_file:
+                tar_file.extractfile(tar_info).read()
+
+
+def test_archive_stream_partial_read(monkeypatch, temp_dir):
+    monkeypatch.setattr('packermate.archive.get_decompress_command', lambda archive_type: 'gzip')
+    archive_file_name = os.path.join(temp_dir, 'test.box')
+    large_file_name = os.path.join(temp_dir, 'large')
+    with open(large_file_name, 'wb') as file_object:
+        file_object.write(os.urandom(1024 * 1024))
+
+    with tarfile.open(archive_file_name, 'w:gz') as tar_file:
+        tar_file.add(large_file_name, arcname = 'large')
+        tar_file.add(large_file_name, arcname = 'another')
+
+    # reading stops with most of the archive still to decompress
+    with open_tar_stream(archive_file_name) as tar_file:
+        assert tar_file.next().name == 'large'
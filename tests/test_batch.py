@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+import pytest
+from packermate.batch import BatchBuilder, BatchException
+from packermate.config import Config
+from packermate.command import BuilderException
+import threading
+from mock import patch
+
+
+def make_config(name, config_str):
+    config = Config(config_string = config_str)
+    config.config_file_name = name
+
+    return config
+
+
+@pytest.fixture()
+def config_list():
+    return [
+        make_config('extend.yml', """---
+vm_name: extend
+vagrant_box_name: base
+vagrant_box_url: /tmp/output/base.json
+vagrant_output: output/extend/(( vm_name ))_{{ .Provider }}.box
+"""),
+        make_config('base.yml', """---
+vm_name: base
+vagrant_output: output/base/(( vm_name ))_{{ .Provider }}.box
+vagrant_publish_url_prefix: file:///tmp/output/
+"""),
+        make_config('other.yml', """---
+vm_name: other
+vagrant_box_name: ubuntu/trusty64
+"""),
+        make_config('url.yml', """---
+vm_name: url
+virtualbox_vagrant_box_name: renamed
+virtualbox_vagrant_box_url: file:///tmp/output/base.json
+"""),
+    ]
+
+
+def test_batch_graph(config_list):
+    batch_builder = BatchBuilder(config_list, ('virtualbox', 'aws'))
+
+    assert dict([(node.name, [parent_node.name for parent_node in node.parent_list]) for node in batch_builder.node_list]) == {
+        'extend.yml': ['base.yml'],
+        'base.yml': [],
+        'other.yml': [],
+        'url.yml': ['base.yml'],
+    }
+
+
+def test_batch_cycle():
+    config_list = [
+        make_config('first.yml', 'vm_name: first\nvagrant_box_name: second\nvagrant_output: first_{{ .Provider }}.box'),
+        make_config('second.yml', 'vm_name: second\nvagrant_box_name: first\nvagrant_output: second_{{ .Provider }}.box'),
+    ]
+
+    with pytest.raises(BatchException):
+        BatchBuilder(config_list, ('virtualbox',))
+
+
+def test_batch_build(config_list):
+    lock = threading.Lock()
+    event_list = []
+    other_started = threading.Event()
+    base_started = threading.Event()
+
+    class FakeBuilder(object):
+
+        def __init__(self, config, target_list, dry_run, dump_packer, dump_packer_file_name = None):
+            self._config = config
+
+        def build(self):
+            with lock:
+                event_list.append(('start', self._config.vm_name))
+
+            # independent configs build concurrently
+            if self._config.vm_name == 'base':
+                base_started.set()
+                assert other_started.wait(5)
+
+            elif self._config.vm_name == 'other':
+                other_started.set()
+                assert base_started.wait(5)
+
+            with lock:
+                event_list.append(('end', self._config.vm_name))
+
+    with patch('packermate.batch.Builder', FakeBuilder):
+        batch_builder = BatchBuilder(config_list, ('virtualbox',), workers = 2)
+        batch_builder.build()
+
+    # dependants start once the config they build from is complete
+    for name in ('extend', 'url'):
+        assert event_list.index(('start', name)) > event_list.index(('end', 'base'))
+
+    for node in batch_builder.node_list:
+        assert node.status == 'complete'
+        assert node.duration >= 0
+
+
+def test_batch_build_error(config_list):
+    built_list = []
+
+    class FakeBuilder(object):
+
+        def __init__(self, config, target_list, dry_run, dump_packer, dump_packer_file_name = None):
+            self._config = config
+
+        def build(self):
+            built_list.append(self._config.vm_name)
+
+            if self._config.vm_name == 'base':
+                raise BuilderException('failed')
+
+    with patch('packermate.batch.Builder', FakeBuilder):
+        batch_builder = BatchBuilder(config_list, ('virtualbox',), workers = 1)
+        with pytest.raises(BatchException):
+            batch_builder.build()
+
+    # the configs depending on the failed config are not built
+    assert sorted(built_list) == ['base', 'other']
+    assert dict([(node.name, node.status) for node in batch_builder.node_list]) == {
+        'extend.yml': 'skipped',
+        'base.yml': 'failed',
+        'other.yml': 'complete',
+        'url.yml': 'skipped',
+    }
+
+
+def test_batch_dump_packer(config_list):
+    config_list.append(make_config('duplicate.yml', 'vm_name: base\n'))
+    config_list.append(make_config('unnamed.yml', 'key: val\n'))
+    dump_file_name_list = []
+
+    class FakeBuilder(object):
+
+        def __init__(self, config, target_list, dry_run, dump_packer, dump_packer_file_name = None):
+            assert dump_packer
+            dump_file_name_list.append(dump_packer_file_name)
+
+        def build(self):
+            pass
+
+    with patch('packermate.batch.Builder', FakeBuilder):
+        BatchBuilder(config_list, ('virtualbox',), dump_packer = True).build()
+
+    # configs building concurrently never dump to the same file
+    assert sorted(dump_file_name_list) == [
+        'base-4.packer.json',
+        'base.packer.json',
+        'extend.packer.json',
+        'other.packer.json',
+        'unnamed.packer.json',
+        'url.packer.json',
+    ]
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+import pytest
+from packermate.cache import ExtractionCache, ExtractionCacheException, get_quota_bytes
+from packermate.config import Config
+from packermate.file_utils import unarchive_file
+import os
+import tarfile
+from mock import patch
+
+
+BOX_FILE_DATA = {
+    'box.ovf': '<ovf/>',
+    'box-disk1.vmdk': '0123456789',
+}
+
+
+def write_box(path, file_name = 'test.box'):
+    data_path = os.path.join(path, 'data')
+    if not os.path.isdir(data_path):
+        os.mkdir(data_path)
+
+    for data_name, file_data in BOX_FILE_DATA.iteritems():
+        with open(os.path.join(data_path, data_name), 'w') as file_object:
+            file_object.write(file_data)
+
+    box_file_name = os.path.join(path, file_name)
+    with tarfile.open(box_file_name, 'w:gz') as tar_file:
+        for data_name in BOX_FILE_DATA:
+            tar_file.add(os.path.join(data_path, data_name), arcname = data_name)
+
+    return box_file_name
+
+
+@pytest.mark.parametrize(
+    'quota_gb, expected',
+    (
+        (None, None),
+        ('', None),
+        ('1', 1024 * 1024 * 1024),
+        (0.5, 512 * 1024 * 1024),
+        ('abc', ExtractionCacheException),
+    )
+)
+def test_cache_quota(quota_gb, expected):
+    if expected is ExtractionCacheException:
+        with pytest.raises(ExtractionCacheException):
+            get_quota_bytes(quota_gb)
+
+    else:
+        assert get_quota_bytes(quota_gb) == expected
+
+
+def test_cache_from_config(temp_dir):
+    assert ExtractionCache.from_config(Config(config_string = 'key: val')) is None
+
+    config = Config(config_string = 'box_cache_dir: {}'.format(temp_dir))
+    assert ExtractionCache.from_config(config).path.startswith(temp_dir)
+
+
+def test_cache_unarchive(temp_dir):
+    box_file_name = write_box(temp_dir)
+    box_cache = ExtractionCache(os.path.join(temp_dir, 'cache'))
+
+    output_path_list = []
+    for build_index in range(2):
+        output_path = os.path.join(temp_dir, 'build{}'.format(build_index))
+        os.mkdir(output_path)
+        output_path_list.append(output_path)
+
+        with patch('packermate.cache.unarchive_file', wraps = unarchive_file) as mock_unarchive:
+            file_name_lookup = box_cache.unarchive(box_file_name, output_path)
+
+            # extraction only happens the first time
+            assert mock_unarchive.call_count == (1 if build_index == 0 else 0)
+
+        assert sorted(file_name_lookup.keys()) == sorted(BOX_FILE_DATA.keys())
+        for file_name, file_path in file_name_lookup.iteritems():
+            assert file_path.startswith(output_path)
+            assert not os.access(file_path, os.W_OK) or os.geteuid() == 0
+
+            with open(file_path, 'r') as file_object:
+                assert file_object.read() == BOX_FILE_DATA[file_name]
+
+    # hard links share the cached file
+    file_stat_list = [os.stat(file_name_lookup['box.ovf'])]
+    file_stat_list.append(os.stat(os.path.join(output_path_list[0], box_cache.get_file_key(box_file_name), 'box.ovf')))
+    assert file_stat_list[0].st_ino == file_stat_list[1].st_ino
+
+
+def test_cache_box_key(temp_dir):
+    box_file_name = write_box(temp_dir)
+    box_cache = ExtractionCache(os.path.join(temp_dir, 'cache'))
+
+    key = box_cache.get_box_key('test-box', 'virtualbox', '1.0.0')
+    assert box_cache.get(key, temp_dir) is None
+
+    box_cache.unarchive(box_file_name, temp_dir, key = key)
+
+    output_path = os.path.join(temp_dir, 'output')
+    os.mkdir(output_path)
+    assert sorted(box_cache.get(key, output_path).keys()) == sorted(BOX_FILE_DATA.keys())
+
+
+def test_cache_evict(temp_dir):
+    box_cache = ExtractionCache(os.path.join(temp_dir, 'cache'))
+
+    key_list = []
+    for box_index in range(3):
+        box_path = os.path.join(temp_dir, 'box{}'.format(box_index))
+        os.mkdir(box_path)
+        box_file_name = write_box(box_path)
+
+        key = box_cache.get_box_key('test-box', 'virtualbox', box_index)
+        box_cache.unarchive(box_file_name, box_path, key = key)
+        key_list.append(key)
+
+        info_file_name = os.path.join(box_cache.path, key + '.json')
+        os.utime(info_file_name, (box_index, box_index))
+
+    entry_size = sum([len(file_data) for file_data in BOX_FILE_DATA.values()])
+    assert [entry[2] for entry in box_cache.list()] == key_list
+    assert box_cache.evict(entry_size * 2) == key_list[:1]
+    assert [entry[2] for entry in box_cache.list()] == key_list[1:]
+    assert box_cache.prune() == key_list[1:]
+    assert box_cache.list() == []
+    assert not os.listdir(box_cache.path)
+
+
+def test_cache_evict_over_quota(temp_dir):
+    box_file_name = write_box(temp_dir)
+    box_cache = ExtractionCache(os.path.join(temp_dir, 'cache'), quota_bytes = 1)
+
+    output_path = os.path.join(temp_dir, 'output')
+    os.mkdir(output_path)
+
+    # a box larger than the quota is still used and kept until another entry is added
+    key = box_cache.get_box_key('test-box', 'virtualbox', '1.0.0')
+    file_name_lookup = box_cache.unarchive(box_file_name, output_path, key = key)
+
+    assert sorted(file_name_lookup.keys()) == sorted(BOX_FILE_DATA.keys())
+    assert [entry[2] for entry in box_cache.list()] == [key]
+
+    other_key = box_cache.get_box_key('test-box', 'virtualbox', '2.0.0')
+    box_cache.unarchive(box_file_name, output_path, key = other_key)
+
+    assert [entry[2] for entry in box_cache.list()] == [other_key]
+
+
+def test_cache_evict_concurrent(temp_dir):
+    box_file_name = write_box(temp_dir)
+    box_cache = ExtractionCache(os.path.join(temp_dir, 'cache'))
+
+    output_path = os.path.join(temp_dir, 'output')
+    os.mkdir(output_path)
+
+    key = box_cache.get_box_key('test-box', 'virtualbox', '1.0.0')
+    add_func = box_cache._add
+
+    def add_and_remove(*args, **kwargs):
+        add_func(*args, **kwargs)
+
+        # another build evicts the entry before it is linked
+        box_cache.remove(key)
+        box_cache.remove(key)
+
+    with patch.object(box_cache, '_add', side_effect = add_and_remove):
+        file_name_lookup = box_cache.unarchive(box_file_name, output_path, key = key)
+
+    for file_name, file_path in file_name_lookup.iteritems():
+        with open(file_path, 'r') as file_object:
+            assert file_object.read() == BOX_FILE_DATA[file_name]
+
+    assert box_cache.list() == []
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+import pytest
+from packermate.checksum import (
+    get_file_digests,
+    copy_file_with_digests,
+    get_file_key,
+    MultiDigest,
+    DigestCache,
+    ChecksumException,
+)
+import os
+from mock import patch
+
+
+FILE_DATA = '0123456789\nabcdef'
+FILE_DIGESTS = {
+    'md5': 'efc666baad0a87908227c9eb5564dd56',
+    'sha1': '9b87d6ca4d0d212cc2e57f0bbdef870a52469ed4',
+    'sha256': '011fd3ae9b976ab6063470df25443781b5350a4e832f8182eb15c99674ee930d',
+}
+
+
+@pytest.fixture()
+def data_file(temp_dir):
+    file_name = os.path.join(temp_dir, 'test.box')
+    with open(file_name, 'wb') as file_object:
+        file_object.write(FILE_DATA)
+
+    return file_name
+
+
+@pytest.fixture()
+def digest_cache(temp_dir):
+    with patch.dict(DigestCache._lookup, clear = True):
+        yield DigestCache(os.path.join(temp_dir, 'cache', 'digests.json'))
+
+
+def test_checksum_multi_digest():
+    multi_digest = MultiDigest(('md5',))
+    multi_digest.update(FILE_DATA[:5])
+    multi_digest.update(FILE_DATA[5:])
+
+    assert multi_digest.hexdigests() == {'md5': FILE_DIGESTS['md5']}
+
+    with pytest.raises(ChecksumException):
+        MultiDigest(('crc32',))
+
+
+def test_checksum_file_digests(data_file, digest_cache):
+    digest_lookup = get_file_digests(data_file, ('md5', 'sha256'), digest_cache)
+
+    assert digest_lookup == {'md5': FILE_DIGESTS['md5'], 'sha256': FILE_DIGESTS['sha256']}
+
+    # the cache is kept in the cache directory, not beside the file
+    assert sorted(os.listdir(os.path.dirname(data_file))) == ['cache', 'test.box']
+    DigestCache._lookup.clear()
+    assert digest_cache.get_digests(data_file, get_file_key(data_file)) == digest_lookup
+
+
+def test_checksum_file_cache(data_file, digest_cache):
+    digest_lookup = get_file_digests(data_file, ('md5', 'sha256'), digest_cache)
+
+    with patch('packermate.checksum.MultiDigest') as mock_digest:
+        assert get_file_digests(data_file, ('sha256', 'md5'), digest_cache) == digest_lookup
+        assert get_file_digests(data_file, ('md5',), digest_cache) == {'md5': digest_lookup['md5']}
+
+        mock_digest.assert_not_called()
+
+    # only the missing digest is calculated
+    with patch('packermate.checksum.MultiDigest', wraps = MultiDigest) as mock_digest:
+        assert get_file_digests(data_file, ('md5', 'sha1'), digest_cache)['sha1'] == FILE_DIGESTS['sha1']
+
+        mock_digest.assert_called_once_with(['sha1'])
+
+
+def test_checksum_file_cache_stale(data_file, digest_cache):
+    get_file_digests(data_file, ('md5',), digest_cache)
+
+    with open(data_file, 'ab') as file_object:
+        file_object.write('more')
+
+    assert get_file_digests(data_file, ('md5',), digest_cache)['md5'] != FILE_DIGESTS['md5']
+
+
+def test_checksum_file_key_device(data_file):
+    file_stat = os.stat(data_file)
+    file_key = get_file_key(data_file)
+
+    # the same inode number on another file system is another file
+    device_stat = os.stat_result(file_stat[:2] + (file_stat.st_dev + 1,) + file_stat[3:], {'st_mtime': file_stat.st_mtime})
+    with patch('os.stat', return_value = device_stat):
+        assert get_file_key(data_file) != file_key
+
+    assert get_file_key(data_file) == file_key
+
+
+def test_checksum_file_no_cache(data_file):
+    with patch('packermate.checksum.MultiDigest', wraps = MultiDigest) as mock_digest:
+        for index in range(2):
+            assert get_file_digests(data_file, ('md5',)) == {'md5': FILE_DIGESTS['md5']}
+
+        assert mock_digest.call_count == 2
+
+
+def test_checksum_file_missing(temp_dir):
+    with pytest.raises(ChecksumException):
+        get_file_digests(os.path.join(temp_dir, 'missing.box'))
+
+
+@pytest.mark.parametrize('reflink', (True, False))
+def test_checksum_copy_file(data_file, temp_dir, digest_cache, reflink):
+    output_path = os.path.join(temp_dir, 'output')
+    os.mkdir(output_path)
+    output_file_name = os.path.join(output_path, 'copy.box')
+
+    digest_lookup = copy_file_with_digests(data_file, output_file_name, ('md5', 'sha1'), reflink = reflink, digest_cache = digest_cache)
+
+    assert digest_lookup == {'md5': FILE_DIGESTS['md5'], 'sha1': FILE_DIGESTS['sha1']}
+    assert os.listdir(output_path) == ['copy.box']
+    with open(output_file_name, 'rb') as file_object:
+        assert file_object.read() == FILE_DATA
+
+    # the source is never read again to calculate its digests
+    with patch('packermate.checksum.MultiDigest') as mock_digest:
+        assert get_file_digests(data_file, ('md5', 'sha1'), digest_cache) == digest_lookup
+
+        mock_digest.assert_not_called()
+
+
+def test_checksum_copy_file_error(data_file, temp_dir):
+    with pytest.raises(ChecksumException):
+        copy_file_with_digests(data_file, os.path.join(temp_dir, 'missing', 'copy.box'))
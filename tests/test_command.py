@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+import pytest
+from packermate.command import Builder, BuilderException, PackerConfig, PackerValidateCache
+from packermate.config import Config
+from packermate.vagrant import BoxInventory
+import threading
+import os
+from mock import patch
+
+
+def make_target_class(name, started_event, wait_event):
+    class Target(object):
+
+        def __init__(self, config, data_dir, packer_config, temp_dir, box_inventory):
+            self._packer_config = packer_config
+            self._temp_dir = temp_dir
+
+        def build(self):
+            started_event.set()
+
+            # each target waits for the other to start, so only pass when run concurrently
+            assert wait_event.wait(5)
+
+            self._packer_config.add_builder({'type': name, 'temp_dir': self._temp_dir})
+            self._packer_config.add_provisioner({'type': 'shell', 'inline': [name]})
+
+    return Target
+
+
+def test_builder_targets_concurrent(temp_dir):
+    first_event = threading.Event()
+    second_event = threading.Event()
+    target_lookup = {
+        'first': make_target_class('first', first_event, second_event),
+        'second': make_target_class('second', second_event, first_event),
+    }
+
+    with patch.object(Builder, 'TARGET_LOOKUP', target_lookup):
+        builder = Builder(Config(config_string = 'target_workers: 2'), ('first', 'second'))
+        packer_config = PackerConfig()
+        builder._build_targets(packer_config, temp_dir, BoxInventory())
+
+    # fragments are merged in target order whichever finishes first
+    builder_list = packer_config._config['builders']
+    assert [builder_config['type'] for builder_config in builder_list] == ['first', 'second']
+    assert [provisioner_config['inline'] for provisioner_config in packer_config._config['provisioners']] == [['first'], ['second']]
+
+    temp_dir_list = [builder_config['temp_dir'] for builder_config in builder_list]
+    assert len(set(temp_dir_list)) == 2
+    for target_temp_dir in temp_dir_list:
+        assert os.path.dirname(target_temp_dir) == temp_dir
+
+
+def test_builder_targets_unknown(temp_dir):
+    builder = Builder(Config(config_string = 'target_workers: 2'), ('virtualbox', 'unknown'))
+
+    with pytest.raises(BuilderException):
+        builder._build_targets(PackerConfig(), temp_dir, BoxInventory())
+
+
+def write_packer_command(temp_dir):
+    packer_file_name = os.path.join(temp_dir, 'packer')
+    with open(packer_file_name, 'w') as file_object:
+        file_object.write('#!/bin/sh\necho "$@" >> {}\n'.format(os.path.join(temp_dir, 'packer.log')))
+
+    os.chmod(packer_file_name, 0o755)
+
+    return packer_file_name
+
+
+def read_packer_log(temp_dir):
+    with open(os.path.join(temp_dir, 'packer.log'), 'r') as file_object:
+        return file_object.read().splitlines()
+
+
+def test_builder_validate_cache(temp_dir):
+    config = Config(config_string = 'packer_command: {}\nbox_cache_dir: {}'.format(
+        write_packer_command(temp_dir),
+        os.path.join(temp_dir, 'cache'),
+    ))
+    builder = Builder(config, ('virtualbox',))
+
+    with patch.dict(PackerValidateCache._lookup, clear = True):
+        for index, builder_type, expected_count in (
+            (0, 'first', 1),
+            (1, 'first', 1),
+            (2, 'second', 2),
+        ):
+            # each build writes the configuration into a new temporary directory
+            build_temp_dir = os.path.join(temp_dir, 'build{}'.format(index))
+            os.mkdir(build_temp_dir)
+
+            packer_config = PackerConfig()
+            packer_config.add_builder({'type': builder_type})
+            assert builder._validate_packer(packer_config, build_temp_dir) == os.path.join(build_temp_dir, 'packer.json')
+
+            assert len(read_packer_log(temp_dir)) == expected_count
+
+        # the validation results are read from the box cache directory
+        PackerValidateCache._lookup.clear()
+        builder._validate_packer(packer_config, build_temp_dir)
+
+        assert len(read_packer_log(temp_dir)) == 2
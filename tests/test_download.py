@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+import pytest
+from packermate.download import BoxDownloader, DownloadException, DOWNLOAD_PARTIAL_SUFFIX, DOWNLOAD_STATE_SUFFIX, DOWNLOAD_LOCK_SUFFIX
+from packermate.vagrant import BoxInventory
+from packermate.config import Config
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+import threading
+import hashlib
+import json
+import os
+import re
+from mock import patch
+
+
+BOX_DATA = b''.join([chr(index % 256) for index in range(1000)])
+BOX_SHA256 = hashlib.sha256(BOX_DATA).hexdigest()
+
+
+class BoxRequestHandler(BaseHTTPRequestHandler):
+
+    def _send_headers(self):
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range') or '')
+        if match and (self.server.ranges or self.server.unadvertised_ranges):
+            range_start, range_end = int(match.group(1)), int(match.group(2) or len(BOX_DATA) - 1)
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(range_start, range_end, len(BOX_DATA)))
+
+        else:
+            range_start, range_end = 0, len(BOX_DATA) - 1
+            self.send_response(200)
+
+        if self.server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+
+        self.send_header('Content-Length', str(range_end - range_start + 1))
+        self.end_headers()
+
+        return BOX_DATA[range_start:range_end + 1]
+
+    def do_HEAD(self):
+        self._send_headers()
+
+    def do_GET(self):
+        with self.server.request_lock:
+            self.server.request_list.append(self.headers.get('Range'))
+
+        data = self._send_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture(params = (True, False), ids = ('ranges', 'stream'))
+def box_server(request):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), BoxRequestHandler)
+    server.ranges = request.param
+    server.unadvertised_ranges = False
+    server.request_list = []
+    server.request_lock = threading.Lock()
+
+    server_thread = threading.Thread(target = server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+
+    def stop_server():
+        server.shutdown()
+        server.server_close()
+
+    request.addfinalizer(stop_server)
+
+    return server, 'http://127.0.0.1:{}/test.box'.format(server.server_address[1])
+
+
+def get_cache_file_names(downloader):
+    # lock files are left in place, removing them would race with other downloads
+    return sorted([file_name for file_name in os.listdir(downloader.path) if not file_name.endswith(DOWNLOAD_LOCK_SUFFIX)])
+
+
+def test_download(box_server, temp_dir):
+    server, url = box_server
+    downloader = BoxDownloader(temp_dir, part_bytes = 300)
+
+    file_name = downloader.download(url, BOX_SHA256.upper(), 'sha256')
+
+    assert os.path.basename(file_name) == 'sha256-{}.box'.format(BOX_SHA256)
+    with open(file_name, 'rb') as file_object:
+        assert file_object.read() == BOX_DATA
+
+    assert get_cache_file_names(downloader) == [os.path.basename(file_name)]
+    if server.ranges:
+        assert sorted(server.request_list) == ['bytes=0-299', 'bytes=300-599', 'bytes=600-899', 'bytes=900-999']
+
+    else:
+        assert server.request_list == [None]
+
+    # the cached box is used for any URL with the same checksum
+    assert downloader.download(url + '?copy', BOX_SHA256, 'sha256') == file_name
+    assert len(server.request_list) == (4 if server.ranges else 1)
+
+
+def test_download_no_checksum(box_server, temp_dir):
+    server, url = box_server
+    downloader = BoxDownloader(temp_dir, part_bytes = 300)
+
+    file_name = downloader.download(url)
+
+    assert os.path.basename(file_name).startswith('url-')
+    assert downloader.download(url) == file_name
+
+
+def test_download_checksum_mismatch(box_server, temp_dir):
+    server, url = box_server
+    downloader = BoxDownloader(temp_dir, part_bytes = 300)
+
+    with pytest.raises(DownloadException):
+        downloader.download(url, '0' * 64, 'sha256')
+
+    assert get_cache_file_names(downloader) == []
+
+    with pytest.raises(DownloadException):
+        downloader.download(url, '0' * 64, 'crc32')
+
+
+def test_download_resume(box_server, temp_dir):
+    server, url = box_server
+    if not server.ranges:
+        return
+
+    downloader = BoxDownloader(temp_dir, workers = 1, part_bytes = 300)
+    file_name = downloader.get_file_name(url, BOX_SHA256, 'sha256')
+    download_part = BoxDownloader._download_part
+
+    def fail_part(url, part_file_name, part):
+        if part[0] >= 600:
+            raise IOError('interrupted')
+
+        download_part(url, part_file_name, part)
+
+    with patch.object(BoxDownloader, '_download_part', side_effect = fail_part):
+        with pytest.raises(DownloadException):
+            downloader.download(url, BOX_SHA256, 'sha256')
+
+    assert os.path.exists(file_name + DOWNLOAD_PARTIAL_SUFFIX)
+    with open(file_name + DOWNLOAD_STATE_SUFFIX, 'r') as file_object:
+        assert json.load(file_object)['completed'] == [0, 300]
+
+    del server.request_list[:]
+    assert downloader.download(url, BOX_SHA256, 'sha256') == file_name
+    assert sorted(server.request_list) == ['bytes=600-899', 'bytes=900-999']
+    assert not os.path.exists(file_name + DOWNLOAD_STATE_SUFFIX)
+
+
+@pytest.mark.parametrize('unadvertised_ranges', (True, False), ids = ('resume', 'restart'))
+def test_download_stream_resume(box_server, temp_dir, unadvertised_ranges):
+    server, url = box_server
+    if server.ranges:
+        return
+
+    server.unadvertised_ranges = unadvertised_ranges
+    downloader = BoxDownloader(temp_dir)
+    file_name = downloader.get_file_name(url, BOX_SHA256, 'sha256')
+
+    # a partial download left by an interrupted run
+    os.makedirs(downloader.path)
+    with open(file_name + DOWNLOAD_PARTIAL_SUFFIX, 'wb') as file_object:
+        file_object.write(BOX_DATA[:400])
+
+    assert downloader.download(url, BOX_SHA256, 'sha256') == file_name
+    assert server.request_list == ['bytes=400-']
+    with open(file_name, 'rb') as file_object:
+        assert file_object.read() == BOX_DATA
+
+
+def test_download_concurrent(box_server, temp_dir):
+    server, url = box_server
+    downloader = BoxDownloader(temp_dir, part_bytes = 300)
+    result_list = []
+
+    def download():
+        try:
+            result_list.append(downloader.download(url, BOX_SHA256, 'sha256'))
+
+        except DownloadException as e:
+            result_list.append(e)
+
+    thread_list = [threading.Thread(target = download) for index in range(4)]
+    for thread in thread_list:
+        thread.start()
+
+    for thread in thread_list:
+        thread.join(10)
+
+    file_name = downloader.get_file_name(url, BOX_SHA256, 'sha256')
+    assert result_list == [file_name] * 4
+
+    # the box is downloaded once, the other downloads wait for it
+    assert len(server.request_list) == (4 if server.ranges else 1)
+    with open(file_name, 'rb') as file_object:
+        assert file_object.read() == BOX_DATA
+
+
+def test_download_install(box_server, temp_dir):
+    server, url = box_server
+    if not server.ranges:
+        return
+
+    metadata = {
+        'name': 'test/box',
+        'versions': [
+            {
+                'version': '1.0.0',
+                'status': 'active',
+                'providers': [
+                    {'name': 'virtualbox', 'url': url, 'checksum': BOX_SHA256, 'checksum_type': 'sha256'},
+                ],
+            },
+        ],
+    }
+    metadata_file_name = os.path.join(temp_dir, 'metadata.json')
+    with open(metadata_file_name, 'w') as file_object:
+        json.dump(metadata, file_object)
+
+    config = Config(config_string = """---
+box_cache_dir: {}
+vagrant_box_name: test/box
+vagrant_box_url: file://{}
+vagrant_box_download: true
+""".format(temp_dir, metadata_file_name))
+
+    install_list = []
+
+    def install(name, provider, version = None, url = None):
+        with open(url, 'r') as file_object:
+            install_list.append((name, provider, version, json.load(file_object)))
+
+    inventory = BoxInventory()
+    with patch.object(inventory, 'installed', return_value = None):
+        with patch.object(inventory, 'install', side_effect = install):
+            inventory.install_from_config(config, 'virtualbox')
+
+    assert len(install_list) == 1
+    name, provider, version, install_metadata = install_list[0]
+    assert (name, provider, version) == ('test/box', 'virtualbox', '1.0.0')
+
+    box_url = install_metadata['versions'][0]['providers'][0]['url']
+    assert box_url == 'file://{}'.format(BoxDownloader(temp_dir).get_file_name(url, BOX_SHA256, 'sha256'))
@@ -5,7 +5,10 @@ from __future__ import print_function, unicode_literals
 import pytest
 from packermate.file_utils import *
 import uuid
+import time
+import threading
 from string import Template
+from mock import patch
 
 
 # TempDir
@@ -48,6 +51,86 @@ def test_temp_dir_exception():
     assert temp_path and not os.path.exists(temp_path)
 
 
+def wait_for_removal(path, timeout = 5.0):
+    time_end = time.time() + timeout
+    while os.path.exists(path) and time.time() < time_end:
+        time.sleep(0.05)
+
+    return not os.path.exists(path)
+
+
+def test_temp_dir_background_cleanup():
+    with TempDir() as temp_dir_root:
+        temp_dir = TempDir(root_dir = temp_dir_root.path, background_cleanup = True)
+        with temp_dir:
+            temp_path = temp_dir.path
+            with open(os.path.join(temp_path, 'test'), 'w') as file_object:
+                file_object.write('test')
+
+        assert temp_dir.path is None
+        assert not os.path.exists(temp_path)
+
+        trash_entry_path = os.path.join(temp_dir.trash_path, os.path.basename(temp_path))
+        assert wait_for_removal(trash_entry_path)
+
+
+def test_temp_dir_background_sweep():
+    with TempDir() as temp_dir_root:
+        temp_dir = TempDir(root_dir = temp_dir_root.path, background_cleanup = True)
+
+        leftover_path = os.path.join(temp_dir.trash_path, 'leftover')
+        recent_path = os.path.join(temp_dir.trash_path, 'recent')
+        for path in (leftover_path, recent_path):
+            os.makedirs(path)
+
+        os.utime(leftover_path, (0, 0))
+
+        # recent entries are being removed by the run that moved them to the trash
+        with patch('packermate.file_utils.remove_dirs_background', wraps = remove_dirs_background) as mock_remove:
+            with temp_dir:
+                temp_path = temp_dir.path
+                assert wait_for_removal(leftover_path)
+
+            mock_remove.assert_any_call([leftover_path])
+
+        assert os.path.exists(recent_path)
+
+        # the root directory is removed once the remover has finished with it
+        assert wait_for_removal(os.path.join(temp_dir.trash_path, os.path.basename(temp_path)))
+
+
+def test_temp_dir_background_stale():
+    with TempDir() as temp_dir_root:
+        temp_dir = TempDir(root_dir = temp_dir_root.path, background_cleanup = True)
+
+        # left by a run that was killed, by a run still in progress, by one just started and not by packermate
+        stale_path, held_path, recent_path, other_path = [
+            os.path.join(temp_dir_root.path, file_name)
+            for file_name in (TEMP_DIR_PREFIX + 'stale', TEMP_DIR_PREFIX + 'held', TEMP_DIR_PREFIX + 'recent', 'other')
+        ]
+        for path in (stale_path, held_path, recent_path, other_path):
+            os.mkdir(path)
+
+        for path in (stale_path, held_path, other_path):
+            os.utime(path, (0, 0))
+
+        lock_descriptor = try_lock_dir(held_path)
+        try:
+            with temp_dir:
+                temp_path = temp_dir.path
+                assert os.path.basename(temp_path).startswith(TEMP_DIR_PREFIX)
+                assert not os.path.exists(stale_path)
+                assert wait_for_removal(os.path.join(temp_dir.trash_path, os.path.basename(stale_path)))
+
+        finally:
+            os.close(lock_descriptor)
+
+        for path in (held_path, recent_path, other_path):
+            assert os.path.isdir(path)
+
+        assert wait_for_removal(os.path.join(temp_dir.trash_path, os.path.basename(temp_path)))
+
+
 # DataDir
 
 def test_data_dir_template_root():
@@ -86,6 +169,59 @@ def test_data_dir_json_read_write():
         assert file_data == data
 
 
+# JsonFileCache
+
+class ExampleCache(JsonFileCache):
+
+    CACHE_FILE_NAME = 'example.json'
+    _lookup = {}
+    _lock = threading.Lock()
+
+
+def test_json_file_cache():
+    with TempDir() as temp_dir:
+        file_name = os.path.join(temp_dir.path, 'cache', 'example.json')
+
+        ExampleCache(file_name).put('key', 'value')
+        assert read_json_file(file_name) == {'key': 'value'}
+
+        # the file is read where the key is not held in memory
+        ExampleCache._lookup.clear()
+        assert ExampleCache(file_name).get('key') == 'value'
+        assert ExampleCache(file_name).get('missing') is None
+
+        # caches are optional so write failures are ignored
+        assert not write_json_cache_file({}, os.path.join(file_name, 'example.json'))
+
+
+# FileLock
+
+def test_file_lock():
+    with TempDir() as temp_dir:
+        lock_file_name = os.path.join(temp_dir.path, 'test.lock')
+        event_list = []
+
+        def lock_file():
+            with FileLock(lock_file_name):
+                event_list.append('locked')
+
+        with FileLock(lock_file_name):
+            lock_thread = threading.Thread(target = lock_file)
+            lock_thread.start()
+            time.sleep(0.2)
+
+            event_list.append('released')
+
+        lock_thread.join(5)
+        assert event_list == ['released', 'locked']
+
+
+def test_file_lock_error():
+    with pytest.raises(FileLockException):
+        with FileLock('/path/does/not/exist.lock'):
+            pass
+
+
 # get_md5_sum
 
 def test_md5_sum():
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+from packermate.fingerprint import get_build_fingerprint, read_published_fingerprint, publish_fingerprint
+from packermate.command import Builder
+from packermate.config import Config
+import os
+from mock import patch
+
+
+def write_file(file_name, text):
+    with open(file_name, 'w') as file_object:
+        file_object.write(text)
+
+
+def get_packer_config_data(temp_dir, script_file_name):
+    return {
+        'builders': [
+            {
+                'type': 'virtualbox-iso',
+                'http_directory': os.path.join(temp_dir, 'virtualbox-abc123', 'packer_http'),
+            },
+        ],
+        'provisioners': [
+            {'type': 'shell', 'scripts': [script_file_name]},
+        ],
+        'post-processors': [],
+    }
+
+
+def make_temp_dir(temp_dir, name, target_dir_name):
+    build_temp_dir = os.path.join(temp_dir, name)
+    http_path = os.path.join(build_temp_dir, target_dir_name, 'packer_http')
+    os.makedirs(http_path)
+    write_file(os.path.join(http_path, 'preseed.cfg'), 'preseed')
+
+    return build_temp_dir
+
+
+def test_fingerprint(temp_dir):
+    script_file_name = os.path.join(temp_dir, 'script.sh')
+    write_file(script_file_name, 'echo test')
+
+    first_temp_dir = make_temp_dir(temp_dir, 'first', 'virtualbox-abc123')
+    fingerprint = get_build_fingerprint(get_packer_config_data(first_temp_dir, script_file_name), first_temp_dir)
+
+    # the temporary directory of another build does not change the fingerprint
+    second_temp_dir = make_temp_dir(temp_dir, 'second', 'virtualbox-abc123')
+    second_packer_config_data = get_packer_config_data(second_temp_dir, script_file_name)
+    assert get_build_fingerprint(second_packer_config_data, second_temp_dir) == fingerprint
+
+    assert get_build_fingerprint(second_packer_config_data, second_temp_dir, [['box', 'virtualbox', '1.0.0']]) != fingerprint
+
+    write_file(os.path.join(second_temp_dir, 'virtualbox-abc123', 'packer_http', 'preseed.cfg'), 'changed')
+    assert get_build_fingerprint(second_packer_config_data, second_temp_dir) != fingerprint
+
+    write_file(script_file_name, 'echo changed')
+    assert get_build_fingerprint(get_packer_config_data(first_temp_dir, script_file_name), first_temp_dir) != fingerprint
+
+
+def test_fingerprint_publish(temp_dir):
+    output_path = os.path.join(temp_dir, 'output')
+    publish_path = os.path.join(temp_dir, 'publish')
+    for path in (output_path, publish_path):
+        os.mkdir(path)
+
+    config = Config(config_string = """---
+vm_name: test
+vm_version: 1.0.0
+vagrant_output: {}/test_{{{{.Provider}}}}.box
+vagrant_publish_path: {}
+""".format(output_path, publish_path))
+
+    assert read_published_fingerprint(config, ('virtualbox',), temp_dir) is None
+
+    publish_fingerprint(config, ('virtualbox',), 'abc')
+
+    assert os.path.exists(os.path.join(publish_path, 'test.fingerprint.json'))
+
+    # the published copy is preferred to the local copy
+    os.remove(os.path.join(output_path, 'test.fingerprint.json'))
+    assert read_published_fingerprint(config, ('virtualbox',), temp_dir) == 'abc'
+
+
+def test_fingerprint_build(temp_dir):
+    output_path = os.path.join(temp_dir, 'output')
+    os.mkdir(output_path)
+
+    script_file_name = os.path.join(temp_dir, 'script.sh')
+    write_file(script_file_name, 'echo test')
+
+    config = Config(config_string = """---
+vm_name: test
+vm_version: 1.0.0
+build_fingerprint: true
+temp_dir: {0}
+provisioners:
+  - type: shell
+    scripts:
+      - {1}
+vagrant_output: {0}/output/test_{{{{.Provider}}}}.box
+""".format(temp_dir, script_file_name))
+
+    with patch.object(Builder, '_build_targets'), \
+            patch.object(Builder, '_validate_packer') as mock_validate, \
+            patch.object(Builder, '_run_packer') as mock_run_packer, \
+            patch('packermate.command.publish_vagrant_box') as mock_publish:
+        for script_text, expected_build in (
+            ('echo test', True),
+            ('echo test', False),
+            ('echo changed', True),
+        ):
+            write_file(script_file_name, script_text)
+            mock_validate.reset_mock()
+            mock_run_packer.reset_mock()
+            mock_publish.reset_mock()
+
+            Builder(config, ('virtualbox',)).build()
+
+            # skipped builds neither wait for nor start validation
+            assert mock_validate.called == expected_build
+            assert mock_run_packer.called == expected_build
+            assert mock_publish.called == expected_build
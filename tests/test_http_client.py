@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+import pytest
+from packermate.http_client import get_json, get_session, HttpException
+from packermate.vagrant import BoxMetadata, BoxMetadataException
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+import threading
+import json
+
+
+METADATA = {
+    'name': 'test',
+    'versions': [
+        {
+            'version': '1.0.0',
+            'status': 'active',
+            'providers': [],
+        }
+    ]
+}
+METADATA_ETAG = '"abc123"'
+
+
+class MetadataRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.request_list.append((self.path, self.headers.get('If-None-Match')))
+
+        if self.path == '/metadata.json':
+            if self.headers.get('If-None-Match') == METADATA_ETAG:
+                self.send_response(304)
+                self.end_headers()
+
+            else:
+                data = json.dumps(METADATA)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.send_header('ETag', METADATA_ETAG)
+                self.end_headers()
+                self.wfile.write(data)
+
+        elif self.path == '/invalid.json':
+            self.send_response(200)
+            self.send_header('Content-Length', '1')
+            self.end_headers()
+            self.wfile.write('{')
+
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def http_server(request):
+    server = HTTPServer(('127.0.0.1', 0), MetadataRequestHandler)
+    server.request_list = []
+
+    server_thread = threading.Thread(target = server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+
+    def stop_server():
+        server.shutdown()
+        server.server_close()
+
+    request.addfinalizer(stop_server)
+
+    return server, 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+
+def test_http_session_shared():
+    assert get_session() is get_session()
+
+
+def test_http_get_json(http_server):
+    server, url = http_server
+
+    assert get_json(url + '/metadata.json') == METADATA
+    assert get_json(url + '/metadata.json') == METADATA
+    assert server.request_list == [('/metadata.json', None)] * 2
+
+
+def test_http_get_json_cached(http_server, temp_dir):
+    server, url = http_server
+
+    for _ in range(3):
+        assert get_json(url + '/metadata.json', cache_dir = temp_dir) == METADATA
+
+    # revalidated with the cached ETag
+    assert server.request_list == [('/metadata.json', None)] + [('/metadata.json', METADATA_ETAG)] * 2
+
+
+@pytest.mark.parametrize('path', ('/missing.json', '/invalid.json'))
+def test_http_get_json_error(http_server, path):
+    server, url = http_server
+
+    with pytest.raises(HttpException):
+        get_json(url + path)
+
+
+def test_http_box_metadata(http_server, temp_dir):
+    server, url = http_server
+
+    metadata = BoxMetadata(url + '/metadata.json', cache_dir = temp_dir)
+    assert metadata.name == 'test'
+
+    with pytest.raises(BoxMetadataException):
+        BoxMetadata(url + '/missing.json', cache_dir = temp_dir)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+from packermate.outdated import get_outdated_boxes, format_outdated_table
+from packermate.config import Config
+from packermate.vagrant import BoxMetadata
+import json
+import os
+from mock import patch
+
+
+def write_metadata(file_name, name, version_list):
+    with open(file_name, 'w') as file_object:
+        json.dump(
+            {
+                'name': name,
+                'versions': [
+                    {
+                        'version': version_str,
+                        'status': 'active',
+                        'providers': [
+                            {'name': 'virtualbox', 'url': 'file:///dev/null'},
+                        ],
+                    }
+                    for version_str in version_list
+                ],
+            },
+            file_object
+        )
+
+
+def write_config(file_name, config_str):
+    with open(file_name, 'w') as file_object:
+        file_object.write(config_str)
+
+    return Config(file_name)
+
+
+def test_outdated(temp_dir):
+    boxes_dir = os.path.join(temp_dir, 'boxes')
+    for name in ('vagrant-box/1.1.0', 'pinned-box/1.0.0', 'current-box/1.0.0'):
+        provider_path = os.path.join(boxes_dir, name, 'virtualbox')
+        os.makedirs(provider_path)
+        with open(os.path.join(provider_path, 'metadata.json'), 'w') as file_object:
+            json.dump({'provider': 'virtualbox'}, file_object)
+
+    metadata_url_lookup = {}
+    for name, version_list in (
+        ('vagrant-box', ('1.2.0', '1.1.0')),
+        ('pinned-box', ('2.0.0', '1.0.0')),
+        ('current-box', ('1.0.0',)),
+    ):
+        metadata_file_name = os.path.join(temp_dir, '{}.json'.format(name))
+        write_metadata(metadata_file_name, name, version_list)
+        metadata_url_lookup[name] = 'file://{}'.format(metadata_file_name)
+
+    config_list = []
+    for index, (name, version) in enumerate((
+        ('vagrant-box', None),
+        ('pinned-box', '1.0.0'),
+        ('current-box', '~> 1.0'),
+        ('vagrant-box', None),
+        ('missing-box', None),
+    )):
+        config_str = 'vagrant_boxes_dir: {}\nvagrant_box_name: {}\nvagrant_box_url: {}\n'.format(
+            boxes_dir,
+            name,
+            metadata_url_lookup.get(name, 'file://{}/missing.json'.format(temp_dir)),
+        )
+        if version:
+            config_str += 'vagrant_box_version: "{}"\n'.format(version)
+
+        config_list.append(write_config(os.path.join(temp_dir, 'config{}.yml'.format(index)), config_str))
+
+    with patch('packermate.outdated.BoxMetadata', wraps = BoxMetadata) as mock_metadata:
+        row_list = get_outdated_boxes(config_list)
+
+        # metadata shared between configs is only fetched once
+        assert mock_metadata.call_count == 4
+
+    # the aws provider is not offered by the metadata so is not listed
+    assert [(row['name'], row['provider'], row['configured'], row['installed'], row['latest'], row['status']) for row in row_list] == [
+        ('vagrant-box', 'virtualbox', '', '1.1.0', '1.2.0', 'outdated'),
+        ('pinned-box', 'virtualbox', '1.0.0', '1.0.0', '2.0.0', 'pinned'),
+        ('current-box', 'virtualbox', '~> 1.0', '1.0.0', '1.0.0', 'current'),
+        ('vagrant-box', 'virtualbox', '', '1.1.0', '1.2.0', 'outdated'),
+        ('missing-box', '', '', '', '', 'error'),
+    ]
+    assert row_list[0]['config'] == os.path.join(temp_dir, 'config0.yml')
+
+    table_line_list = format_outdated_table(row_list).splitlines()
+    assert len(table_line_list) == 6
+    assert table_line_list[0].split() == ['Config', 'Box', 'Provider', 'Configured', 'Installed', 'Latest', 'Status']
+    assert table_line_list[1].split()[1:] == ['vagrant-box', 'virtualbox', '1.1.0', '1.2.0', 'outdated']
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+import pytest
+from packermate.s3 import S3Publisher, S3PublishException
+from packermate.checksum import get_file_digests, DigestCache
+from packermate.vagrant import publish_vagrant_box, BoxMetadata, BoxInventory
+from packermate.config import Config
+from botocore.exceptions import ClientError
+from StringIO import StringIO
+import threading
+import hashlib
+import json
+import os
+from mock import patch
+
+
+PART_BYTES = 5 * 1024 * 1024
+
+
+# in memory stand-in for the subset of the S3 client API used for publishing
+class FakeS3Client(object):
+
+    def __init__(self, fail_part = None):
+        self.object_lookup = {}
+        self.upload_lookup = {}
+        self.request_list = []
+        self.fail_part = fail_part
+        self._lock = threading.Lock()
+
+    def _record(self, *args):
+        with self._lock:
+            self.request_list.append(args)
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self._record('put_object', Key)
+        self.object_lookup[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.object_lookup:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+
+        return {'Body': StringIO(self.object_lookup[(Bucket, Key)])}
+
+    def create_multipart_upload(self, Bucket, Key):
+        self._record('create_multipart_upload', Key)
+        upload_id = 'upload-{}'.format(len(self.upload_lookup))
+        self.upload_lookup[upload_id] = {}
+
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self._record('upload_part', Key, PartNumber)
+        if PartNumber == self.fail_part:
+            raise ClientError({'Error': {'Code': 'InternalError'}}, 'UploadPart')
+
+        with self._lock:
+            self.upload_lookup[UploadId][PartNumber] = Body
+
+        return {'ETag': hashlib.md5(Body).hexdigest()}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self._record('complete_multipart_upload', Key)
+        part_lookup = self.upload_lookup.pop(UploadId)
+
+        part_list = MultipartUpload['Parts']
+        assert [part['PartNumber'] for part in part_list] == range(1, len(part_lookup) + 1)
+        for part in part_list:
+            assert part['ETag'] == hashlib.md5(part_lookup[part['PartNumber']]).hexdigest()
+
+        self.object_lookup[(Bucket, Key)] = b''.join([part_lookup[part['PartNumber']] for part in part_list])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._record('abort_multipart_upload', Key)
+        self.upload_lookup.pop(UploadId)
+
+
+def write_file(file_name, size):
+    with open(file_name, 'wb') as file_object:
+        file_object.write(b''.join([chr(index % 251) for index in range(size)]))
+
+    with open(file_name, 'rb') as file_object:
+        return file_object.read()
+
+
+@pytest.mark.parametrize('file_size', (1000, PART_BYTES * 3 + 1000))
+def test_s3_upload(temp_dir, file_size):
+    file_name = os.path.join(temp_dir, 'test.box')
+    file_data = write_file(file_name, file_size)
+
+    client = FakeS3Client()
+    digest_cache = DigestCache()
+    publisher = S3Publisher('s3://bucket/boxes/', part_mb = 1, workers = 3, client = client, digest_cache = digest_cache)
+    digest_lookup = publisher.upload_file(file_name, ('md5', 'sha256'))
+
+    assert client.object_lookup[('bucket', 'boxes/test.box')] == file_data
+    assert digest_lookup == {'md5': hashlib.md5(file_data).hexdigest(), 'sha256': hashlib.sha256(file_data).hexdigest()}
+
+    upload_part_count = len([request for request in client.request_list if request[0] == 'upload_part'])
+    assert upload_part_count == (4 if file_size > PART_BYTES else 0)
+
+    # the digests calculated during the upload are not calculated again
+    with patch('packermate.checksum.MultiDigest') as mock_digest:
+        assert get_file_digests(file_name, ('md5', 'sha256'), digest_cache) == digest_lookup
+
+        mock_digest.assert_not_called()
+
+
+def test_s3_upload_error(temp_dir):
+    file_name = os.path.join(temp_dir, 'test.box')
+    write_file(file_name, PART_BYTES * 6)
+
+    client = FakeS3Client(fail_part = 2)
+    publisher = S3Publisher('s3://bucket', part_mb = 5, workers = 1, client = client)
+    with pytest.raises(S3PublishException):
+        publisher.upload_file(file_name)
+
+    # no parts are uploaded once a part fails
+    assert client.request_list == [
+        ('create_multipart_upload', 'test.box'),
+        ('upload_part', 'test.box', 1),
+        ('upload_part', 'test.box', 2),
+        ('abort_multipart_upload', 'test.box'),
+    ]
+    assert client.object_lookup == {}
+    assert client.upload_lookup == {}
+
+
+@pytest.mark.parametrize(
+    'url, endpoint_url, expected',
+    (
+        ('s3://bucket', None, 'https://bucket.s3.amazonaws.com/test.box'),
+        ('s3://bucket/path/to', None, 'https://bucket.s3.amazonaws.com/path/to/test.box'),
+        ('s3://bucket/path/', 'http://localhost:9000/', 'http://localhost:9000/bucket/path/test.box'),
+        ('http://bucket', None, S3PublishException),
+    )
+)
+def test_s3_url(url, endpoint_url, expected):
+    if expected is S3PublishException:
+        with pytest.raises(S3PublishException):
+            S3Publisher(url, client = FakeS3Client())
+
+    else:
+        assert S3Publisher(url, endpoint_url = endpoint_url, client = FakeS3Client()).get_url('/tmp/test.box') == expected
+
+
+def test_s3_from_config():
+    config = Config(config_string = 'vagrant_publish_s3_url: s3://bucket\nvagrant_publish_s3_workers: many\n')
+    with patch('packermate.s3.get_s3_client', return_value = FakeS3Client()):
+        with pytest.raises(S3PublishException):
+            S3Publisher.from_config(config)
+
+
+def test_s3_publish(temp_dir):
+    output_path = os.path.join(temp_dir, 'output')
+    os.mkdir(output_path)
+
+    for provider_name in ('virtualbox', 'aws'):
+        write_file(os.path.join(output_path, 'test_{}.box'.format(provider_name)), 1000)
+
+    config = Config(config_string = """---
+vm_name: test
+vm_version: 1.2.3
+vagrant_output: {}/test_{{{{.Provider}}}}.box
+vagrant_publish_s3_url: s3://bucket/boxes
+vagrant_publish_checksum_type: sha256
+""".format(output_path))
+
+    client = FakeS3Client()
+    with patch('packermate.s3.get_s3_client', return_value = client):
+        publish_vagrant_box(config, ('virtualbox', 'aws'), BoxInventory())
+
+        # the metadata is uploaded once every box is uploaded
+        assert client.request_list[-1] == ('put_object', 'boxes/test.json')
+        assert sorted(client.request_list[:-1]) == [
+            ('put_object', 'boxes/test_aws.box'),
+            ('put_object', 'boxes/test_virtualbox.box'),
+        ]
+
+        metadata = json.loads(client.object_lookup[('bucket', 'boxes/test.json')])
+        provider_list = sorted(metadata['versions'][0]['providers'], key = lambda provider_info: provider_info['name'])
+        assert [provider_info['url'] for provider_info in provider_list] == [
+            'https://bucket.s3.amazonaws.com/boxes/test_aws.box',
+            'https://bucket.s3.amazonaws.com/boxes/test_virtualbox.box',
+        ]
+        assert provider_list[0]['checksum'] == hashlib.sha256(client.object_lookup[('bucket', 'boxes/test_aws.box')]).hexdigest()
+
+        # the published metadata is merged with the next version
+        os.remove(os.path.join(output_path, 'test.json'))
+        config.vm_version = '1.2.4'
+        publish_vagrant_box(config, ('virtualbox',), BoxInventory())
+
+    metadata_file_name = os.path.join(output_path, 'test.json')
+    metadata = BoxMetadata(url = 'file://{}'.format(metadata_file_name))
+    assert [str(version_info['version']) for version_info in metadata.versions] == ['1.2.4', '1.2.3']
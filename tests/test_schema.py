@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+import pytest
+from packermate.schema import validate_packer_config
+from packermate.command import Builder, BuilderException, PackerValidateCache
+from packermate.config import Config
+from mock import patch
+
+
+BUILD_CONFIG = """---
+vm_name: test
+ssh_user: ubuntu
+ssh_password: ubuntu
+temp_dir: {0}
+virtualbox_iso_url: http://example.com/ubuntu.iso
+virtualbox_iso_checksum: abc
+virtualbox_output_name: test
+virtualbox_output_directory: {0}/output
+virtualbox_memory_mb: 1024
+aws_access_key: key
+aws_secret_key: secret
+aws_session_token: ""
+aws_region: eu-west-1
+aws_ami_id: ami-12345678
+aws_instance_type: t2.nano
+aws_disk_gb: 20
+aws_ami_tags:
+  name: test
+provisioners:
+  - type: shell
+    scripts:
+      - script.sh
+  - type: file
+    source: file.txt
+    destination: /tmp/file.txt
+  - type: shell-local
+    command: echo test
+  - type: ansible-local
+    playbook_file: playbook.yml
+    extra_vars:
+      key: value
+vagrant: true
+vagrant_output: {0}/test_{{{{.Provider}}}}.box
+"""
+
+
+def test_schema_build(temp_dir):
+    config = Config(config_string = BUILD_CONFIG.format(temp_dir))
+
+    # a dry run validates the generated configuration without Packer
+    with patch.object(PackerValidateCache, 'get_packer_identity', return_value = None), \
+            patch('packermate.command.run_command') as mock_run_command:
+        Builder(config, ('virtualbox', 'aws'), dry_run = True).build()
+
+        mock_run_command.assert_not_called()
+
+
+def test_schema_build_error(temp_dir):
+    config = Config(config_string = BUILD_CONFIG.format(temp_dir))
+    config.provisioners = [{'type': 'shell', 'environment_vars': ['KEY=value']}]
+
+    with patch.object(PackerValidateCache, 'get_packer_identity', return_value = None):
+        with pytest.raises(BuilderException) as exc_info:
+            Builder(config, ('virtualbox', 'aws'), dry_run = True).build()
+
+    assert 'one of inline, script or scripts must be specified' in unicode(exc_info.value)
+
+
+VALID_BUILDER = {
+    'type': 'amazon-ebs',
+    'region': 'eu-west-1',
+    'source_ami': 'ami-12345678',
+    'ami_name': 'test',
+    'instance_type': 't2.nano',
+    'ssh_username': 'ubuntu',
+}
+
+
+def with_builder(**kwargs):
+    builder = dict(VALID_BUILDER)
+    for key, value in kwargs.iteritems():
+        if value is None:
+            del builder[key]
+
+        else:
+            builder[key] = value
+
+    return {'builders': [builder]}
+
+
+@pytest.mark.parametrize(
+    'packer_config_data, expected',
+    (
+        (with_builder(), []),
+        (with_builder(force_deregister = 'true', ssh_timeout = 10), []),
+        ({'builders': []}, ['template: at least one builder must be defined']),
+        (dict(with_builder(), unknown = True), ['template: unknown key: unknown']),
+        (with_builder(source_ami = None), ['builders[0] amazon-ebs: missing required key: source_ami']),
+        (with_builder(region = ''), ['builders[0] amazon-ebs: missing required key: region']),
+        (with_builder(spot_price = '0.1'), ['builders[0] amazon-ebs: unknown key: spot_price']),
+        (with_builder(force_deregister = 'yes'), ['builders[0] amazon-ebs: invalid bool value: force_deregister=yes']),
+        (with_builder(tags = ['name']), ["builders[0] amazon-ebs: invalid string map value: tags=[u'name']"]),
+        (
+            with_builder(ami_block_device_mappings = [{'volume_size': 20}]),
+            ["builders[0] amazon-ebs: invalid block device list value: ami_block_device_mappings=[{u'volume_size': 20}]"],
+        ),
+        (with_builder(type = 'docker'), ['builders[0] docker: unknown type']),
+        (
+            {'builders': [VALID_BUILDER, VALID_BUILDER]},
+            ['builders[1] amazon-ebs: duplicate builder name: amazon-ebs'],
+        ),
+        (
+            dict(with_builder(), provisioners = [{'type': 'shell', 'execute_command': 'bash'}]),
+            ['provisioners[0] shell: one of inline, script or scripts must be specified'],
+        ),
+        (
+            dict(with_builder(), provisioners = [{'type': 'file', 'source': 'file.txt', 'only': 'amazon-ebs'}]),
+            [
+                'provisioners[0] file: missing required key: destination',
+                'provisioners[0] file: invalid string list value: only=amazon-ebs',
+            ],
+        ),
+        (
+            dict(with_builder(), **{'post-processors': [{'type': 'vagrant', 'keep_input_artifact': True, 'output': 'test.box'}]}),
+            [],
+        ),
+        (
+            dict(with_builder(), **{'post-processors': ['vagrant']}),
+            ['post-processors[0]: not a dictionary'],
+        ),
+    )
+)
+def test_schema(packer_config_data, expected):
+    assert validate_packer_config(packer_config_data) == expected
@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+from packermate.script import run
+import os
+from mock import patch
+
+
+def test_script_param(temp_dir):
+    config_file_name = os.path.join(temp_dir, 'test.yml')
+    with open(config_file_name, 'w') as file_object:
+        file_object.write('---\nvm_name: test\nvm_version: 1.0.0\n')
+
+    argv = ['packermate', '-c', config_file_name, '-p', 'vm_version=2.0.0', '-p', 'extra=value', 'gc']
+    with patch('sys.argv', argv), patch('packermate.script.Builder') as mock_builder:
+        run()
+
+    config = mock_builder.call_args[0][0]
+    assert config.vm_name == 'test'
+    assert config.vm_version == '2.0.0'
+    assert config.extra == 'value'
+    mock_builder.return_value.gc.assert_called_once_with()
@@ -5,6 +5,10 @@ from __future__ import print_function, unicode_literals
 import pytest
 from packermate.target import parse_parameters, TargetParameter, TargetParameterException
 from packermate.config import Config
+from packermate.virtualbox import TargetVirtualBox
+from packermate.aws import TargetAWS, AmiIdCache
+import os
+from mock import Mock, patch
 
 
 @pytest.mark.parametrize(
@@ -121,3 +125,100 @@ def test_target_parameters(config_simple, param_list, config_lookup, expected):
     else:
         with pytest.raises(TargetParameterException):
             parse_parameters(param_list, config_simple, output)
+
+
+def test_target_virtualbox_installed_box(temp_dir):
+    box_path = os.path.join(temp_dir, 'boxes', 'vagrant-box', '1.0.0', 'virtualbox')
+    os.makedirs(box_path)
+    with open(os.path.join(box_path, 'box.ovf'), 'w') as file_object:
+        file_object.write('<ovf/>')
+
+    config = Config(config_string = """---
+vagrant_box_name: vagrant-box
+vagrant_box_direct: true
+virtualbox_vagrant_box_file: test.box
+""")
+    box_inventory = Mock()
+    box_inventory.get_version_from_config.return_value = '1.0.0'
+    box_inventory.get_box_path.return_value = box_path
+
+    target = TargetVirtualBox(config, Mock(), Mock(), temp_dir, box_inventory)
+    target._build_from_vagrant_box()
+
+    assert config.virtualbox_input_file == os.path.join(box_path, 'box.ovf')
+    assert 'virtualbox_vagrant_box_file' not in config
+    box_inventory.get_box_path.assert_called_once_with('vagrant-box', 'virtualbox', '1.0.0')
+    box_inventory.export_from_config.assert_not_called()
+
+
+def test_target_virtualbox_installed_box_override(temp_dir):
+    # command line overrides are strings, so 'false' must not enable using the box directory
+    config = Config(
+        config_string = 'vagrant_box_name: vagrant-box\nvagrant_box_direct: true\n',
+        override_list = ['vagrant_box_direct=false'],
+    )
+    box_inventory = Mock()
+
+    target = TargetVirtualBox(config, Mock(), Mock(), temp_dir, box_inventory)
+    with patch.object(target, '_unarchive_vagrant_box', return_value = {'box.ovf': 'extracted.ovf'}):
+        target._build_from_vagrant_box()
+
+    assert config.virtualbox_input_file == 'extracted.ovf'
+    box_inventory.get_box_path.assert_not_called()
+
+
+VAGRANTFILE_AWS = """Vagrant.configure("2") do |config|
+  config.vm.provider "aws" do |aws|
+    aws.region_config "us-east-1", ami: "ami-east"
+    aws.region_config "eu-west-1", ami: "ami-west"
+  end
+end
+"""
+
+
+@pytest.mark.parametrize(
+    'region, expected',
+    (
+        (None, 'ami-east'),
+        ('eu-west-1', 'ami-west'),
+        ('ap-south-1', 'ami-east'),
+    )
+)
+def test_target_aws_parse_vagrantfile(temp_dir, region, expected):
+    file_name = os.path.join(temp_dir, 'Vagrantfile')
+    with open(file_name, 'w') as file_object:
+        file_object.write(VAGRANTFILE_AWS)
+
+    assert TargetAWS._parse_vagrantfile_for_ami_id(file_name, region) == expected
+
+
+def test_target_aws_installed_box(temp_dir):
+    box_path = os.path.join(temp_dir, 'boxes', 'vagrant-box', '1.0.0', 'aws')
+    os.makedirs(box_path)
+    with open(os.path.join(box_path, 'Vagrantfile'), 'w') as file_object:
+        file_object.write(VAGRANTFILE_AWS)
+
+    config = Config(config_string = """---
+vagrant_box_name: vagrant-box
+aws_region: eu-west-1
+box_cache_dir: {}
+""".format(os.path.join(temp_dir, 'cache')))
+    box_inventory = Mock()
+    box_inventory.get_version_from_config.return_value = '1.0.0'
+    box_inventory.get_box_path.return_value = box_path
+
+    with patch.dict(AmiIdCache._lookup, clear = True):
+        TargetAWS(config, Mock(), Mock(), temp_dir, box_inventory)._build_from_vagrant_box()
+
+        assert config.aws_ami_id == 'ami-west'
+        box_inventory.export_from_config.assert_not_called()
+
+        # the AMI id is cached, in memory and in the box cache directory
+        AmiIdCache._lookup.clear()
+        box_inventory.get_box_path.reset_mock()
+        del config.aws_ami_id
+
+        TargetAWS(config, Mock(), Mock(), temp_dir, box_inventory)._build_from_vagrant_box()
+
+        assert config.aws_ami_id == 'ami-west'
+        box_inventory.get_box_path.assert_not_called()
@@ -7,16 +7,30 @@ from packermate.vagrant import (
     BoxMetadata,
     BoxMetadataException,
     parse_version,
+    VersionConstraint,
     BoxVersionException,
     BoxInventory,
     BoxInventoryException,
     get_version_index,
+    get_vagrant_boxes_dir,
+    publish_vagrant_box,
+    get_or_create_vagrant_box_metadata,
+    check_vagrant_publish,
+    get_bool_parameter,
+    PublishException,
 )
+from packermate.config import Config
 import json
 import os
+from datetime import datetime
+import threading
+import shlex
+import time
+from shutil import rmtree
 from semantic_version import Version
 from mock import patch, Mock
 from packermate.process import ProcessException
+from packermate.checksum import MultiDigest
 
 
 @pytest.fixture(
@@ -307,6 +321,178 @@ def test_box_metadata_add_version(version_list, version_order, provider, url, ch
         assert version_info['providers'] == [provider_info]
 
 
+def test_box_metadata_add_version_ordered():
+    metadata = BoxMetadata(name = 'test')
+    version_str_list = ['1.{}.{}'.format(minor, patch_val) for minor in range(10) for patch_val in range(10)]
+    for version_str in version_str_list[::2][::-1] + version_str_list[1::2]:
+        metadata.add_version(version_str, 'virtualbox', 'url')
+
+    metadata.add_version('1.5.5', 'aws', 'url')
+
+    version_list = [version_info['version'] for version_info in metadata.versions]
+    assert version_list == sorted([parse_version(val) for val in version_str_list], reverse = True)
+    assert metadata.versions[44]['providers'] == [{'name': 'virtualbox', 'url': 'url'}, {'name': 'aws', 'url': 'url'}]
+
+
+def test_box_metadata_add_version_unordered(tmpdir):
+    data = {
+        'name': 'test',
+        'versions': [
+            {'version': '1.0.0', 'status': 'active'},
+            {'version': '3.0.0', 'status': 'active', 'providers': []},
+        ]
+    }
+    temp_file = tmpdir.join('metadata.json')
+    temp_file.write(json.dumps(data))
+
+    metadata = BoxMetadata('file://{}'.format(str(temp_file)))
+    metadata.add_version('2.0.0', 'virtualbox', 'url')
+    metadata.add_version('1.0.0', 'virtualbox', 'url')
+
+    # inserted before the first older version, as the metadata is not in order
+    assert [str(version_info['version']) for version_info in metadata.versions] == ['2.0.0', '1.0.0', '3.0.0']
+    assert metadata.versions[1]['providers'] == [{'name': 'virtualbox', 'url': 'url'}]
+
+
+@pytest.mark.parametrize(
+    'existing_list',
+    (
+        [],
+        ['2.0.0', '1.5.0', '1.0.0'],
+        ['1.0.0', '2.0.0'],
+    )
+)
+def test_box_metadata_add_versions(existing_list):
+    version_info_list = [
+        ('1.5.0', 'virtualbox', 'url1', 'abc', 'md5'),
+        ('3.0.0', 'virtualbox', 'url2'),
+        ('0.5.0', 'aws', 'url3', None, None),
+        ('3.0.0', 'aws', 'url4', 'def', 'sha256'),
+        ('1.2.0', 'aws', 'url5'),
+        ('1.5.0', 'virtualbox', 'url6'),
+    ]
+
+    metadata_list = []
+    for bulk in (False, True):
+        metadata = BoxMetadata(name = 'test')
+        metadata._metadata['versions'] = [{'version': val, 'status': 'active', 'providers': []} for val in existing_list]
+        metadata._validate()
+
+        if bulk:
+            metadata.add_versions(version_info_list)
+
+        else:
+            for version_info in version_info_list:
+                metadata.add_version(*version_info)
+
+        metadata_list.append([
+            (str(version_info['version']), version_info['providers']) for version_info in metadata.versions
+        ])
+
+    assert metadata_list[0] == metadata_list[1]
+
+
+def test_box_metadata_add_versions_error():
+    metadata = BoxMetadata(name = 'test')
+    with pytest.raises(BoxMetadataException):
+        metadata.add_versions([('1.0.0', 'virtualbox')])
+
+
+def make_retention_metadata():
+    metadata = BoxMetadata(name = 'test')
+    metadata._metadata['versions'] = [
+        {'version': '5.0.0', 'status': 'active', 'created_at': '2016-01-05T00:00:00.000Z', 'providers': []},
+        {'version': '4.0.0', 'status': 'revoked', 'created_at': '2016-01-04T00:00:00.000Z', 'providers': []},
+        {'version': '3.0.0', 'status': 'active', 'created_at': '2016-01-03T00:00:00.000Z', 'providers': []},
+        {'version': '2.0.0', 'status': 'active', 'created_at': '2016-01-02T00:00:00.000Z', 'providers': []},
+        {'version': '1.0.0', 'status': 'active', 'providers': []},
+    ]
+    metadata._validate()
+
+    return metadata
+
+
+@pytest.mark.parametrize(
+    'keep_versions, keep_days, action, expected_expired, expected_versions',
+    (
+        (None, None, 'revoke', [], ['5.0.0', '4.0.0', '3.0.0', '2.0.0', '1.0.0']),
+        (2, None, 'revoke', ['2.0.0', '1.0.0'], ['5.0.0', '4.0.0', '3.0.0', '2.0.0', '1.0.0']),
+        (2, None, 'drop', ['4.0.0', '2.0.0', '1.0.0'], ['5.0.0', '3.0.0']),
+        (None, 3, 'drop', ['2.0.0', '1.0.0'], ['5.0.0', '4.0.0', '3.0.0']),
+        (1, 3, 'drop', ['2.0.0', '1.0.0'], ['5.0.0', '4.0.0', '3.0.0']),
+        (0, None, 'revoke', ['5.0.0', '3.0.0', '2.0.0', '1.0.0'], ['5.0.0', '4.0.0', '3.0.0', '2.0.0', '1.0.0']),
+    )
+)
+def test_box_metadata_expire_versions(keep_versions, keep_days, action, expected_expired, expected_versions):
+    metadata = make_retention_metadata()
+    time_now = datetime(2016, 1, 6)
+
+    expired_list = metadata.expire_versions(keep_versions, keep_days, action, time_now = time_now)
+
+    assert [str(version_info['version']) for version_info in expired_list] == expected_expired
+    assert [str(version_info['version']) for version_info in metadata.versions] == expected_versions
+    for version_info in metadata.versions:
+        if str(version_info['version']) in expected_expired:
+            assert version_info['status'] == 'revoked'
+
+    # the index is still usable after expiry
+    metadata.add_version('6.0.0', 'virtualbox', 'url')
+    assert str(metadata.versions[0]['version']) == '6.0.0'
+
+
+def test_box_metadata_expire_versions_error():
+    with pytest.raises(BoxMetadataException):
+        make_retention_metadata().expire_versions(1, action = 'delete')
+
+
+@pytest.mark.parametrize(
+    'constraint_str, expected',
+    (
+        ('>= 1.2, < 2.0', ['1.10.0', '1.4.1', '1.2.0']),
+        ('~> 1.4', ['1.10.0', '1.4.1']),
+        ('~> 1.4.0', ['1.4.1']),
+        ('~> 1', ['1.10.0', '1.4.1', '1.2.0']),
+        ('= 1.2', ['1.2.0']),
+        ('!= 1.2, < 2', ['1.10.0', '1.4.1']),
+        ('> 2.0.0', []),
+        ('<= 1', []),
+        ('>= 1.2 < 2', BoxVersionException),
+        ('~> a', BoxVersionException),
+    )
+)
+def test_box_version_constraint(constraint_str, expected):
+    version_list = [parse_version(version_str) for version_str in ('2.0.0', '1.10.0', '1.4.1', '1.2.0')]
+
+    if expected is BoxVersionException:
+        with pytest.raises(BoxVersionException):
+            VersionConstraint(constraint_str)
+
+    else:
+        version_constraint = VersionConstraint(constraint_str)
+        assert [str(version_val) for version_val in version_list if version_constraint.match(version_val)] == expected
+        assert version_constraint.select(version_list) == (parse_version(expected[0]) if expected else None)
+
+
+def test_box_metadata_provider_version():
+    metadata = make_retention_metadata()
+    for version_str in ('5.0.0', '4.0.0', '2.0.0'):
+        metadata.add_version(version_str, 'virtualbox', 'url{}'.format(version_str))
+
+    assert metadata.get_provider_version('virtualbox')[0] == '5.0.0'
+    assert metadata.get_provider_version('virtualbox', '4')[0] == '4.0.0'
+    assert metadata.get_provider_version('virtualbox', '< 5')[0] == '2.0.0'
+    assert metadata.get_provider_version('virtualbox', '~> 3.0') is None
+    assert metadata.get_provider_version('aws') is None
+
+
+def test_box_metadata_version_cached():
+    assert parse_version('1.2.3') is parse_version('1.2.3')
+    assert parse_version(1) == Version('1.0.0')
+
+    with pytest.raises(BoxVersionException):
+        parse_version(True)
+
+
 @pytest.fixture(
     params = (
         (
@@ -515,3 +701,559 @@ def test_box_inventory_add(mock_box_add, name, provider, version, expected):
     else:
         with pytest.raises(BoxInventoryException):
             inventory.install(name, provider, version)
+
+
+def test_box_inventory_add_concurrent():
+    started_lookup = {'virtualbox': threading.Event(), 'aws': threading.Event()}
+
+    def run_command_side_effect(command, *args, **kwargs):
+        if command.startswith('vagrant box add'):
+            provider = command.split(' ')[4]
+            started_lookup[provider].set()
+
+            # each install waits for the other provider to start
+            other_provider = 'aws' if provider == 'virtualbox' else 'virtualbox'
+            assert started_lookup[other_provider].wait(5)
+
+        return []
+
+    inventory = BoxInventory()
+    with patch('packermate.vagrant.run_command', side_effect = run_command_side_effect):
+        inventory.list
+
+        error_list = []
+
+        def install(provider):
+            try:
+                inventory.install('vagrant-box', provider, '1.0.0')
+
+            except Exception as e:
+                error_list.append(e)
+
+        thread_list = [threading.Thread(target = install, args = (provider,)) for provider in ('virtualbox', 'aws')]
+        for thread in thread_list:
+            thread.start()
+
+        for thread in thread_list:
+            thread.join()
+
+    assert error_list == []
+    assert inventory.list == {
+        'vagrant-box': {
+            'virtualbox': [Version('1.0.0')],
+            'aws': [Version('1.0.0')],
+        }
+    }
+
+
+def make_boxes_dir(boxes_dir, box_list):
+    for box_name, provider_name, version_str, arch_name in box_list:
+        provider_path_list = [boxes_dir, box_name.replace('/', '-VAGRANTSLASH-'), version_str]
+        if arch_name:
+            provider_path_list.append(arch_name)
+
+        provider_path_list.append(provider_name)
+        provider_path = os.path.join(*provider_path_list)
+        os.makedirs(provider_path)
+
+        with open(os.path.join(provider_path, 'metadata.json'), 'w') as file_object:
+            json.dump({'provider': provider_name}, file_object)
+
+    return boxes_dir
+
+
+def test_box_inventory_boxes_dir(temp_dir):
+    boxes_dir = make_boxes_dir(
+        os.path.join(temp_dir, 'boxes'),
+        (
+            ('vagrant-box', 'aws', '0', None),
+            ('vagrant-box', 'virtualbox', '1.2', None),
+            ('vagrant-box', 'virtualbox', '1.10', None),
+            ('org/another-box', 'virtualbox', '2.0.0', 'amd64'),
+            ('bad-version', 'virtualbox', 'abc', None),
+        )
+    )
+    os.makedirs(os.path.join(boxes_dir, 'empty-box', '1.0.0', 'virtualbox'))
+    with open(os.path.join(boxes_dir, 'vagrant-box', 'metadata_url'), 'w') as file_object:
+        file_object.write('http://example.com/vagrant-box.json')
+
+    with patch('packermate.vagrant.run_command') as mock_run_command:
+        inventory = BoxInventory(boxes_dir = boxes_dir)
+
+        assert inventory.list == {
+            'vagrant-box': {
+                'aws': [Version('0.0.0')],
+                'virtualbox': [Version('1.10.0'), Version('1.2.0')],
+            },
+            'org/another-box': {
+                'virtualbox': [Version('2.0.0')],
+            },
+        }
+        assert inventory.installed('vagrant-box', 'virtualbox') == Version('1.10.0')
+        assert inventory.installed('org/another-box', 'virtualbox', '2') == Version('2.0.0')
+
+        mock_run_command.assert_not_called()
+
+
+def test_box_inventory_box_path(temp_dir):
+    boxes_dir = make_boxes_dir(
+        os.path.join(temp_dir, 'boxes'),
+        (
+            ('vagrant-box', 'virtualbox', '1.2', None),
+            ('vagrant-box', 'virtualbox', '1.10', None),
+            ('org/another-box', 'virtualbox', '2.0.0', 'amd64'),
+        )
+    )
+    inventory = BoxInventory(boxes_dir = boxes_dir)
+
+    assert inventory.get_box_path('vagrant-box', 'virtualbox') == os.path.join(boxes_dir, 'vagrant-box', '1.10', 'virtualbox')
+    assert inventory.get_box_path('vagrant-box', 'virtualbox', '1.2.0') == os.path.join(boxes_dir, 'vagrant-box', '1.2', 'virtualbox')
+    assert inventory.get_box_path('org/another-box', 'virtualbox') == os.path.join(
+        boxes_dir,
+        'org-VAGRANTSLASH-another-box',
+        '2.0.0',
+        'amd64',
+        'virtualbox'
+    )
+    assert inventory.get_box_path('vagrant-box', 'virtualbox', '1.3') is None
+    assert inventory.get_box_path('vagrant-box', 'aws') is None
+
+
+def test_box_inventory_constraint(temp_dir):
+    boxes_dir = make_boxes_dir(
+        os.path.join(temp_dir, 'boxes'),
+        (
+            ('vagrant-box', 'virtualbox', '1.2', None),
+            ('vagrant-box', 'virtualbox', '1.10', None),
+            ('vagrant-box', 'virtualbox', '2.0', None),
+        )
+    )
+    inventory = BoxInventory(boxes_dir = boxes_dir)
+
+    assert inventory.installed('vagrant-box', 'virtualbox', '>= 1.2, < 2.0') == Version('1.10.0')
+    assert inventory.installed('vagrant-box', 'virtualbox', '~> 1.2.0') == Version('1.2.0')
+    assert inventory.installed('vagrant-box', 'virtualbox', '> 2') is None
+
+    config = Config(config_string = 'vagrant_box_name: vagrant-box\nvagrant_box_version: "~> 1.0"')
+    assert inventory.get_version_from_config(config, 'virtualbox') == Version('1.10.0')
+
+    # a satisfying installed version is used rather than installing another
+    with patch('packermate.vagrant.run_command') as mock_run_command:
+        inventory.install_from_config(config, 'virtualbox')
+
+        mock_run_command.assert_not_called()
+
+
+def test_box_inventory_constraint_command(temp_dir):
+    boxes_dir = make_boxes_dir(
+        os.path.join(temp_dir, 'boxes'),
+        (
+            ('vagrant-box', 'virtualbox', '1.2', None),
+        )
+    )
+    inventory = BoxInventory(boxes_dir = boxes_dir)
+
+    with patch('packermate.vagrant.run_command') as mock_run_command:
+        inventory.install('vagrant-box', 'virtualbox', '>= 2.0, < 3.0')
+        inventory.uninstall('vagrant-box', 'virtualbox', '>= 1.0, < 2.0')
+
+    command_list = [call_args[0][0] for call_args in mock_run_command.call_args_list]
+    assert command_list == [
+        "vagrant box add --provider virtualbox vagrant-box --box-version '>= 2.0, < 3.0'",
+        "vagrant box remove --force --provider virtualbox vagrant-box --box-version '>= 1.0, < 2.0'",
+    ]
+    assert [shlex.split(command)[-2:] for command in command_list] == [
+        ['--box-version', '>= 2.0, < 3.0'],
+        ['--box-version', '>= 1.0, < 2.0'],
+    ]
+
+
+def test_box_inventory_gc(temp_dir):
+    box_list = (
+        ('vagrant-box', 'virtualbox', '1.0.0'),
+        ('vagrant-box', 'virtualbox', '1.1.0'),
+        ('vagrant-box', 'virtualbox', '1.2.0'),
+        ('another-box', 'aws', '1.0.0'),
+    )
+    boxes_dir = make_boxes_dir(os.path.join(temp_dir, 'boxes'), [box_info + (None,) for box_info in box_list])
+    for box_index, (box_name, provider_name, version_str) in enumerate(box_list):
+        provider_path = os.path.join(boxes_dir, box_name, version_str, provider_name)
+        with open(os.path.join(provider_path, 'box.img'), 'wb') as file_object:
+            file_object.write(b'0' * 1000)
+
+        os.utime(provider_path, (box_index, box_index))
+
+    state_file = os.path.join(temp_dir, 'inventory.json')
+
+    def run_command_side_effect(command, *args, **kwargs):
+        command_split = command.split(' ')
+        rmtree(os.path.join(boxes_dir, command_split[6], command_split[-1]))
+
+    inventory = BoxInventory(boxes_dir = boxes_dir, state_file = state_file)
+    inventory.mark_used('vagrant-box', 'virtualbox', '1.0.0')
+
+    # the last used time survives the inventory being rebuilt
+    inventory = BoxInventory(boxes_dir = boxes_dir, state_file = state_file)
+    with patch('packermate.vagrant.run_command', Mock(side_effect = run_command_side_effect)):
+        removed_list = inventory.gc(2500, [('vagrant-box', '~> 1.1.0')])
+
+    assert removed_list == [('vagrant-box', 'virtualbox', Version('1.2.0')), ('another-box', 'aws', Version('1.0.0'))]
+    assert inventory.list == {'vagrant-box': {'virtualbox': [Version('1.1.0'), Version('1.0.0')]}}
+
+    with patch('packermate.vagrant.run_command') as mock_run_command:
+        assert inventory.gc(0, [('vagrant-box', None), ('vagrant-box', '1.0.0')]) == []
+
+        mock_run_command.assert_not_called()
+
+
+def test_box_inventory_boxes_dir_missing(mock_box_list, temp_dir):
+    inventory = BoxInventory(boxes_dir = os.path.join(temp_dir, 'missing'))
+    if mock_box_list is not None:
+        assert inventory.list == mock_box_list
+
+    else:
+        with pytest.raises(BoxInventoryException):
+            inventory.list
+
+
+def test_box_inventory_state(temp_dir):
+    boxes_dir = make_boxes_dir(
+        os.path.join(temp_dir, 'boxes'),
+        (
+            ('vagrant-box', 'virtualbox', '1.0.0', None),
+        )
+    )
+    state_file = os.path.join(temp_dir, 'cache', 'inventory.json')
+    expected = {'vagrant-box': {'virtualbox': [Version('1.0.0')]}}
+
+    assert BoxInventory(boxes_dir = boxes_dir, state_file = state_file).list == expected
+    assert os.path.exists(state_file)
+
+    # a valid snapshot avoids reading the boxes directory
+    with patch.object(BoxInventory, '_read_boxes_dir') as mock_read:
+        assert BoxInventory(boxes_dir = boxes_dir, state_file = state_file).list == expected
+        mock_read.assert_not_called()
+
+    # a new version invalidates the snapshot
+    make_boxes_dir(boxes_dir, (('vagrant-box', 'virtualbox', '1.1.0', None),))
+    inventory = BoxInventory(boxes_dir = boxes_dir, state_file = state_file)
+    assert inventory.installed('vagrant-box', 'virtualbox') == Version('1.1.0')
+
+    # a new provider for a version only changes the version directory, which is checked when the box is used
+    os.utime(os.path.join(boxes_dir, 'vagrant-box', '1.1.0'), (1, 1))
+    BoxInventory(boxes_dir = boxes_dir, state_file = state_file).installed('vagrant-box', 'virtualbox')
+    make_boxes_dir(boxes_dir, (('vagrant-box', 'aws', '1.1.0', None),))
+    with patch.object(BoxInventory, '_read_boxes_dir') as mock_read:
+        inventory = BoxInventory(boxes_dir = boxes_dir, state_file = state_file)
+        assert inventory.installed('vagrant-box', 'aws') == Version('1.1.0')
+        mock_read.assert_not_called()
+
+
+def test_box_inventory_incremental(temp_dir):
+    boxes_dir = make_boxes_dir(
+        os.path.join(temp_dir, 'boxes'),
+        (
+            ('vagrant-box', 'virtualbox', '1.0.0', None),
+            ('another-box', 'virtualbox', '1.0.0', None),
+        )
+    )
+    state_file = os.path.join(temp_dir, 'inventory.json')
+
+    def run_command_side_effect(command, *args, **kwargs):
+        command_split = command.split(' ')
+        if command.startswith('vagrant box add'):
+            version_str = command_split[-1] if '--box-version' in command_split else '2.0.0'
+            make_boxes_dir(boxes_dir, ((command_split[5], command_split[4], version_str, None),))
+
+        elif command.startswith('vagrant box remove'):
+            rmtree(os.path.join(boxes_dir, command_split[6], command_split[-1]))
+
+        else:
+            raise ValueError(command)
+
+    inventory = BoxInventory(boxes_dir = boxes_dir, state_file = state_file)
+    inventory.list
+
+    with patch('packermate.vagrant.run_command', Mock(side_effect = run_command_side_effect)):
+        with patch.object(BoxInventory, '_read_boxes_dir') as mock_read:
+            inventory.install('vagrant-box', 'virtualbox', '1.1.0')
+            inventory.install('new-box', 'virtualbox')
+            inventory.uninstall('vagrant-box', 'virtualbox', '1.0.0')
+
+            mock_read.assert_not_called()
+
+    expected = {
+        'vagrant-box': {'virtualbox': [Version('1.1.0')]},
+        'new-box': {'virtualbox': [Version('2.0.0')]},
+        'another-box': {'virtualbox': [Version('1.0.0')]},
+    }
+    assert inventory.list == expected
+
+    # the persisted snapshot matches the boxes directory after the changes
+    with patch.object(BoxInventory, '_read_boxes_dir') as mock_read:
+        assert BoxInventory(boxes_dir = boxes_dir, state_file = state_file).list == expected
+        mock_read.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    'config_str, environ, expected',
+    (
+        ('vagrant_boxes_dir: /tmp/boxes', {}, '/tmp/boxes'),
+        ('vagrant_home: /tmp/vagrant', {'VAGRANT_HOME': '/tmp/env'}, '/tmp/vagrant/boxes'),
+        ('key: val', {'VAGRANT_HOME': '/tmp/env'}, '/tmp/env/boxes'),
+        ('key: val', {}, os.path.expanduser('~/.vagrant.d/boxes')),
+    )
+)
+def test_box_inventory_boxes_dir_config(monkeypatch, config_str, environ, expected):
+    monkeypatch.delenv('VAGRANT_HOME', raising = False)
+    for env_name, env_value in environ.iteritems():
+        monkeypatch.setenv(env_name, env_value)
+
+    assert get_vagrant_boxes_dir(Config(config_string = config_str)) == expected
+
+
+@pytest.mark.parametrize(
+    'config_str, expected',
+    (
+        ('key: val', False),
+        ('flag: true', True),
+        ('flag: false', False),
+        ('flag: "false"', False),
+        ('flag: "Yes"', True),
+        ('flag: "0"', False),
+    )
+)
+def test_bool_parameter(config_str, expected):
+    assert get_bool_parameter(Config(config_string = config_str), 'flag') is expected
+
+
+def test_bool_parameter_invalid():
+    with pytest.raises(PublishException):
+        get_bool_parameter(Config(config_string = 'flag: maybe'), 'flag')
+
+
+@pytest.fixture()
+def publish_config(temp_dir):
+    output_path = os.path.join(temp_dir, 'output')
+    os.mkdir(output_path)
+
+    for provider_name in ('virtualbox', 'aws'):
+        with open(os.path.join(output_path, 'test_{}.box'.format(provider_name)), 'wb') as file_object:
+            file_object.write(provider_name)
+
+    config_str = """---
+vm_name: test
+vm_version: 1.2.3
+vagrant_output: {}/test_{{{{.Provider}}}}.box
+""".format(output_path)
+
+    return Config(config_string = config_str), output_path
+
+
+def test_publish_path(publish_config, temp_dir):
+    config, output_path = publish_config
+    publish_path = os.path.join(temp_dir, 'publish')
+    os.mkdir(publish_path)
+    config.vagrant_publish_path = publish_path
+    config.vagrant_publish_checksum_type = 'sha256'
+
+    with patch('packermate.checksum.MultiDigest', wraps = MultiDigest) as mock_digest:
+        publish_vagrant_box(config, ('virtualbox', 'aws'), BoxInventory())
+
+    # digests are only calculated for the box files and nothing but the published files is written
+    assert sorted([call_args[0][0] for call_args in mock_digest.call_args_list]) == [
+        [],
+        ['md5', 'sha256'],
+        ['md5', 'sha256'],
+    ]
+    assert sorted(os.listdir(publish_path)) == ['test.json', 'test.json.lock', 'test_aws.box', 'test_virtualbox.box']
+
+    metadata = BoxMetadata('file://{}'.format(os.path.join(publish_path, 'test.json')))
+    version_info = metadata.versions[0]
+    assert str(version_info['version']) == '1.2.3'
+
+    provider_lookup = dict([(provider_info['name'], provider_info) for provider_info in version_info['providers']])
+    assert sorted(provider_lookup.keys()) == ['aws', 'virtualbox']
+    for provider_name, provider_info in provider_lookup.iteritems():
+        publish_file_name = os.path.join(publish_path, 'test_{}.box'.format(provider_name))
+        assert provider_info['url'] == 'file://{}'.format(publish_file_name)
+        assert provider_info['checksum_type'] == 'sha256'
+        with open(publish_file_name, 'rb') as file_object:
+            assert file_object.read() == provider_name
+
+
+@pytest.mark.parametrize(
+    'param, value',
+    (
+        ('vagrant_publish_path', '/path/does/not/exist'),
+        ('vagrant_publish_checksum_type', 'crc32'),
+        ('vagrant_publish_keep_versions', '0'),
+        ('vagrant_publish_keep_versions', '-1'),
+    )
+)
+def test_publish_error(publish_config, param, value):
+    config, output_path = publish_config
+    setattr(config, param, value)
+
+    with pytest.raises(PublishException):
+        publish_vagrant_box(config, ('virtualbox',), BoxInventory())
+
+    # nothing is published when a parameter is invalid
+    assert not os.path.exists(os.path.join(output_path, 'test.json'))
+
+
+def test_publish_retention(publish_config, temp_dir):
+    config, output_path = publish_config
+    publish_path = os.path.join(temp_dir, 'publish')
+    os.mkdir(publish_path)
+    config.vagrant_output = os.path.join(output_path, 'test_{{.Provider}}_((vm_version)).box')
+    config.vagrant_publish_path = publish_path
+    config.vagrant_publish_keep_versions = '2'
+    config.vagrant_publish_retention_action = 'drop'
+    config.vagrant_publish_retention_delete_files = 'true'
+    config.vagrant_publish_retention_uninstall = True
+
+    box_inventory = Mock()
+    for version_str in ('1.0.0', '1.1.0', '1.2.0'):
+        config.vm_version = version_str
+        with open(os.path.join(output_path, 'test_virtualbox_{}.box'.format(version_str)), 'wb') as file_object:
+            file_object.write(version_str)
+
+        publish_vagrant_box(config, ('virtualbox',), box_inventory)
+
+    metadata = BoxMetadata('file://{}'.format(os.path.join(publish_path, 'test.json')))
+    assert [str(version_info['version']) for version_info in metadata.versions] == ['1.2.0', '1.1.0']
+    assert sorted([file_name for file_name in os.listdir(publish_path) if file_name.endswith('.box')]) == [
+        'test_virtualbox_1.1.0.box',
+        'test_virtualbox_1.2.0.box',
+    ]
+    box_inventory.uninstall.assert_called_once_with('test', 'virtualbox', '1.0.0')
+
+
+def test_publish_concurrent(publish_config):
+    config, output_path = publish_config
+    config.vagrant_publish_copy_command = 'copy (( FILE_PATH ))'
+    config.vagrant_uninstall_outdated_box = True
+
+    box_inventory = Mock()
+    with patch('packermate.vagrant.run_command') as mock_run_command:
+        publish_vagrant_box(config, ('virtualbox', 'aws'), box_inventory)
+
+    command_list = sorted([call_args[0][0] for call_args in mock_run_command.call_args_list])
+    assert command_list == [
+        'copy {}'.format(os.path.join(output_path, file_name))
+        for file_name in ('test.json', 'test_aws.box', 'test_virtualbox.box')
+    ]
+    assert config.FILE_PATH is None
+    assert sorted([call_args[0] for call_args in box_inventory.uninstall.call_args_list]) == [
+        ('test', 'aws', '1.2.3'),
+        ('test', 'virtualbox', '1.2.3'),
+    ]
+
+    metadata = BoxMetadata('file://{}'.format(os.path.join(output_path, 'test.json')))
+    assert sorted([provider_info['name'] for provider_info in metadata.versions[0]['providers']]) == ['aws', 'virtualbox']
+
+
+def test_publish_concurrent_error(publish_config):
+    config, output_path = publish_config
+    config.vagrant_publish_copy_command = 'copy (( FILE_PROVIDER ))'
+
+    def run_command(command, *args, **kwargs):
+        if command == 'copy aws':
+            raise ProcessException('copy failed')
+
+    with patch('packermate.vagrant.run_command', side_effect = run_command):
+        with pytest.raises(ProcessException):
+            publish_vagrant_box(config, ('virtualbox', 'aws'), BoxInventory())
+
+    # the metadata is only written once every box is published
+    assert not os.path.exists(os.path.join(output_path, 'test.json'))
+
+
+def test_publish_providers_separately(publish_config, temp_dir):
+    config, output_path = publish_config
+    publish_path = os.path.join(temp_dir, 'publish')
+    os.mkdir(publish_path)
+
+    get_metadata = get_or_create_vagrant_box_metadata
+    read_count = [0]
+
+    def get_metadata_slow(*args, **kwargs):
+        # widen the window between the read and write of the metadata
+        box_metadata = get_metadata(*args, **kwargs)
+        read_count[0] += 1
+        time.sleep(0.2)
+
+        return box_metadata
+
+    def publish_provider(provider_name):
+        provider_config = Config(config_string = """---
+vm_name: test
+vm_version: 1.2.3
+vagrant_output: {}/{}/test_{{{{.Provider}}}}.box
+vagrant_publish_path: {}
+""".format(output_path, provider_name, publish_path))
+        provider_output_path = os.path.join(output_path, provider_name)
+        os.mkdir(provider_output_path)
+        os.rename(
+            os.path.join(output_path, 'test_{}.box'.format(provider_name)),
+            os.path.join(provider_output_path, 'test_{}.box'.format(provider_name)),
+        )
+
+        publish_vagrant_box(provider_config, (provider_name,), BoxInventory())
+
+    with patch('packermate.vagrant.get_or_create_vagrant_box_metadata', side_effect = get_metadata_slow):
+        thread_list = [threading.Thread(target = publish_provider, args = (provider_name,)) for provider_name in ('virtualbox', 'aws')]
+        for publish_thread in thread_list:
+            publish_thread.start()
+
+        for publish_thread in thread_list:
+            publish_thread.join(10)
+
+    assert read_count[0] == 2
+    metadata = BoxMetadata('file://{}'.format(os.path.join(publish_path, 'test.json')))
+    assert len(metadata.versions) == 1
+    assert sorted([provider_info['name'] for provider_info in metadata.versions[0]['providers']]) == ['aws', 'virtualbox']
+
+
+def test_publish_path_metadata_first(publish_config, temp_dir):
+    config, output_path = publish_config
+
+    # the URL prefix serves a stale copy of the metadata in the publish path
+    publish_path = os.path.join(temp_dir, 'publish')
+    stale_path = os.path.join(temp_dir, 'stale')
+    for path, version_list in ((publish_path, ('1.0.0', '1.1.0')), (stale_path, ('1.0.0',))):
+        os.mkdir(path)
+        box_metadata = BoxMetadata(name = 'test')
+        for version in version_list:
+            box_metadata.add_version(version, 'virtualbox', 'file:///test_virtualbox.box')
+
+        box_metadata.write(os.path.join(path, 'test.json'))
+
+    config.vagrant_publish_path = publish_path
+    config.vagrant_publish_url_prefix = 'file://{}/'.format(stale_path)
+
+    publish_vagrant_box(config, ('virtualbox',), BoxInventory())
+
+    metadata = BoxMetadata('file://{}'.format(os.path.join(publish_path, 'test.json')))
+    assert [str(version_info['version']) for version_info in metadata.versions] == ['1.2.3', '1.1.0', '1.0.0']
+
+
+def test_check_vagrant_publish(temp_dir):
+    config = Config(config_string = """---
+vm_name: test
+vm_version: 1.0.0
+vagrant_output: {0}/test_{{{{.Provider}}}}.box
+vagrant_publish_path: {0}/publish
+""".format(temp_dir))
+
+    with pytest.raises(PublishException):
+        check_vagrant_publish(config, ('virtualbox',))
+
+    os.mkdir(os.path.join(temp_dir, 'publish'))
+    check_vagrant_publish(config, ('virtualbox',))
+
+    # the box files are only checked when publishing
+    config.vagrant_output = '{}/test.box'.format(temp_dir)
+    with pytest.raises(PublishException):
+        check_vagrant_publish(config, ('virtualbox',))